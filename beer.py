@@ -1,6 +1,13 @@
+import math
+
 import streamlit as st
-import pandas as pd
-import altair as alt
+
+from market import cache, incremental, ingest, views
+from market.brands import BrandIndex
+from market.channels import ChannelIndex
+from market.engine import open_engine
+from market.search import ReviewSearch
+from market.sketches import Sketches
 
 # 1. Page Configuration & Setup
 st.set_page_config(
@@ -57,159 +64,77 @@ st.markdown("""
     </style>
 """, unsafe_allow_html=True)
 
-# 3. Data Loading (
-@st.cache_data
-def load_data():
-    data = [
-        {
-            "country": "Botswana", "region": "Southern Africa", 
-            "population_millions": 2.6, "pct_adults_15plus": 58, "pct_drinkers": 45,
-            "liters_per_capita": 150.0, "production_m_hl": 0.55, "avg_price_usd": 1.80,
-            "top_brands": "St Louis Lager, Heineken, Carling Black Label, Windhoek Lager", 
-            "review_snapshot": "Crisp lagers for hot climate",
-            "digital_channels": "Liquorama App, Sefalana Online Store, Yourmart"
-        },
-        {
-            "country": "Namibia", "region": "Southern Africa", 
-            "population_millions": 2.6, "pct_adults_15plus": 59, "pct_drinkers": 42,
-            "liters_per_capita": 90.8, "production_m_hl": 3.0, "avg_price_usd": 1.60,
-            "top_brands": "Windhoek, Tafel, Hansa Pilsner", 
-            "review_snapshot": "Purity Law (Reinheitsgebot) preference",
-            "digital_channels": "Namibia Breweries (NBL) Online Store, Dial-A-Drink (DAM Namibia)"
-        },
-        {
-            "country": "Gabon", "region": "Central Africa", 
-            "population_millions": 2.4, "pct_adults_15plus": 57, "pct_drinkers": 48,
-            "liters_per_capita": 78.3, "production_m_hl": 3.00, "avg_price_usd": 1.30,
-            "top_brands": "Regab, Castel", 
-            "review_snapshot": "Regab is the 'national bread'",
-            "digital_channels": "Glovo Libreville"
-        },
-        {
-            "country": "Seychelles", "region": "East Africa", 
-            "population_millions": 0.1, "pct_adults_15plus": 72, "pct_drinkers": 65,
-            "liters_per_capita": 77.0, "production_m_hl": 0.12, "avg_price_usd": 4.50,
-            "top_brands": "SeyBrew, Eku, Heineken", 
-            "review_snapshot": "Fresh, tourism-driven taste",
-            "digital_channels": "Seybrew.com"
-        },
-        {
-            "country": "South Africa", "region": "Southern Africa", 
-            "population_millions": 60.6, "pct_adults_15plus": 65, "pct_drinkers": 43,
-            "liters_per_capita": 69.0, "production_m_hl": 35.10, "avg_price_usd": 1.50,
-            "top_brands": "Carling, Castle, Heineken", 
-            "review_snapshot": "Sophisticated, and diverse palate divided on traditional and premium beer",
-            "digital_channels": "Checkers Sixty60, Uber Eats,Takealot.com"
-        },
-        {
-            "country": "Angola", "region": "Southern Africa", 
-            "population_millions": 36.7, "pct_adults_15plus": 54, "pct_drinkers": 38,
-            "liters_per_capita": 33.4, "production_m_hl": 12.00, "avg_price_usd": 0.85,
-            "top_brands": "Cuca, Nocal, Tigra", 
-            "review_snapshot": "Must be served freezing cold",
-            "digital_channels": "Tupuca, Socios, Candando online"
-        },
-        {
-            "country": "Cameroon", "region": "Central Africa", 
-            "population_millions": 28.6, "pct_adults_15plus": 56, "pct_drinkers": 35,
-            "liters_per_capita": 25.0, "production_m_hl": 9.10, "avg_price_usd": 1.25,
-            "top_brands": "Castel, Guinness, Beaufort", 
-            "review_snapshot": "Loyal to local heritage brands, with a strong preference for large-format glass bottles (65cl).",
-            "digital_channels": "Glovo cameroon, DOVV Online"
-        },
-        {
-            "country": "Zimbabwe", "region": "Southern Africa", 
-            "population_millions": 16.7, "pct_adults_15plus": 57, "pct_drinkers": 40,
-            "liters_per_capita": 22.0, "production_m_hl": 6.50, "avg_price_usd": 1.80,
-            "top_brands": "Zambezi,Carling black label, Castle lager, Chibuku", 
-            "review_snapshot": "Split: Clear Lager vs Sorghum beer",
-            "digital_channels": "SPAR Zimbabwe, TM Pick n Pay Online"
-        },
-        {
-            "country": "Mozambique", "region": "Southern Africa", 
-            "population_millions": 33.9, "pct_adults_15plus": 53, "pct_drinkers": 32,
-            "liters_per_capita": 11.9, "production_m_hl": 4.10, "avg_price_usd": 1.12,
-            "top_brands": "2M, Laurentina Preta, Heineken", 
-            "review_snapshot": "Dark lagers are highly rated",
-            "digital_channels": "Ubuy Mozambique"
-        },
-        {
-            "country": "Tanzania", "region": "East Africa", 
-            "population_millions": 67.4, "pct_adults_15plus": 53, "pct_drinkers": 28,
-            "liters_per_capita": 8.0, "production_m_hl": 4.69, "avg_price_usd": 1.30,
-            "top_brands": "Kilimanjaro, Serengeti, Safari", 
-            "review_snapshot": "Strong national identity brands",
-            "digital_channels": "Distro"
-        },
-        {
-            "country": "Uganda", "region": "East Africa", 
-            "population_millions": 48.6, "pct_adults_15plus": 50, "pct_drinkers": 35,
-            "liters_per_capita": 7.3, "production_m_hl": 4.20, "avg_price_usd": 1.20,
-            "top_brands": "Nile Special, Club Pilsner, Tusker", 
-            "review_snapshot": "Nile Special is cult-status",
-            "digital_channels": "Jumia Food, Kikuubo Online, Glovo"
-        },
-        {
-            "country": "Kenya", "region": "East Africa", 
-            "population_millions": 55.1, "pct_adults_15plus": 56, "pct_drinkers": 30,
-            "liters_per_capita": 8.0, "production_m_hl": 4.50, "avg_price_usd": 2.30,
-            "top_brands": "Tusker, White Cap, Guinnes", 
-            "review_snapshot": "Tusker is a national symbol; while craft beer is an upcoming favorite for young consumers",
-            "digital_channels": "EABL'S The Bar, Drinks Vine, Dial A Drink Kenya"
-        },
-        {
-            "country": "Ghana", "region": "West Africa", 
-            "population_millions": 34.1, "pct_adults_15plus": 57, "pct_drinkers": 32,
-            "liters_per_capita": 10.0, "production_m_hl": 3.00, "avg_price_usd": 1.40,
-            "top_brands": "Club Premium, Star, Tale beer", 
-            "review_snapshot": "Crisp finish taste preferred",
-            "digital_channels": "Liquour Junction, Tales from Ghana"
-        },
-        {
-            "country": "Nigeria", "region": "West Africa", 
-            "population_millions": 223.8, "pct_adults_15plus": 54, "pct_drinkers": 25,
-            "liters_per_capita": 8.3, "production_m_hl": 17.73, "avg_price_usd": 1.15,
-            "top_brands": "Star, Goldberg, Guinness, Hero Lager", 
-            "review_snapshot": "The market is stil largely loyal to Guinness",
-            "digital_channels": "Drinks.ng, Glovo"
-        },
-        {
-            "country": "Ethiopia", "region": "East Africa", 
-            "population_millions": 126.5, "pct_adults_15plus": 55, "pct_drinkers": 30,
-            "liters_per_capita": 12.2, "production_m_hl": 12.67, "avg_price_usd": 0.95,
-            "top_brands": "St. George, Habesha", 
-            "review_snapshot": "Sentiment is rooted in heritage and gradual premiumization",
-            "digital_channels": "Habesha App"
-        }
-    ]
-    df = pd.DataFrame(data)
-    
-    #Drinking population estimates based on WHO data and cultural/religious factors
-    # Calculated as: Total population × % adults who are 15+ × % who consume alcohol 
-    # Presented as drinking population (in millions)
-    # Drinking population = Total population × (% adults 15+/100) × (% drinkers/100)
-    df['drinking_population_millions'] = (
-        df['population_millions'] * 
-        (df['pct_adults_15plus'] / 100) * 
-        (df['pct_drinkers'] / 100)
-    )
-    
-    # Calculate total volume consumed per country (in million liters)
-    # Total volume = Per capita consumption × Drinking population
-    df['total_volume_consumed_ml'] = (
-        df['liters_per_capita'] * df['drinking_population_millions']
-    )
-    
-    return df
-
-df = load_data()
+# 3. Data Loading
+# The market panel lives in a memory-mapped Arrow store partitioned by year and
+# region (see market/ingest.py); only the selected year's partitions are read.
+# A query engine (market/engine.py, picked with BEER_ENGINE) answers every
+# filter, KPI and regional question: the default pandas engine keeps each
+# loaded year in memory with its filter indexes, the duckdb and polars
+# engines run optimized queries over the store. cache_resource shares one engine across sessions instead of
+# handing every rerun its own copy, so worker memory stays flat as data grows.
+# Keyed on the data version, so a store refresh is picked up on the next run;
+# max_entries=1 drops the previous version's engine (its frame, indexes and
+# aggregates) instead of keeping one per refresh for the life of the server.
+# Frames use the compact layout (categorical labels, Arrow strings, float32);
+# `python -m market.memory` reports its bytes per column for sizing workers.
+@st.cache_resource(max_entries=1)
+def load_engine(version):
+    return open_engine()
+
+# The indexes below are rebuilt by ingest, so they are keyed on the data version
+# too, keeping only the current version's
+
+# Brand dimension + market × brand bridge (see market/brands.py)
+@st.cache_resource(max_entries=1)
+def load_brand_index(version):
+    return BrandIndex.load()
+
+# Inverted index from normalised retail channel to markets (see market/channels.py)
+@st.cache_resource(max_entries=1)
+def load_channel_index(version):
+    return ChannelIndex.load()
+
+# BM25 index over review snippets, built at ingest (see market/search.py)
+@st.cache_resource(max_entries=1)
+def load_review_search(version):
+    return ReviewSearch.load()
+
+# Per-partition HyperLogLogs and price histograms, built at ingest (see market/sketches.py)
+@st.cache_resource(max_entries=1)
+def load_sketches(version):
+    return Sketches.load()
+
+# Filtered rows, KPIs and regional summary per filter state, shared by every
+# session (see market/cache.py); keys carry the data version and year
+@st.cache_resource
+def load_result_cache():
+    return cache.ResultCache()
+
+data_version = ingest.data_version()
+query_engine = load_engine(data_version)
+brand_index = load_brand_index(data_version)
+channel_index = load_channel_index(data_version)
+review_search = load_review_search(data_version)
+sketch_set = load_sketches(data_version)
 
 # 4. Sidebar Filters
 with st.sidebar:
     st.header("🔍 Market Filters")
-    
+
+    # Year Filter (each year is its own set of partitions in the store)
+    years = query_engine.years()
+    selected_year = st.selectbox(
+        "Year:",
+        options=years[::-1],
+        index=0,
+        help="Snapshot year to analyse. Only that year's data is loaded."
+    )
+
+bounds = query_engine.bounds(selected_year)
+
+with st.sidebar:
     # Region Filter
-    all_regions = sorted(df['region'].unique())
+    all_regions = bounds["regions"]
     selected_regions = st.multiselect(
         "Select Regions:",
         options=all_regions,
@@ -217,73 +142,122 @@ with st.sidebar:
         help="Filter the dashboard by African sub-regions."
     )
     
+    # Brand Filter (answered from the brand index, not by scanning top_brands)
+    selected_brands = st.multiselect(
+        "Top-5 Brands:",
+        options=sorted(brand_index.listed_brands()),
+        default=[],
+        help="Show only markets where any of the selected brands ranks in the top 5. Leave empty for all markets."
+    )
+
     st.divider()
 
     # Production Filter Slider
-    min_production = float(df['production_m_hl'].min())
-    max_production = float(df['production_m_hl'].max())
+    # Slider minimums sit on the step grid, so every position is an edge of
+    # the aggregate cube's buckets (market/cube.py)
+    min_production, max_production = bounds["production"]
+    production_step = 0.1
+    min_production = views.grid_floor(min_production, production_step)
     production_range = st.slider(
         "Max Production Volume (Million hl):",
         min_value=min_production,
         max_value=max_production,
         value=max_production,
-        step=0.1,
+        step=production_step,
         format="%.2f M hl",
         help="Filter markets by their total beer production volume in million hectoliters."
     )
     st.divider()
     
     # Price Filter
-    min_price = float(df['avg_price_usd'].min())
-    max_price = float(df['avg_price_usd'].max())
+    min_price, max_price = bounds["price"]
     
+    price_step = 0.10
+    min_price = views.grid_floor(min_price, price_step)
     price_range = st.slider(
         "Max Price per Beer ($):",
         min_value=min_price,
         max_value=max_price,
         value=max_price,
-        step=0.10,
+        step=price_step,
         format="$%.2f",
-        help="Price is based on average retail price in 2025 for a standard 500ml bottle."
+        help=f"Price is based on average retail price in {selected_year} for a standard 500ml bottle."
     )
     
+    st.divider()
+
+    # Channel Search (answered from the channel inverted index)
+    channel_query = st.text_input(
+        "Search Retail Channels:",
+        placeholder="e.g. Glovo",
+        help="Find which markets a digital retail channel reaches. Spellings such as 'Glovo cameroon' are matched to one channel."
+    )
+    if channel_query:
+        channel_hits = channel_index.search(channel_query, limit=5)
+        if not channel_hits:
+            st.caption("No matching retail channel.")
+        for channel_name, channel_markets in channel_hits:
+            st.markdown(
+                f"**{channel_name}** reaches {len(channel_markets)} market(s): "
+                f"{', '.join(channel_index.countries(channel_markets))}"
+            )
+
     st.info("💡 **Tip:** Use the price slider to find affordable markets (e.g., Angola) vs. premium markets (e.g., Seychelles).")
 
-# 5. Filtering Logic
-filtered_df = df[
-    (df['region'].isin(selected_regions)) & 
-    (df['avg_price_usd'] <= price_range)
-]
+# 5. Filtering Logic (the engine runs it; market/views.py holds the pandas computations)
+# Equivalent sidebar states share one canonical key, so any session's earlier
+# visit to the same filters answers this rerun from the result cache
+filter_state = views.filter_state(
+    selected_regions, all_regions, price_range, (min_price, max_price, price_step),
+    brands=selected_brands, max_production=production_range,
+    production_limits=(min_production, max_production, production_step),
+)
+result_cache = load_result_cache()
+# This session's last aggregates: a state the cache misses is computed from
+# the rows that changed since the session's previous one (market/incremental.py)
+maintained = st.session_state.setdefault("maintained_view", incremental.MaintainedView())
+view = result_cache.get(
+    (query_engine.name, data_version, selected_year, filter_state),
+    lambda: query_engine.view(selected_year, filter_state, maintained),
+)
+filtered_df = query_engine.frame_of(selected_year, view)
+# Price percentiles and distinct brands/channels: merged sketches for region
+# selections, exact over the filtered markets otherwise
+distribution = result_cache.get(
+    ("distribution", data_version, selected_year, filter_state),
+    lambda: views.distribution(selected_year, filter_state, filtered_df, sketch_set, brand_index, channel_index),
+)
 
 # 6. Main Dashboard Layout
 
 # --- Header ---
-st.markdown("""
+st.markdown(f"""
     <div class="css-card">
         <h1>🍺 African Beer Market Snapshot</h1>
-        <p>Analysis of beer consumption, production, and digital retail trends across top African markets as at 2025.</p>
+        <p>Analysis of beer consumption, production, and digital retail trends across top African markets as at {selected_year}.</p>
     </div>
 """, unsafe_allow_html=True)
 
 # --- KPI Cards (Dynamic) ---
 col1, col2, col3, col4 = st.columns(4)
 
-avg_price = filtered_df['avg_price_usd'].mean()
-total_prod = filtered_df['production_m_hl'].sum()
-top_consumer = filtered_df.loc[filtered_df['liters_per_capita'].idxmax()] if not filtered_df.empty else None
+kpi = view["kpis"]
+avg_price = kpi["avg_price"]
+total_prod = kpi["total_production"]
+top_consumer = kpi["top_consumer"]
 
 with col1:
     st.markdown(f"""
         <div class="stat-card" style="background-color: #fffbeb;">
             <div style="color: #b45309; font-size: 0.8rem; font-weight: 600;">MARKETS ANALYZED</div>
-            <div style="color: #78350f; font-size: 1.5rem; font-weight: 700;">{len(filtered_df)}</div>
+            <div style="color: #78350f; font-size: 1.5rem; font-weight: 700;">{kpi["markets"]}</div>
         </div>
     """, unsafe_allow_html=True)
 
 with col2:
     st.markdown(f"""
         <div class="stat-card" style="background-color: #f0fdf4;">
-            <div style="color: #15803d; font-size: 0.8rem; font-weight: 600;">AVERAGE PRICE (2025)</div>
+            <div style="color: #15803d; font-size: 0.8rem; font-weight: 600;">AVERAGE PRICE ({selected_year})</div>
             <div style="color: #14532d; font-size: 1.5rem; font-weight: 700;">${avg_price:.2f}</div>
         </div>
     """, unsafe_allow_html=True)
@@ -302,50 +276,42 @@ with col4:
             <div class="stat-card" style="background-color: #faf5ff;">
                 <div style="color: #7e22ce; font-size: 0.8rem; font-weight: 600;">TOP PER CAPITA</div>
                 <div style="color: #581c87; font-size: 1.2rem; font-weight: 700;">{top_consumer['country']}</div>
-                <div style="color: #6b21a8; font-size: 0.8rem;">{top_consumer['liters_per_capita']} L/capita</div>
+                <div style="color: #6b21a8; font-size: 0.8rem;">{top_consumer['liters_per_capita']:.1f} L/capita</div>
             </div>
         """, unsafe_allow_html=True)
 
 st.write("") # Spacer
 
+# Sketch estimates are marked ≈ (about 1% off for prices, 1.6% for counts)
+approx = "≈" if distribution["approximate"] else ""
+p10, median_price, p90 = distribution["price_quantiles"]
+col5, col6 = st.columns(2)
+
+with col5:
+    price_spread = "—" if math.isnan(median_price) else f"{approx}${p10:.2f} · ${median_price:.2f} · ${p90:.2f}"
+    st.markdown(f"""
+        <div class="stat-card" style="background-color: #fff7ed;">
+            <div style="color: #c2410c; font-size: 0.8rem; font-weight: 600;">PRICE P10 · MEDIAN · P90</div>
+            <div style="color: #7c2d12; font-size: 1.5rem; font-weight: 700;">{price_spread}</div>
+        </div>
+    """, unsafe_allow_html=True)
+
+with col6:
+    st.markdown(f"""
+        <div class="stat-card" style="background-color: #f0fdfa;">
+            <div style="color: #0f766e; font-size: 0.8rem; font-weight: 600;">DISTINCT BRANDS · CHANNELS</div>
+            <div style="color: #134e4a; font-size: 1.5rem; font-weight: 700;">{approx}{distribution["brands"]} · {approx}{distribution["channels"]}</div>
+        </div>
+    """, unsafe_allow_html=True)
+
+st.write("") # Spacer
+
 # --- Visualization Section ---
 
 # Scatter Plot Visualization 
 st.subheader("🎯 Market Dynamics: Consumption vs. Production")
 
-# 1. Create the base scatter plot
-scatter = alt.Chart(filtered_df).mark_circle(size=200).encode(
-    x=alt.X('production_m_hl:Q', 
-            title='Production (Million hl)',
-            scale=alt.Scale(zero=False)),
-    y=alt.Y('liters_per_capita:Q', 
-            title='Per Capita Consumption (Liters)'),
-    color=alt.Color('region:N', legend=alt.Legend(title="Region")),
-    tooltip=[
-        alt.Tooltip('country:N', title='Country'),
-        alt.Tooltip('region:N', title='Region'),
-        alt.Tooltip('liters_per_capita:Q', title='Per Capita', format='.1f'),
-        alt.Tooltip('drinking_population_millions:Q', title='Drinking Pop (M)', format='.2f'),
-        alt.Tooltip('total_volume_consumed_ml:Q', title='Total Volume (M L)', format='.1f'),
-        alt.Tooltip('production_m_hl:Q', title='Production (M hl)', format='.2f'),
-        alt.Tooltip('avg_price_usd:Q', title='Avg Price', format='$.2f')
-    ]
-).interactive()
-
-# 2. Add labels
-labels = scatter.mark_text(
-    align='left',
-    baseline='middle',
-    dx=10 
-).encode(
-    text='country:N'
-)
-
-# 3. Combine base scatter with labels
-final_scatter = (scatter + labels).properties(
-    height=500,
-    title="African Beer Market: Per Capita Rates vs. Production Volume"
-)
+final_scatter = views.scatter_chart(filtered_df)
 
 st.altair_chart(final_scatter, use_container_width=True)
 
@@ -358,7 +324,8 @@ st.dataframe(
     hide_index=True,
     column_order=("country", "region", "population_millions", "drinking_population_millions", 
                   "liters_per_capita", "total_volume_consumed_ml", 
-                  "production_m_hl", "avg_price_usd", "top_brands", "digital_channels"),
+                  "production_m_hl", "self_sufficiency_ratio", "avg_price_usd", "spend_musd",
+                  "top_brands", "digital_channels"),
     column_config={
         "country": st.column_config.TextColumn("Country", width="small"),
         "region": st.column_config.TextColumn("Region", width="small"),
@@ -393,44 +360,59 @@ st.dataframe(
             width="small",
             help="Total liters of beer brewed in the country expressed as Million hectoliters"
         ),
+        "self_sufficiency_ratio": st.column_config.NumberColumn(
+            "Self-Sufficiency",
+            format="%.2f×",
+            width="small",
+            help="Domestic production ÷ consumption; below 1 means the market relies on imports"
+        ),
         "avg_price_usd": st.column_config.NumberColumn(
             "Avg Price ($)",
             format="$%.2f",
             width="small"
         ),
-        "top_brands": st.column_config.TextColumn("Top Brands", width="medium"),
-        "digital_channels": st.column_config.TextColumn("Digital Retail", width="medium"),
+        "spend_musd": st.column_config.NumberColumn(
+            "Market Spend ($M)",
+            format="$%.0f M",
+            width="small",
+            help="Yearly consumer spend = Total volume × price per liter"
+        ),
+        "top_brands": st.column_config.ListColumn("Top Brands", width="medium"),
+        "digital_channels": st.column_config.ListColumn("Digital Retail", width="medium"),
     }
 )
 
 # --- Expandable Insights ---
 with st.expander("📝 View Consumer Sentiment Snapshots"):
-    for _, row in filtered_df.iterrows():
-        st.markdown(f"**{row['country']}:** {row['review_snapshot']}")
+    review_query = st.text_input(
+        "Search reviews:",
+        placeholder="e.g. cold, 65cl, premium",
+        help="Ranks review snippets from the filtered markets by relevance (BM25)."
+    )
+    if review_query:
+        review_hits = review_search.search(review_query, market_ids=filtered_df['market_id'].to_numpy(), limit=20)
+        if not review_hits:
+            st.caption("No review mentions those terms in the selected markets.")
+        for hit in review_hits:
+            st.markdown(f"**{hit['country']}:** {hit['text']}")
+    else:
+        shown = filtered_df.head(50)
+        for country, review in zip(shown['country'], shown['review_snapshot']):
+            st.markdown(f"**{country}:** {review}")
+        if len(filtered_df) > len(shown):
+            st.caption(f"Showing {len(shown)} of {len(filtered_df)} snapshots. Search to rank the rest.")
 
 # --- Summary Visuals (USING DRINKING POPULATION) ---
 if not filtered_df.empty:
     st.markdown("---")
     st.subheader("📈 Regional Performance View")
 
-    # Computing regional metrics using drinking population
-    regional_summary = filtered_df.groupby('region').apply(
-        lambda x: pd.Series({
-            'total_production_m_hl': x['production_m_hl'].sum(),
-            'total_volume_consumed_ml': x['total_volume_consumed_ml'].sum(),
-            'total_drinking_population_millions': x['drinking_population_millions'].sum(),
-            # Weighted per capita = Σ(rate × drinking_pop) / Σ(drinking_pop)
-            'weighted_per_capita': (
-                (x['liters_per_capita'] * x['drinking_population_millions']).sum() / 
-                x['drinking_population_millions'].sum()
-            )
-        })
-    ).reset_index()
-    
-    # Identify Leaders
-    leader_prod = regional_summary.loc[regional_summary['total_production_m_hl'].idxmax(), 'region']
-    leader_volume = regional_summary.loc[regional_summary['total_volume_consumed_ml'].idxmax(), 'region']
-    leader_per_capita = regional_summary.loc[regional_summary['weighted_per_capita'].idxmax(), 'region']
+    # Regional metrics using drinking population, and the leaders (cached with the filters)
+    regional_summary = view["summary"]
+    leaders = view["leaders"]
+    leader_prod = leaders['total_production_m_hl']
+    leader_volume = leaders['total_volume_consumed_ml']
+    leader_per_capita = leaders['weighted_per_capita']
     
     # Layout
     sum_col1, sum_col2, sum_col3 = st.columns(3)
@@ -438,10 +420,7 @@ if not filtered_df.empty:
     # Column A: Total Production Volume by Region
     with sum_col1:
         st.markdown("##### 🏭 Production by Region")
-        sorted_prod = regional_summary.sort_values('total_production_m_hl', ascending=False)
-        for _, row in sorted_prod.iterrows():
-            r_name = row['region']
-            val = row['total_production_m_hl']
+        for r_name, val in views.regional_ranking(regional_summary, 'total_production_m_hl'):
             if r_name == leader_prod:
                 st.markdown(f":trophy: **{r_name}: {val:.2f} M hl**")
             else:
@@ -450,10 +429,7 @@ if not filtered_df.empty:
     # Column B: Total Volume Consumed
     with sum_col2:
         st.markdown("##### 🍺 Total Volume Consumed")
-        sorted_volume = regional_summary.sort_values('total_volume_consumed_ml', ascending=False)
-        for _, row in sorted_volume.iterrows():
-            r_name = row['region']
-            val = row['total_volume_consumed_ml']
+        for r_name, val in views.regional_ranking(regional_summary, 'total_volume_consumed_ml'):
             if r_name == leader_volume:
                 st.markdown(f":trophy: **{r_name}: {val:.1f} M L**")
             else:
@@ -463,10 +439,7 @@ if not filtered_df.empty:
     # Column C: Regional Per Capita (Weighted Average)
     with sum_col3:
         st.markdown("##### 🌍 Regional Per Capita Rate")
-        sorted_pc = regional_summary.sort_values('weighted_per_capita', ascending=False)
-        for _, row in sorted_pc.iterrows():
-            r_name = row['region']
-            val = row['weighted_per_capita']
+        for r_name, val in views.regional_ranking(regional_summary, 'weighted_per_capita'):
             if r_name == leader_per_capita:
                 st.markdown(f":trophy: **{r_name}: {val:.1f} L/capita**")
             else:
@@ -490,12 +463,15 @@ with col_f1:
     st.caption("Data Sources: Business Insider Africa, Kirin Holdings Global Beer Report(2022), WHO Global Status Report on Alcohol (2024), Global Data Consolidations.")
     st.caption("Note: Timelines of dataset used are primarily between 2022-2025. Drinking population estimates based on WHO adult consumption data (15+ who drink).")
     st.caption("Developed by Collins Ogombo | © 2026 All rights reserved.")
+    cache_stats = result_cache.stats()
+    st.caption(f"Filter cache: {cache_stats['hit_rate']:.0%} hit rate over "
+               f"{cache_stats['hits'] + cache_stats['misses']} lookups, {cache_stats['entries']} states held.")
 with col_f2:
-    csv = filtered_df.to_csv(index=False)
+    csv = ingest.to_csv(filtered_df)
     st.download_button(
         label="Download Filtered Data",
         data=csv,
-        file_name='african_beer_market_2025.csv',
+        file_name=f'african_beer_market_{selected_year}.csv',
         mime='text/csv',
         use_container_width=True
     )
\ No newline at end of file
@@ -0,0 +1,269 @@
+"""Time each stage of a dashboard rerun at several data sizes.
+
+Stages follow `beer.py` top to bottom, each answered by the query engine
+under test (market/engine.py):
+
+    load        a fresh engine and the year's sidebar bounds (the pandas
+                engine loads the frame and builds its filter indexes,
+                prefix sums, cube and fused kernel matrix; the app pays
+                this once per data version, so every later stage is cheap)
+    filter      the filtered frame for a region, price and production state
+    kpis        the four KPI cards (the per-region totals of the state)
+    regional    regional summary table and leaders (from the same totals)
+    altair      scatter chart construction and its Vega-Lite spec
+    dataframe   st.dataframe serialization (pandas -> Arrow IPC bytes)
+    to_csv      the download button's CSV
+
+Every size gets its own seeded synthetic store (one year, so the loaded
+frame has exactly that many rows), generated on first use under
+data/synthetic/. Each stage runs `--repeat` times and the median and minimum
+are kept.
+
+    python benchmarks/bench.py                         # run, compare to baseline.json
+    python benchmarks/bench.py --sizes 10000 100000 --check
+    python benchmarks/bench.py --save-baseline         # accept the current timings
+    python benchmarks/bench.py --engine duckdb         # A/B another engine against it
+
+Every engine answers in float64 from the store's values (the pandas
+engine reads its compact float32 columns back at their stated decimals,
+see `memory.as_float64`), so A/B runs time the same answers, equal up to
+summation order (about 1e-12 relative).
+
+Results are written as JSON (default benchmarks/latest.json). With --check
+the exit status is 1 when any stage's median is slower than the baseline by
+more than --tolerance and by more than --min-delta milliseconds (timer
+jitter on the sub-millisecond stages is not a regression).
+
+    python benchmarks/bench.py --kernel                # fused KPI kernel vs. reductions
+
+times the KPI cards and regional summary of the representative selection
+several ways instead: the per-statistic pandas reductions over the filtered
+frame, the fused kernel (market/fused.py) with NumPy and, if installed,
+Numba, and the aggregate cube (market/cube.py), whose cost follows its
+cells rather than the markets.
+"""
+import argparse
+import json
+import platform
+import statistics
+import sys
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+import altair as alt  # noqa: E402
+import pandas as pd  # noqa: E402
+import pyarrow as pa  # noqa: E402
+from streamlit import dataframe_util  # noqa: E402
+
+from market import cube, fused, ingest, store, synth, views  # noqa: E402
+from market.engine import ENGINES, open_engine  # noqa: E402
+from market.metrics import engine as metric_engine  # noqa: E402
+
+BENCH_DIR = Path(__file__).resolve().parent
+BASELINE_PATH = BENCH_DIR / "baseline.json"
+DEFAULT_SIZES = [1_000, 10_000, 100_000, 1_000_000]
+YEAR = 2025
+SEED = 0
+
+
+def store_for(rows):
+    """Synthetic single-year store with `rows` markets, generated once."""
+    path = store.ROOT / "data" / "synthetic" / f"bench-{rows}"
+    if store.read_manifest(path).get("rows") != rows:
+        synth.write(rows, path, SEED, years=[YEAR])
+    return path
+
+
+def vega_spec(chart):
+    """Serialize `chart` the way st.altair_chart does."""
+    try:
+        from streamlit.elements.vega_charts import _convert_altair_to_vega_lite_spec
+    except ImportError:
+        with alt.data_transformers.disable_max_rows():
+            return json.dumps(chart.to_dict())
+    return _convert_altair_to_vega_lite_spec(chart)
+
+
+def filter_state(store_dir):
+    """A representative sidebar state, built as `beer.py` builds it: one
+    region dropped, upper price quartile and top production decile cut,
+    the caps snapped to the sliders' step (so the cube can answer it)."""
+    markets = ingest.load_markets([YEAR], columns=["region", "avg_price_usd", "production_m_hl"],
+                                  store_dir=store_dir).to_pandas()
+    regions = sorted(markets["region"].unique())
+    price, production = markets["avg_price_usd"], markets["production_m_hl"]
+    return views.filter_state(
+        regions[1:] or regions, regions,
+        float(price.quantile(0.75)), (views.grid_floor(price.min(), cube.STEP), price.max(), cube.STEP),
+        max_production=float(production.quantile(0.9)),
+        production_limits=(views.grid_floor(production.min(), cube.STEP), production.max(), cube.STEP),
+    )
+
+
+def stages(store_dir, engine_name, filters):
+    """(name, callable) pairs for one rerun; later stages use earlier outputs."""
+    state = {}
+
+    def load():
+        # A cold engine: nothing memoized from the previous repeat
+        metric_engine.clear()
+        state["engine"] = open_engine(engine_name, store_dir)
+        state["engine"].bounds(YEAR)
+
+    def filter_():
+        state["filtered"] = state["engine"].filtered(YEAR, filters)
+
+    def kpis():
+        state["engine"].kpis(YEAR, filters)
+
+    def regional():
+        state["engine"].regional(YEAR, filters)
+
+    def altair():
+        vega_spec(views.scatter_chart(state["filtered"]))
+
+    def dataframe():
+        dataframe_util.convert_pandas_df_to_arrow_bytes(state["filtered"])
+
+    def to_csv():
+        ingest.to_csv(state["filtered"])
+
+    return [
+        ("load", load), ("filter", filter_), ("kpis", kpis), ("regional", regional),
+        ("altair", altair), ("dataframe", dataframe), ("to_csv", to_csv),
+    ]
+
+
+def run(sizes, repeat, engine_name="pandas"):
+    results = {}
+    for rows in sizes:
+        store_dir = store_for(rows)
+        filters = filter_state(store_dir)
+        timings = {}
+        for _ in range(repeat):
+            for name, stage in stages(store_dir, engine_name, filters):
+                start = time.perf_counter()
+                stage()
+                timings.setdefault(name, []).append(time.perf_counter() - start)
+        results[str(rows)] = {
+            name: {"median": statistics.median(t), "min": min(t)} for name, t in timings.items()
+        }
+        print(f"{rows:>10,} rows  " + "  ".join(
+            f"{name} {1e3 * t['median']:.1f}ms" for name, t in results[str(rows)].items()
+        ))
+    return {
+        "meta": {
+            "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "engine": engine_name,
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "pandas": pd.__version__,
+            "pyarrow": pa.__version__,
+            "altair": alt.__version__,
+            "repeat": repeat,
+        },
+        "results": results,
+    }
+
+
+def kernel(sizes, repeat):
+    """Print median times of the headline numbers per method and size."""
+    backends = ["numpy"] + (["numba"] if fused.numba is not None else [])
+    print(f"{'rows':>10}  {'selected':>10}  " + "  ".join(f"{m:>12}" for m in ["reductions", *backends, "cube"]))
+    for rows in sizes:
+        store_dir = store_for(rows)
+        state = filter_state(store_dir)
+        regions, brands, max_price, max_production = state
+        engine = open_engine("pandas", store_dir)
+        df, index, aggregates = engine._load(YEAR)
+        selected = views.select_rows(index, regions, max_price, brands, max_production)
+
+        def reductions():
+            filtered = df if selected is None else df.iloc[selected]
+            views.kpis(filtered)
+            views.regional_summary(filtered)
+
+        methods = {"reductions": reductions}
+        for backend in backends:
+            sums = {"fused": fused.FusedTotals(df, backend=backend)}
+            methods[backend] = lambda sums=sums: views.fused_view(df, sums, selected)
+        # The cube sums the state's cells instead of rows, without a selection
+        methods["cube"] = lambda: views.summed_view(df, aggregates, state)
+        medians = {}
+        for name, method in methods.items():
+            method()  # warm up (and compile, for numba)
+            timings = []
+            for _ in range(repeat):
+                start = time.perf_counter()
+                method()
+                timings.append(time.perf_counter() - start)
+            medians[name] = statistics.median(timings)
+        n_selected = len(df) if selected is None else len(df.iloc[selected])
+        print(f"{rows:>10,}  {n_selected:>10,}  " + "  ".join(
+            f"{1e3 * t:>10.2f}ms" for t in medians.values()
+        ) + f"  ({medians['reductions'] / min(medians.values()):.1f}x)")
+
+
+def compare(current, baseline, tolerance, min_delta=0.0):
+    """Print median time ratios against `baseline`; return the regressed stages.
+
+    A stage is flagged only when it is slower by more than `tolerance` and
+    by more than `min_delta` seconds, so sub-millisecond jitter is not.
+    """
+    regressions = []
+    engines = (baseline["meta"].get("engine", "pandas"), current["meta"]["engine"])
+    if engines[0] != engines[1]:
+        print(f"\nEngine {engines[1]} against the {engines[0]} baseline")
+    print(f"\n{'rows':>10}  {'stage':<10} {'baseline':>10} {'current':>10}  ratio")
+    for rows, stages_ in current["results"].items():
+        for name, timing in stages_.items():
+            before = baseline["results"].get(rows, {}).get(name)
+            if before is None:
+                continue
+            ratio = timing["median"] / before["median"] if before["median"] else float("inf")
+            flag = ""
+            if ratio > 1 + tolerance and timing["median"] - before["median"] > min_delta:
+                flag = "  SLOWER"
+                regressions.append((rows, name, ratio))
+            elif ratio < 1 / (1 + tolerance):
+                flag = "  faster"
+            print(f"{int(rows):>10,}  {name:<10} {1e3 * before['median']:>8.1f}ms "
+                  f"{1e3 * timing['median']:>8.1f}ms  {ratio:5.2f}x{flag}")
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the dashboard rerun stages.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--engine", choices=list(ENGINES), default="pandas", help="query engine to time")
+    parser.add_argument("--output", type=Path, default=BENCH_DIR / "latest.json")
+    parser.add_argument("--baseline", type=Path, default=BASELINE_PATH)
+    parser.add_argument("--save-baseline", action="store_true", help="write the results as the new baseline")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed slowdown before flagging (0.25 = 25%%)")
+    parser.add_argument("--min-delta", type=float, default=1.0,
+                        help="slowdowns of at most this many milliseconds are not flagged")
+    parser.add_argument("--check", action="store_true", help="exit with status 1 on a regression")
+    parser.add_argument("--kernel", action="store_true", help="compare the fused KPI kernel with the reductions")
+    args = parser.parse_args()
+
+    if args.kernel:
+        kernel(args.sizes, args.repeat)
+        sys.exit(0)
+
+    current = run(args.sizes, args.repeat, args.engine)
+    args.output.write_text(json.dumps(current, indent=2) + "\n", encoding="utf-8")
+    print(f"Results written to {args.output}")
+    if args.save_baseline:
+        args.baseline.write_text(json.dumps(current, indent=2) + "\n", encoding="utf-8")
+        print(f"Baseline saved to {args.baseline}")
+    elif args.baseline.exists():
+        regressions = compare(current, json.loads(args.baseline.read_text(encoding="utf-8")), args.tolerance,
+                              args.min_delta / 1e3)
+        if regressions:
+            print(f"\n{len(regressions)} stage(s) slower than the baseline by more than {args.tolerance:.0%}")
+            if args.check:
+                sys.exit(1)
@@ -0,0 +1 @@
+"""Data layer for the African Beer Market dashboard and notebook."""
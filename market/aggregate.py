@@ -0,0 +1,161 @@
+"""Grouped and weighted aggregation over NumPy arrays.
+
+`Groups` factorizes the group keys once (region, year, brand, or several at
+a time). Each reduction is then one `np.bincount` per measure over the
+shared group codes, with no Python-level loop over groups and no per-group
+frames. Sums, counts, means and weighted means take any number of measures
+in one call. Weighted quantiles and medians sort once by (group, value) and
+find each group's quantiles with a single vectorized search.
+
+Missing values follow pandas: a NaN measure adds nothing to a sum, and rows
+whose key is missing belong to no group.
+"""
+import numpy as np
+import pandas as pd
+
+
+def _values(values):
+    return np.asarray(values, dtype=np.float64)
+
+
+def _factorize(key):
+    """``(codes, uniques)`` of `key` sorted, as ``pd.factorize(key, sort=True)``.
+
+    A categorical key's own codes are used (renumbered only when some
+    categories do not occur), skipping the hash pass over every row.
+    """
+    if not isinstance(getattr(key, "dtype", None), pd.CategoricalDtype):
+        return pd.factorize(key, sort=True)
+    categorical = pd.Categorical(key)
+    codes = categorical.codes.astype(np.intp)
+    observed = np.bincount(codes[codes >= 0], minlength=len(categorical.categories)) > 0
+    if not observed.all():
+        renumber = np.where(observed, np.cumsum(observed) - 1, -1)
+        codes = np.where(codes >= 0, renumber[codes], -1)
+    uniques = pd.CategoricalIndex(categorical.categories[observed], dtype=categorical.dtype)
+    return codes, uniques
+
+
+class Groups:
+    """Rows grouped by one or more keys.
+
+    `keys` is one key array or a list of them; groups are the distinct key
+    combinations that occur, ordered by key (category order for
+    categoricals). With `rows`, key ``i`` belongs to row ``rows[i]`` of the
+    measures, so a row can be in several groups. For example, a market is
+    in one group per brand listing from `BrandIndex.listings`.
+    """
+
+    def __init__(self, keys, rows=None):
+        keys = list(keys) if isinstance(keys, (list, tuple)) else [keys]
+        factorized = [_factorize(key) for key in keys]
+        codes = [c for c, _ in factorized]
+        present = np.logical_and.reduce([c >= 0 for c in codes])
+        if not present.all():
+            rows = np.flatnonzero(present) if rows is None else np.asarray(rows)[present]
+            codes = [c[present] for c in codes]
+
+        if len(keys) == 1:
+            self.codes = codes[0]
+            uniques = factorized[0][1]
+            self._key_codes = [np.arange(len(uniques))]
+        else:
+            # Combined code of each key combination, renumbered to the ones present
+            combined = np.ravel_multi_index(codes, [max(len(u), 1) for _, u in factorized])
+            present_combos, self.codes = np.unique(combined, return_inverse=True)
+            self._key_codes = list(np.unravel_index(present_combos, [max(len(u), 1) for _, u in factorized]))
+        # Measures are read through `rows` (a no-copy slice when keys and rows align)
+        self.rows = slice(None) if rows is None else np.asarray(rows)
+        self.names = [getattr(key, "name", None) for key in keys]
+        self._uniques = [u for _, u in factorized]
+        self.n_groups = len(self._key_codes[0])
+
+    def __len__(self):
+        return self.n_groups
+
+    def labels(self):
+        """Key values of each group, one array per key."""
+        return [u.take(c) for u, c in zip(self._uniques, self._key_codes)]
+
+    def _bincount(self, weights=None):
+        counts = np.bincount(self.codes, weights=weights, minlength=self.n_groups)
+        return counts if weights is None else counts.astype(np.float64, copy=False)
+
+    def sum(self, *measures):
+        """Sum of each measure per group, NaN adding nothing; one array per measure."""
+        sums = []
+        for m in measures:
+            values = np.asarray(m)[self.rows]
+            total = self._bincount(values)
+            # Zeroing NaNs costs a copy, so only when a sum shows there were some
+            if np.isnan(total).any():
+                total = self._bincount(np.where(np.isnan(values), 0.0, values))
+            sums.append(total)
+        return sums
+
+    def count(self, *measures):
+        """Non-missing values of each measure per group (rows per group with no measure)."""
+        if not measures:
+            return self._bincount().astype(np.int64)
+        return [self._bincount(~np.isnan(np.asarray(m)[self.rows])).astype(np.int64) for m in measures]
+
+    def mean(self, *measures):
+        """Mean of each measure per group over its non-missing values (NaN if none)."""
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return [s / n for s, n in zip(self.sum(*measures), self.count(*measures))]
+
+    def weighted_mean(self, weights, *measures):
+        """Σ(value × weight) / Σ weight per group, over the rows where both are present."""
+        weights = _values(weights)[self.rows]
+        result = []
+        for m in measures:
+            values = _values(m)[self.rows]
+            present = ~(np.isnan(values) | np.isnan(weights))
+            numerator = self._bincount(np.where(present, values * weights, 0.0))
+            denominator = self._bincount(np.where(present, weights, 0.0))
+            with np.errstate(divide="ignore", invalid="ignore"):
+                result.append(numerator / denominator)
+        return result
+
+    def quantile(self, measure, q, weights=None):
+        """Weighted quantiles of `measure` per group, shape ``(groups, len(q))``.
+
+        A group's q-quantile is its smallest value whose cumulative weight
+        reaches q × the group's total weight, as ``np.quantile(values, q,
+        weights=weights, method="inverted_cdf")``. Unweighted, every row
+        weighs 1. Missing values, missing or non-positive weights are left
+        out; a group with nothing left gets NaN.
+        """
+        q = np.atleast_1d(np.asarray(q, dtype=np.float64))
+        values = _values(measure)[self.rows]
+        weights = np.ones(len(values)) if weights is None else _values(weights)[self.rows]
+        keep = ~np.isnan(values) & (weights > 0)
+        codes, values, weights = self.codes[keep], values[keep], weights[keep]
+
+        order = np.lexsort((values, codes))
+        codes, values = codes[order], values[order]
+        cumulative = np.cumsum(weights[order])
+        starts = np.searchsorted(codes, np.arange(self.n_groups))
+        stops = np.searchsorted(codes, np.arange(self.n_groups), side="right")
+        edges = np.concatenate([[0.0], cumulative])
+        before, total = edges[starts], edges[stops] - edges[starts]
+
+        # Each (group, q) target is found in the running weight of all groups,
+        # then kept inside its group against rounding at the group's ends
+        targets = before[:, None] + q[None, :] * total[:, None]
+        found = np.searchsorted(cumulative, targets, side="left")
+        found = np.clip(found, starts[:, None], np.maximum(stops - 1, starts)[:, None])
+        result = np.full(found.shape, np.nan)
+        filled = stops > starts
+        result[filled] = values[found[filled]]
+        return result
+
+    def median(self, measure, weights=None):
+        """Weighted median of `measure` per group (see `quantile`)."""
+        return self.quantile(measure, 0.5, weights)[:, 0]
+
+    def frame(self, **columns):
+        """DataFrame of the group keys followed by per-group `columns`."""
+        keys = {name if name is not None else f"key_{i}": label
+                for i, (name, label) in enumerate(zip(self.names, self.labels()))}
+        return pd.DataFrame({**keys, **columns})
@@ -0,0 +1,268 @@
+"""Brand dimension and the market × brand bridge.
+
+Brand names arrive as free text ("Guinnes", "Carling black label", "Castle").
+Ingest resolves every spelling to one canonical brand with a stable integer id
+and writes two tables:
+
+* `brands`: the dimension, one row per brand (brand_id, brand)
+* `brand_listings`: the sparse market × brand bridge (brand_id, market_id, rank)
+
+Ids come from the checked-in registry ``data/brands.csv``. A store's own
+`brands` table extends it: brands the registry lacks get the next free ids
+there, and keep them on later rebuilds of that store, so ids stay stable
+without ingest touching the tracked file. ``python -m market.brands
+--update-registry`` appends the default store's new brands to the registry.
+Misspellings and short names are mapped in ``data/brand_aliases.csv``.
+
+`BrandIndex` keeps the bridge sorted by brand, so "every market where Heineken
+is top-5" is one slice of the bridge (O(matches)) instead of a scan over every
+market's brand list.
+"""
+import argparse
+import csv
+import re
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+
+from market import store
+
+ALIASES_PATH = store.ROOT / "data" / "brand_aliases.csv"
+REGISTRY_PATH = store.ROOT / "data" / "brands.csv"
+
+
+def _clean(name):
+    return re.sub(r"\s+", " ", name).strip()
+
+
+def _key(name):
+    return _clean(name).casefold()
+
+
+def read_aliases(path=ALIASES_PATH):
+    """Alias sheet as ``{casefolded alias: canonical brand}``."""
+    with open(path, newline="", encoding="utf-8") as f:
+        return {_key(row["alias"]): row["brand"] for row in csv.DictReader(f)}
+
+
+def read_registry(path=REGISTRY_PATH):
+    """Registered brands as ``{brand: brand_id}``."""
+    if not path.exists():
+        return {}
+    with open(path, newline="", encoding="utf-8") as f:
+        return {row["brand"]: int(row["brand_id"]) for row in csv.DictReader(f)}
+
+
+def resolve(names, aliases=None, registry=None):
+    """Canonical spelling of each of `names`.
+
+    The alias sheet is consulted first, then a case-insensitive match against
+    registered brands; anything else keeps its own (whitespace-cleaned) spelling.
+    """
+    aliases = read_aliases() if aliases is None else aliases
+    registry = read_registry() if registry is None else registry
+    known = {_key(brand): brand for brand in registry}
+    resolved = []
+    for name in names:
+        brand = aliases.get(_key(name), _clean(name))
+        resolved.append(known.setdefault(_key(brand), brand))
+    return resolved
+
+
+def normalize_lists(lists, aliases=None, registry=None):
+    """Rewrite a list<string> array of brand names with canonical spellings.
+
+    Only the distinct names are resolved in Python; the rows are rebuilt with
+    a dictionary take.
+    """
+    lists = lists.combine_chunks()
+    encoded = pc.dictionary_encode(pc.list_flatten(lists))
+    canonical = pa.array(resolve(encoded.dictionary.to_pylist(), aliases, registry), pa.string())
+    offsets = lists.offsets.to_numpy()
+    return pa.ListArray.from_arrays(
+        pa.array(offsets - offsets[0], pa.int32()),
+        canonical.take(encoded.indices),
+        mask=lists.is_null(),
+    )
+
+
+def register(names, store_dir=None, path=REGISTRY_PATH):
+    """Brand dimension covering `names`: the registry, the store's brands, then unseen ones.
+
+    Nothing is written; ingest stores the result as the store's `brands`.
+    A store brand whose id the registry has since given to another brand
+    gets a new id.
+    """
+    registry = read_registry(path)
+    if store.table_path("brands", store_dir).exists():
+        stored = store.read_table("brands", store_dir)
+        taken = set(registry.values())
+        for brand_id, name in zip(stored["brand_id"].to_pylist(), stored["brand"].to_pylist()):
+            if name not in registry and brand_id not in taken:
+                registry[name] = brand_id
+                taken.add(brand_id)
+    new = [name for name in dict.fromkeys(names) if name not in registry]
+    next_id = max(registry.values(), default=0) + 1
+    registry.update(zip(new, range(next_id, next_id + len(new))))
+    ordered = sorted(registry.items(), key=lambda item: item[1])
+    return pa.table({
+        "brand_id": pa.array([brand_id for _, brand_id in ordered], pa.int32()),
+        "brand": pa.array([name for name, _ in ordered], pa.string()),
+    })
+
+
+def update_registry(store_dir=None, path=REGISTRY_PATH):
+    """Append the store's brands missing from the registry at `path`; returns their names.
+
+    They get the next free registry ids, which the store takes on at its
+    next rebuild or upsert.
+    """
+    registry = read_registry(path)
+    stored = store.read_table("brands", store_dir)["brand"].to_pylist()
+    new = [name for name in stored if name not in registry]
+    if new:
+        next_id = max(registry.values(), default=0) + 1
+        write_header = not path.exists()
+        with open(path, "a", newline="", encoding="utf-8") as f:
+            writer = csv.writer(f, lineterminator="\n")
+            if write_header:
+                writer.writerow(["brand_id", "brand"])
+            for brand_id, name in enumerate(new, start=next_id):
+                writer.writerow([brand_id, name])
+    return new
+
+
+def build_bridge(listing, brands):
+    """Market × brand bridge from an exploded `top_brands` listing.
+
+    `listing` has market_id, rank and a dictionary-encoded `brand` column
+    (see `ingest.explode_listing`). A market listing two spellings of one brand
+    keeps the better rank. Rows are sorted by brand, then rank.
+    """
+    values = listing["brand"].combine_chunks()
+    positions = pc.index_in(values.dictionary, value_set=brands["brand"])
+    brand_ids = brands["brand_id"].take(positions).take(values.indices)
+    bridge = pa.table({
+        "brand_id": brand_ids,
+        "market_id": listing["market_id"],
+        "rank": listing["rank"],
+    })
+    bridge = bridge.group_by(["brand_id", "market_id"]).aggregate([("rank", "min")])
+    bridge = bridge.rename_columns(["brand_id", "market_id", "rank"])
+    return bridge.sort_by([("brand_id", "ascending"), ("rank", "ascending"), ("market_id", "ascending")])
+
+
+class BrandIndex:
+    """Brand lookups over the sorted bridge.
+
+    ``offsets[b]:offsets[b + 1]`` is the slice of the bridge holding brand
+    ``b``, ordered by rank, so a lookup costs a dict hit plus the matches.
+    """
+
+    def __init__(self, brands, bridge, markets):
+        self.names = brands["brand"].to_pylist()
+        brand_ids = brands["brand_id"].to_numpy()
+        self._ids = {_key(name): int(i) for name, i in zip(self.names, brand_ids)}
+        self._names_by_id = dict(zip(brand_ids.tolist(), self.names))
+        self._aliases = read_aliases()
+
+        bridge_brands = bridge["brand_id"].to_numpy()
+        self._market_ids = bridge["market_id"].to_numpy()
+        self._ranks = bridge["rank"].to_numpy()
+        self._offsets = np.searchsorted(bridge_brands, np.arange(brand_ids.max(initial=0) + 2))
+
+        regions = pc.dictionary_encode(markets["region"].combine_chunks())
+        self.regions = regions.dictionary.to_pylist()
+        market_ids = markets["market_id"].to_numpy()
+        self._region_of = np.full(market_ids.max(initial=-1) + 1, -1, dtype=np.int32)
+        self._region_of[market_ids] = regions.indices.to_numpy()
+
+    @classmethod
+    def load(cls, store_dir=None):
+        from market import ingest  # ingest imports this module
+
+        ingest.data_version(store_dir)  # builds or refreshes the store if needed
+        return cls(
+            store.read_table("brands", store_dir),
+            store.read_table("brand_listings", store_dir),
+            store.read_dataset("markets", columns=["market_id", "region"], store_dir=store_dir),
+        )
+
+    def brand_id(self, name):
+        """Id of brand `name` (any registered spelling or alias), or None."""
+        key = _key(self._aliases.get(_key(name), name))
+        return self._ids.get(key)
+
+    def listed_brands(self):
+        """Names of the brands listed by at least one market."""
+        listed = np.flatnonzero(np.diff(self._offsets) > 0)
+        return [self._names_by_id[i] for i in listed.tolist() if i in self._names_by_id]
+
+    def markets_with(self, name, max_rank=None):
+        """Ids of the markets listing `name`, optionally within the top `max_rank`."""
+        brand_id = self.brand_id(name)
+        if brand_id is None or brand_id + 1 >= len(self._offsets):
+            return np.empty(0, dtype=self._market_ids.dtype)
+        lo, hi = self._offsets[brand_id], self._offsets[brand_id + 1]
+        if max_rank is not None:
+            hi = lo + np.searchsorted(self._ranks[lo:hi], max_rank, side="right")
+        return self._market_ids[lo:hi]
+
+    def listings(self, max_rank=None):
+        """``(brand names, market ids)`` of every listing, optionally within the top `max_rank`.
+
+        The names are a categorical over the brand ids, so a listing costs
+        one small code rather than a string.
+        """
+        keep = slice(None) if max_rank is None else self._ranks <= max_rank
+        listed = np.flatnonzero(np.diff(self._offsets) > 0)
+        listed = listed[np.isin(listed, list(self._names_by_id))]
+        code_of = np.full(len(self._offsets) - 1, -1, dtype=np.int32)
+        code_of[listed] = np.arange(len(listed))
+        brand_ids = np.repeat(np.arange(len(self._offsets) - 1), np.diff(self._offsets))[keep]
+        names = pd.Categorical.from_codes(code_of[brand_ids], [self._names_by_id[i] for i in listed.tolist()])
+        return names, self._market_ids[keep]
+
+    def distinct(self, market_ids):
+        """Number of distinct brands listed by any of `market_ids` (exact)."""
+        market_ids = np.asarray(market_ids)
+        selected = np.zeros(max(int(self._market_ids.max(initial=-1)), int(market_ids.max(initial=-1))) + 1, dtype=bool)
+        selected[market_ids] = True
+        # Running count of selected listings, read at each brand's slice edges
+        seen = np.concatenate([[0], np.cumsum(selected[self._market_ids])])
+        return int(np.count_nonzero(seen[self._offsets[1:]] > seen[self._offsets[:-1]]))
+
+    def footprint(self, name, max_rank=None):
+        """Number of markets per region listing `name`, as ``{region: count}``."""
+        codes = self._region_of[self.markets_with(name, max_rank)]
+        counts = np.bincount(codes, minlength=len(self.regions))
+        return {region: int(n) for region, n in zip(self.regions, counts) if n}
+
+    def footprint_by_region(self, max_rank=None):
+        """Brand × region market counts for every listed brand, as a DataFrame."""
+        keep = slice(None) if max_rank is None else self._ranks <= max_rank
+        brand_ids = np.repeat(np.arange(len(self._offsets) - 1), np.diff(self._offsets))[keep]
+        codes = self._region_of[self._market_ids[keep]]
+        n_regions = len(self.regions)
+        counts = np.bincount(brand_ids * n_regions + codes, minlength=(len(self._offsets) - 1) * n_regions)
+        counts = counts.reshape(-1, n_regions)
+        listed = np.flatnonzero(counts.sum(axis=1))
+        return pd.DataFrame(
+            counts[listed],
+            index=pd.Index([self._names_by_id[i] for i in listed.tolist()], name="brand"),
+            columns=self.regions,
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Brand dimension and registry.")
+    parser.add_argument("--update-registry", action="store_true",
+                        help=f"append the store's unregistered brands to {REGISTRY_PATH.name}")
+    args = parser.parse_args()
+    if args.update_registry:
+        added = update_registry()
+        print(f"Registered {len(added)} new brand(s)" + (f": {', '.join(added)}" if added else ""))
+    else:
+        parser.print_help()
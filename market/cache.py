@@ -0,0 +1,102 @@
+"""A size-bounded LRU cache shared by every dashboard session.
+
+Most reruns land on a handful of filter states (all regions, a region or
+two, the sliders at their maximum). `beer.py` keeps one `ResultCache` in a
+Streamlit resource and stores, per canonical filter state and data version,
+the filtered row set together with the KPIs and regional summary derived
+from it, so a state any session has already visited costs a lookup.
+
+Entries are evicted least recently used first once either the entry count
+or the estimated bytes exceed their bound. Hits, misses and evictions are
+counted for the footer and for sizing the bounds.
+"""
+import sys
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+MAX_ENTRIES = 256
+MAX_BYTES = 256 * 2**20
+
+
+def sizeof(value):
+    """Estimated bytes held by `value` (arrays, frames and containers of them)."""
+    if isinstance(value, np.ndarray):
+        return value.nbytes
+    if isinstance(value, pd.DataFrame):
+        return int(value.memory_usage(deep=True).sum())
+    if isinstance(value, pd.Series):
+        return int(value.memory_usage(deep=True))
+    if isinstance(value, dict):
+        return sys.getsizeof(value) + sum(sizeof(v) for v in value.values())
+    if isinstance(value, (list, tuple)):
+        return sys.getsizeof(value) + sum(sizeof(v) for v in value)
+    return sys.getsizeof(value)
+
+
+class ResultCache:
+    """Thread-safe LRU mapping bounded by entry count and estimated bytes."""
+
+    def __init__(self, max_entries=MAX_ENTRIES, max_bytes=MAX_BYTES):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()  # key -> (value, bytes)
+        self._bytes = 0
+        # Streamlit serves sessions from several threads
+        self._lock = threading.Lock()
+        self.hits = self.misses = self.evictions = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def get(self, key, compute):
+        """Cached value for `key`, calling `compute()` and storing it on a miss.
+
+        `compute` runs outside the lock, so two sessions missing the same key
+        at once may both compute it; the second result replaces the first.
+        """
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key][0]
+            self.misses += 1
+        value = compute()
+        self.put(key, value)
+        return value
+
+    def put(self, key, value):
+        size = sizeof(value)
+        with self._lock:
+            if key in self._entries:
+                self._bytes -= self._entries.pop(key)[1]
+            # A value larger than the whole budget is returned but not kept
+            if size > self.max_bytes:
+                return
+            self._entries[key] = (value, size)
+            self._bytes += size
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                self._bytes -= self._entries.popitem(last=False)[1][1]
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self):
+        """Counters and occupancy, with the hit rate over all lookups."""
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+        }
@@ -0,0 +1,207 @@
+"""Inverted index from normalised retail channel to the markets it reaches.
+
+The same channel is often listed under several spellings ("Glovo",
+"Glovo cameroon", "Glovo Libreville"). Ingest folds spellings onto one
+channel key: text is case-folded and punctuation-normalised, a trailing place
+name is dropped when the remaining name is itself a listed channel, and
+anything else is mapped in ``data/channel_aliases.csv``. It then writes:
+
+* `channels`: one row per channel (channel_id, channel, key)
+* `channel_listings`: postings (channel_id, market_id) sorted by channel
+
+`ChannelIndex` turns a channel name into its postings slice with one dict
+lookup, so "which markets does channel X reach" costs O(1) per term plus the
+matches, however many channel listings are loaded.
+"""
+import bisect
+import csv
+import re
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+
+from market import store
+
+ALIASES_PATH = store.ROOT / "data" / "channel_aliases.csv"
+
+
+def clean_key(name):
+    """Case-folded channel name without parentheticals or punctuation runs."""
+    text = re.sub(r"\(.*?\)", " ", name)
+    text = re.sub(r"[-_/,]+", " ", text)
+    return re.sub(r"\s+", " ", text).strip().casefold()
+
+
+def read_aliases(path=ALIASES_PATH):
+    """Alias sheet as ``{alias key: channel}``."""
+    with open(path, newline="", encoding="utf-8") as f:
+        return {clean_key(row["alias"]): row["channel"] for row in csv.DictReader(f)}
+
+
+def _strip_place(key, places, known):
+    # "glovo cameroon" -> "glovo", but only when "glovo" is itself listed,
+    # so names such as "tales from ghana" are left alone
+    for place in places:
+        if key.endswith(" " + place):
+            stem = key[: -len(place) - 1]
+            if stem in known:
+                return stem
+    return key
+
+
+def resolve(names, places, aliases=None):
+    """Map each raw channel name to ``(key, display name)``."""
+    aliases = read_aliases() if aliases is None else aliases
+    places = sorted({clean_key(p) for p in places}, key=len, reverse=True)
+    cleaned = [clean_key(name) for name in names]
+    known = set(cleaned) | {clean_key(channel) for channel in aliases.values()}
+    display = {}
+    keys = []
+    for key in cleaned:
+        if key in aliases:
+            # The alias sheet also fixes how the channel is displayed
+            display.setdefault(clean_key(aliases[key]), aliases[key])
+            key = clean_key(aliases[key])
+        else:
+            key = _strip_place(key, places, known)
+        keys.append(key)
+    # Otherwise show a listing spelled like the key itself ("Glovo", not "Glovo cameroon")
+    for name, key in zip(names, keys):
+        if clean_key(name) == key:
+            display.setdefault(key, name)
+    for name, key in zip(names, keys):
+        display.setdefault(key, name)
+    return [(key, display[key]) for key in keys]
+
+
+def build_index(listing, markets, aliases=None):
+    """Channel dimension and sorted postings from an exploded channel listing.
+
+    `listing` has market_id and a dictionary-encoded `channel` column
+    (see `ingest.explode_listing`).
+    """
+    values = listing["channel"].combine_chunks()
+    resolved = resolve(values.dictionary.to_pylist(), pc.unique(markets["country"]).to_pylist(), aliases)
+    keys = sorted({key for key, _ in resolved})
+    key_ids = {key: i for i, key in enumerate(keys)}
+    display = dict(resolved)
+    channel_of_code = pa.array([key_ids[key] for key, _ in resolved], pa.int32())
+
+    postings = pa.table({
+        "channel_id": channel_of_code.take(values.indices),
+        "market_id": listing["market_id"],
+    })
+    # A market listing two spellings of one channel is one posting
+    postings = postings.group_by(["channel_id", "market_id"]).aggregate([])
+    postings = postings.sort_by([("channel_id", "ascending"), ("market_id", "ascending")])
+    channels = pa.table({
+        "channel_id": pa.array(range(len(keys)), pa.int32()),
+        "channel": pa.array([display[key] for key in keys], pa.string()),
+        "key": pa.array(keys, pa.string()),
+    })
+    return channels, postings
+
+
+class ChannelIndex:
+    """Lookups over the channel postings.
+
+    ``offsets[c]:offsets[c + 1]`` is the sorted slice of market ids reached by
+    channel ``c``; keys are kept sorted for prefix search.
+    """
+
+    def __init__(self, channels, postings, markets):
+        self.keys = channels["key"].to_pylist()
+        self.names = channels["channel"].to_pylist()
+        self._ids = {key: i for i, key in enumerate(self.keys)}
+        self._aliases = read_aliases()
+        self._places = sorted(
+            {clean_key(p) for p in pc.unique(markets["country"]).to_pylist()}, key=len, reverse=True
+        )
+
+        self._market_ids = postings["market_id"].to_numpy()
+        self._offsets = np.searchsorted(postings["channel_id"].to_numpy(), np.arange(len(self.keys) + 1))
+
+        market_ids = markets["market_id"].to_numpy()
+        self._country_of = np.empty(market_ids.max(initial=-1) + 1, dtype=object)
+        self._country_of[market_ids] = markets["country"].to_numpy(zero_copy_only=False)
+
+    @classmethod
+    def load(cls, store_dir=None):
+        from market import ingest  # ingest imports this module
+
+        ingest.data_version(store_dir)  # builds or refreshes the store if needed
+        return cls(
+            store.read_table("channels", store_dir),
+            store.read_table("channel_listings", store_dir),
+            store.read_dataset("markets", columns=["market_id", "country"], store_dir=store_dir),
+        )
+
+    def channel_id(self, name):
+        """Id of the channel `name` normalises to, or None."""
+        key = clean_key(name)
+        if key in self._aliases:
+            key = clean_key(self._aliases[key])
+        return self._ids.get(_strip_place(key, self._places, self._ids))
+
+    def markets_reaching(self, name):
+        """Sorted ids of the markets channel `name` reaches."""
+        channel_id = self.channel_id(name)
+        if channel_id is None:
+            return np.empty(0, dtype=self._market_ids.dtype)
+        return self._market_ids[self._offsets[channel_id]:self._offsets[channel_id + 1]]
+
+    def distinct(self, market_ids):
+        """Number of distinct channels reaching any of `market_ids` (exact)."""
+        market_ids = np.asarray(market_ids)
+        selected = np.zeros(max(int(self._market_ids.max(initial=-1)), int(market_ids.max(initial=-1))) + 1, dtype=bool)
+        selected[market_ids] = True
+        # Running count of selected listings, read at each channel's slice edges
+        seen = np.concatenate([[0], np.cumsum(selected[self._market_ids])])
+        return int(np.count_nonzero(seen[self._offsets[1:]] > seen[self._offsets[:-1]]))
+
+    def countries(self, market_ids):
+        """Country names of `market_ids`."""
+        return self._country_of[market_ids].tolist()
+
+    def search(self, text, limit=10):
+        """Channels whose key equals or starts with `text`, as ``[(channel, market_ids)]``.
+
+        An exact (normalised) match comes first, followed by prefix matches in
+        key order.
+        """
+        prefix = clean_key(text)
+        if not prefix:
+            return []
+        exact = self.channel_id(text)
+        hits = [] if exact is None else [exact]
+        start = bisect.bisect_left(self.keys, prefix)
+        for i in range(start, len(self.keys)):
+            if len(hits) >= limit or not self.keys[i].startswith(prefix):
+                break
+            if i != exact:
+                hits.append(i)
+        return [
+            (self.names[i], self._market_ids[self._offsets[i]:self._offsets[i + 1]])
+            for i in hits
+        ]
+
+    def overlap(self, *names):
+        """Ids of the markets reached by every channel in `names`."""
+        postings = sorted((self.markets_reaching(n) for n in names), key=len)
+        if not postings:
+            return np.empty(0, dtype=self._market_ids.dtype)
+        shared = postings[0]
+        for other in postings[1:]:
+            shared = np.intersect1d(shared, other, assume_unique=True)
+        return shared
+
+    def overlap_matrix(self, names):
+        """Pairwise counts of markets shared by `names`, as a DataFrame."""
+        postings = [self.markets_reaching(n) for n in names]
+        counts = [
+            [len(np.intersect1d(a, b, assume_unique=True)) for b in postings]
+            for a in postings
+        ]
+        return pd.DataFrame(counts, index=names, columns=names)
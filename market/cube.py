@@ -0,0 +1,191 @@
+"""Aggregate cube over region × price bucket × production bucket × year.
+
+Ingest materializes the cube next to the markets (the ``cube`` table): one
+cell per occupied combination, holding the additive KPI measures of its
+markets (see `prefix.MEASURES`: counts, sums, and the numerator and
+denominator of the weighted per capita) plus the cell's top per capita
+market. Bucket edges are the multiples of the sidebar slider step, so a
+slider bound falls on an edge and "price ≤ p and production ≤ q" is exactly
+the cells whose buckets are at most p's and q's. Any region, price and
+production state is then a sum over a year's matching cells, without
+reading the markets.
+
+Cells are grouped by year/region partition, like the dataset, so when an
+upsert rewrites some partitions only their cells are rebuilt (`update`).
+
+A query costs a few vectorized passes over the year's cells, however many
+markets they hold, so the cube pays off on large stores: at 1M markets it
+answers a representative state in about 3 ms against 12 ms for the
+compiled fused kernel (``python benchmarks/bench.py --kernel``).
+"""
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+from market import aggregate, ranking, store
+from market.prefix import MEASURES
+
+# The dashboard sliders' step; cube bucket edges are its multiples
+STEP = 0.1
+# Bucket of a missing value: above every edge, so only "no cap" includes it
+NAN_BUCKET = np.iinfo(np.int32).max
+BUCKET_COLUMNS = {"avg_price_usd": "price_bucket", "production_m_hl": "production_bucket"}
+RANK_COLUMN = "liters_per_capita"
+
+
+def edge(k, step=STEP):
+    """Upper edge of bucket `k`, rounded as `views.snap` rounds slider values."""
+    return np.round(k * step, 9)
+
+
+def bucket(values, step=STEP):
+    """Bucket of each value: the smallest k with value ≤ edge(k)."""
+    values = np.asarray(values, dtype=np.float64)
+    with np.errstate(invalid="ignore"):
+        k = np.ceil(values / step)
+        # Division can land one bucket off near an edge; compare with the edges themselves
+        k = np.where(values > edge(k, step), k + 1, k)
+        k = np.where(values <= edge(k - 1, step), k - 1, k)
+    return np.where(np.isnan(values), NAN_BUCKET, k).astype(np.int32)
+
+
+def bucket_of_bound(value, step=STEP):
+    """Bucket whose upper edge is `value`, or None if `value` is not an edge."""
+    k = int(round(value / step))
+    return k if np.isclose(edge(k, step), value, rtol=0, atol=1e-9) else None
+
+
+def build(markets):
+    """Cube cells of the Arrow `markets` table, in the order of its rows.
+
+    A cell's top market is the first of its highest per capita rows, so the
+    rows must be in partition file order (as read back from the store).
+    """
+    frame = markets.select(["market_id", "year", "region", *BUCKET_COLUMNS, RANK_COLUMN,
+                            "total_volume_consumed_ml", "drinking_population_millions"]).to_pandas()
+    keys = pd.DataFrame({
+        "year": frame["year"],
+        "region": frame["region"],
+        **{name: bucket(frame[column]) for column, name in BUCKET_COLUMNS.items()},
+    })
+    groups = aggregate.Groups([keys[column] for column in keys.columns])
+    cells = groups.frame(**dict(zip(MEASURES, groups.sum(*(f(frame) for f in MEASURES.values())))))
+
+    # First row of the highest rate per cell, NaN rates never winning
+    rate = frame[RANK_COLUMN].to_numpy(dtype=np.float64)
+    top = ranking.top_k_by(rate, groups)[:, 0]
+    cells = cells.assign(
+        top_value=np.where(top >= 0, rate[top], np.nan),
+        top_market_id=np.where(top >= 0, frame["market_id"].to_numpy()[top], -1).astype(np.int32),
+    )
+    return pa.Table.from_pandas(cells, preserve_index=False).cast(_schema(markets.schema))
+
+
+def _schema(markets_schema):
+    return pa.schema(
+        [markets_schema.field("year"), markets_schema.field("region")]
+        + [pa.field(name, pa.int32()) for name in BUCKET_COLUMNS.values()]
+        + [pa.field(name, pa.float64()) for name in MEASURES]
+        + [pa.field("top_value", pa.float64()), pa.field("top_market_id", pa.int32())]
+    )
+
+
+def update(cells, partitions):
+    """`cells` with the cells of each rewritten partition rebuilt.
+
+    `partitions` maps ``(year, region)`` to that partition's full new
+    contents (an empty table removes its cells).
+    """
+    stale = pa.table({
+        "year": pa.array([year for year, _ in partitions], cells.schema.field("year").type),
+        "region": pa.array([region for _, region in partitions], cells.schema.field("region").type),
+    })
+    kept = cells.join(stale, ["year", "region"], join_type="left anti")
+    rebuilt = [build(part).cast(cells.schema) for part in partitions.values() if part.num_rows]
+    return pa.concat_tables([kept, *rebuilt]).sort_by([("year", "ascending"), ("region", "ascending")])
+
+
+def write(store_dir=None, partitions=None):
+    """Materialize the cube from the store, rebuilding only `partitions` if given."""
+    if partitions is not None and store.table_path("cube", store_dir).exists():
+        cells = update(store.read_table("cube", store_dir), partitions)
+    else:
+        cells = build(store.read_dataset("markets", store_dir=store_dir))
+    store.write_table("cube", cells, store_dir)
+    return cells
+
+
+class Cube:
+    """Query side of the cube: totals per region for a sidebar state."""
+
+    def __init__(self, cells):
+        cells = cells.sort_by([("year", "ascending"), ("region", "ascending")])
+        self._years = cells["year"].to_numpy()
+        self._buckets = {name: cells[name].to_numpy() for name in BUCKET_COLUMNS.values()}
+        self._measures = np.column_stack([cells[name].to_numpy() for name in MEASURES]) if cells.num_rows \
+            else np.zeros((0, len(MEASURES)))
+        self._top_value = cells["top_value"].to_numpy()
+        self._top_market = cells["top_market_id"].to_numpy()
+        # Cells carry region codes (in name order) and each year is one slice
+        # of them, so a state is a few vectorized passes over one year
+        self._region_names, self._codes = np.unique(np.asarray(cells["region"].to_pylist(), dtype=str),
+                                                    return_inverse=True)
+        self._slices = {}
+        if cells.num_rows:
+            boundary = np.flatnonzero(self._years[1:] != self._years[:-1])
+            starts = np.concatenate([[0], boundary + 1])
+            stops = np.concatenate([boundary + 1, [cells.num_rows]])
+            for start, stop in zip(starts.tolist(), stops.tolist()):
+                self._slices[int(self._years[start])] = slice(start, stop)
+
+    @classmethod
+    def load(cls, store_dir=None):
+        path = store.table_path("cube", store_dir)
+        # Stores written before the cube existed get one on first use
+        return cls(store.read_table("cube", store_dir) if path.exists() else write(store_dir))
+
+    def __len__(self):
+        return len(self._years)
+
+    def answers(self, max_price, max_production):
+        """Whether both bounds are bucket edges (or None), so the cells are exact."""
+        return all(bound is None or bucket_of_bound(bound) is not None for bound in (max_price, max_production))
+
+    def totals(self, year, regions=None, max_price=None, max_production=None, row_of=None):
+        """``(region, measure sums, best row or -1)`` per region of `year`, like `PrefixSums.totals`.
+
+        `row_of` maps a market id to its row in the frame the best rows refer
+        to; ties on the top rate go to the earlier row, as in idxmax.
+        """
+        cells = self._slices.get(year)
+        if cells is None:
+            return []
+        codes = self._codes[cells]
+        n_regions = len(self._region_names)
+        shown = np.bincount(codes, minlength=n_regions) > 0
+        if regions is not None:
+            shown &= np.isin(self._region_names, list(regions))
+        keep = shown[codes]
+        for name, bound in {"price_bucket": max_price, "production_bucket": max_production}.items():
+            if bound is not None:
+                keep &= self._buckets[name][cells] <= bucket_of_bound(bound)
+        codes, measures = codes[keep], self._measures[cells][keep]
+        sums = np.column_stack([np.bincount(codes, weights=measures[:, j], minlength=n_regions)
+                                for j in range(len(MEASURES))])
+
+        # Per region, the highest top value and then the earliest row holding it
+        best = np.full(n_regions, -1)
+        values, markets = self._top_value[cells][keep], self._top_market[cells][keep]
+        winners = markets >= 0
+        if winners.any() and row_of is not None:
+            rows, codes, values = row_of[markets[winners]], codes[winners], values[winners]
+            top = np.full(n_regions, -np.inf)
+            np.maximum.at(top, codes, values)
+            holders = values == top[codes]
+            first = np.full(n_regions, np.iinfo(np.int64).max)
+            np.minimum.at(first, codes[holders], rows[holders])
+            best = np.where(first < np.iinfo(np.int64).max, first, -1)
+        return [
+            (str(self._region_names[g]), dict(zip(MEASURES, sums[g])), int(best[g]))
+            for g in np.flatnonzero(shown)
+        ]
@@ -0,0 +1,410 @@
+"""Query engines behind the dashboard.
+
+`beer.py` asks an engine for the sidebar bounds of a year, the markets passing
+a filter state (see `views.filter_state`), their KPIs and the regional
+summary, and never touches a frame or query itself. The backends answer the
+same questions:
+
+* ``pandas`` loads the year into memory once and filters it through the
+  indexes of market/indexes.py, taking the aggregates of region, price and
+  production filters from prefix sums (market/prefix.py) and the cube
+  materialized at ingest (market/cube.py), and summing any other
+  selection in one pass of the fused kernel (market/fused.py) (the default),
+* ``duckdb`` compiles each question to SQL run by an embedded, in-process
+  DuckDB over the Arrow store. DuckDB scans only the partitions and columns
+  a query needs, pushes the filters into the scan and runs multithreaded;
+  only the filtered rows are converted to pandas, for rendering.
+* ``polars`` builds each question as a Polars `LazyFrame` over the same
+  store, optimized (predicate and projection pushdown, common
+  subexpressions) and run multicore, and collects into pandas at the same
+  boundary.
+
+Pick one with ``BEER_ENGINE=duckdb`` (or `open_engine("duckdb")`); the
+benchmark harness takes the same names (``--engine``) to compare them.
+DuckDB and Polars are optional (``pip install duckdb polars``) and imported
+only when their engine is opened.
+"""
+import os
+import threading
+
+import numpy as np
+import pyarrow as pa
+
+from market import ingest, memory, prefix, store, views
+from market.brands import BrandIndex
+from market.cube import Cube
+from market.metrics import REGISTRY, plan
+
+DEFAULT_ENGINE = os.environ.get("BEER_ENGINE", "pandas")
+
+
+class PandasEngine:
+    """The year's frame in memory, filtered through its indexes."""
+
+    name = "pandas"
+
+    def __init__(self, store_dir=None):
+        self.store_dir = store_dir
+        self._cube = None
+        self._years = {}
+        # The last filtered frame and totals, shared by the KPI and regional
+        # calls that follow them
+        self._last = (None, None)
+        self._last_totals = (None, None)
+
+    def years(self):
+        return ingest.available_years(self.store_dir)
+
+    def frame(self, year):
+        """The year's markets with the dashboard metrics, loaded once."""
+        return self._load(year)[0]
+
+    def _load(self, year):
+        if year not in self._years:
+            df = ingest.load_frame(years=[year], metrics=views.VIEW_METRICS, store_dir=self.store_dir)
+            if self._cube is None:
+                self._cube = Cube.load(self.store_dir)
+            index = views.filter_index(df, BrandIndex.load(self.store_dir))
+            self._years[year] = (df, index, views.aggregates(df, year, self._cube))
+        return self._years[year]
+
+    def bounds(self, year):
+        return views.filter_bounds(self.frame(year))
+
+    def filtered(self, year, state):
+        """Markets of `year` passing the filter `state`, as a pandas frame."""
+        key, frame = self._last
+        if key != (year, state):
+            regions, brands, max_price, max_production = state
+            df, index, _ = self._load(year)
+            frame = views.select_markets(df, index, regions, max_price, brands, max_production)
+            self._last = ((year, state), frame)
+        return frame
+
+    def _totals(self, year, state):
+        """Per-region totals of `state`: from the prefix sums or cube, else one fused pass."""
+        key, totals = self._last_totals
+        if key != (year, state):
+            df, index, sums = self._load(year)
+            totals = views.summed_totals(sums, state)
+            if totals is None:
+                regions, brands, max_price, max_production = state
+                totals = sums["fused"].totals(views.select_rows(index, regions, max_price, brands, max_production))
+            self._last_totals = ((year, state), totals)
+        return totals
+
+    def kpis(self, year, state):
+        return prefix.kpis(self.frame(year), self._totals(year, state))
+
+    def regional(self, year, state):
+        """``(summary, leaders)`` of the filtered markets; both None when none pass."""
+        summary = prefix.regional_summary(self._totals(year, state), self.frame(year)['region'].dtype)
+        if summary.empty:
+            return None, None
+        return summary, views.regional_leaders(summary)
+
+    def view(self, year, state, maintained=None):
+        """Cacheable result of `state` (see `views.market_view`).
+
+        `maintained` is the session's `incremental.MaintainedView`, updated
+        by delta for the states the prefix sums and cube do not answer.
+        """
+        df, index, sums = self._load(year)
+        return views.market_view(df, index, state, sums, maintained)
+
+    def frame_of(self, year, view):
+        """The filtered frame of a `view` result."""
+        df = self.frame(year)
+        return df if view["rows"] is None else df.iloc[view["rows"]]
+
+
+class DuckDBEngine:
+    """SQL over the Arrow store, run by an embedded DuckDB."""
+
+    name = "duckdb"
+
+    def __init__(self, store_dir=None):
+        import duckdb
+
+        self.store_dir = store_dir
+        ingest.data_version(store_dir)  # builds or refreshes the store if needed
+        self._con = duckdb.connect()
+        # Registered Arrow objects are scanned in place: the dataset's hive
+        # partitions are pruned by the year/region predicates
+        markets = store.open_dataset("markets", store_dir)
+        self._con.register("stored_markets", markets)
+        self._con.register("brands", store.read_table("brands", store_dir))
+        self._con.register("brand_listings", store.read_table("brand_listings", store_dir))
+        # Each market row's position in store order, which the pandas and
+        # Polars frames keep: ties on the top rate go to the first, as idxmax
+        order = markets.to_table(columns=["year", "market_id"])
+        self._con.register("row_order", order.append_column("position", pa.array(np.arange(order.num_rows))))
+        self._columns = [c for c in markets.schema.names if c not in ingest.INTERNAL_COLUMNS]
+        self._markets = self._with_metrics(self._columns, views.VIEW_METRICS)
+        # One connection serves every session; DuckDB parallelises each query itself
+        self._lock = threading.Lock()
+
+    def _with_metrics(self, columns, metrics):
+        # Each missing metric wraps the query in one more projection, in
+        # dependency order, so later formulas can use earlier results
+        sql = f"SELECT {', '.join(columns)} FROM stored_markets"
+        for name in plan(metrics, columns):
+            sql = f"SELECT *, {REGISTRY[name].sql} AS {name} FROM ({sql})"
+        # Intermediate metrics (price per liter) are not shown
+        return f"SELECT {', '.join(columns + list(metrics))} FROM ({sql})"
+
+    def _query(self, sql, params=()):
+        with self._lock:
+            return self._con.execute(sql, list(params)).fetch_arrow_table()
+
+    def _where(self, year, state):
+        """SQL condition and parameters for the markets of `year` passing `state`."""
+        regions, brands, max_price, max_production = state
+        clauses, params = ["year = ?"], [year]
+        if regions is not None:
+            clauses.append(f"region IN ({', '.join('?' * len(regions))})" if regions else "FALSE")
+            params += regions
+        if max_price is not None:
+            clauses.append("avg_price_usd <= ?")
+            params.append(max_price)
+        if max_production is not None:
+            clauses.append("production_m_hl <= ?")
+            params.append(max_production)
+        if brands:
+            clauses.append(
+                "market_id IN (SELECT l.market_id FROM brand_listings l JOIN brands b USING (brand_id)"
+                f" WHERE l.rank <= ? AND b.brand IN ({', '.join('?' * len(brands))}))"
+            )
+            params += [views.BRAND_MAX_RANK, *brands]
+        return " AND ".join(clauses), params
+
+    def years(self):
+        return ingest.available_years(self.store_dir)
+
+    def bounds(self, year):
+        row = self._query(
+            "SELECT min(avg_price_usd), max(avg_price_usd), min(production_m_hl), max(production_m_hl)"
+            " FROM stored_markets WHERE year = ?", [year]).to_pylist()[0]
+        regions = self._query("SELECT DISTINCT region FROM stored_markets WHERE year = ? ORDER BY region", [year])
+        low_price, high_price, low_production, high_production = row.values()
+        return {
+            "regions": regions["region"].to_pylist(),
+            "price": (float(low_price), float(high_price)),
+            "production": (float(low_production), float(high_production)),
+        }
+
+    def filtered(self, year, state):
+        where, params = self._where(year, state)
+        table = self._query(f"SELECT * FROM ({self._markets}) WHERE {where}", params)
+        return memory.to_frame(table)
+
+    def kpis(self, year, state):
+        where, params = self._where(year, state)
+        row = self._query(
+            f"SELECT count(*) AS markets, avg(avg_price_usd) AS avg_price,"
+            f" coalesce(sum(production_m_hl), 0) AS total_production"
+            f" FROM stored_markets WHERE {where}", params).to_pylist()[0]
+        # The first row in store order holding the maximum, like idxmax (a
+        # join does not keep scan order, so the position is explicit); then
+        # read the one winning row in full
+        top = self._query(
+            f"SELECT * FROM ({self._markets}) WHERE year = ? AND market_id = ("
+            f"SELECT market_id FROM stored_markets JOIN row_order USING (year, market_id)"
+            f" WHERE {where} AND liters_per_capita = ("
+            f"SELECT max(liters_per_capita) FROM stored_markets WHERE {where}) ORDER BY position LIMIT 1)",
+            [year, *params, *params])
+        return {
+            "markets": row["markets"],
+            # pandas reports the mean of no rows as NaN
+            "avg_price": np.nan if row["avg_price"] is None else row["avg_price"],
+            "total_production": row["total_production"],
+            "top_consumer": memory.to_frame(top).iloc[0] if top.num_rows else None,
+        }
+
+    def regional(self, year, state):
+        where, params = self._where(year, state)
+        summary = self._query(
+            "SELECT region,"
+            " coalesce(sum(production_m_hl), 0) AS total_production_m_hl,"
+            " coalesce(sum(total_volume_consumed_ml), 0) AS total_volume_consumed_ml,"
+            " coalesce(sum(drinking_population_millions), 0) AS total_drinking_population_millions,"
+            # Weighted per capita = Σ(rate × drinking_pop) / Σ(drinking_pop)
+            " sum(liters_per_capita * drinking_population_millions)"
+            "   / sum(drinking_population_millions) AS weighted_per_capita"
+            f" FROM ({self._markets}) WHERE {where} GROUP BY region ORDER BY region", params).to_pandas()
+        if summary.empty:
+            return None, None
+        return summary, views.regional_leaders(summary)
+
+    def view(self, year, state, maintained=None):
+        # Each state is one query; there is no per-session state to maintain
+        summary, leaders = self.regional(year, state)
+        return {
+            "frame": self.filtered(year, state),
+            "kpis": self.kpis(year, state),
+            "summary": summary,
+            "leaders": leaders,
+        }
+
+    def frame_of(self, year, view):
+        return view["frame"]
+
+
+class PolarsEngine:
+    """Polars lazy queries over the Arrow store.
+
+    Every question is one `LazyFrame` plan (scan, filter, derived metrics,
+    aggregation) that Polars optimizes before running it on all cores:
+    filters and column selections are pushed into the dataset scan and
+    repeated subexpressions are computed once. Plans are collected, and
+    converted to pandas, only for what the dashboard renders.
+    """
+
+    name = "polars"
+
+    def __init__(self, store_dir=None):
+        import polars as pl
+
+        self._pl = pl
+        self.store_dir = store_dir
+        ingest.data_version(store_dir)  # builds or refreshes the store if needed
+        markets = store.open_dataset("markets", store_dir)
+        self._columns = [c for c in markets.schema.names if c not in ingest.INTERNAL_COLUMNS]
+        # Arrow types of the rendered frame, so it converts like the other engines'
+        self._schema = pa.schema(
+            [markets.schema.field(c) for c in self._columns]
+            + [pa.field(name, pa.float64()) for name in views.VIEW_METRICS]
+        )
+        self._markets = pl.scan_pyarrow_dataset(markets).select(self._columns)
+        brands = pl.from_arrow(store.read_table("brands", store_dir)).lazy()
+        self._listings = pl.from_arrow(store.read_table("brand_listings", store_dir)).lazy().join(brands, on="brand_id")
+
+    def _filtered(self, year, state):
+        """Lazy markets of `year` passing `state`, with the dashboard metrics."""
+        pl = self._pl
+        regions, brands, max_price, max_production = state
+        condition = pl.col("year") == year
+        if regions is not None:
+            condition &= pl.col("region").is_in(list(regions))
+        if max_price is not None:
+            condition &= pl.col("avg_price_usd") <= max_price
+        if max_production is not None:
+            condition &= pl.col("production_m_hl") <= max_production
+        markets = self._markets.filter(condition)
+        if brands:
+            listed = self._listings.filter(
+                (pl.col("rank") <= views.BRAND_MAX_RANK) & pl.col("brand").is_in(list(brands))
+            ).select("market_id")
+            markets = markets.join(listed, on="market_id", how="semi", maintain_order="left")
+        # Registry metrics from their SQL expressions, dependencies first
+        for name in plan(views.VIEW_METRICS, self._columns):
+            markets = markets.with_columns(pl.sql_expr(REGISTRY[name].sql).alias(name))
+        return markets.select(self._schema.names)
+
+    def _kpi_plans(self, markets):
+        pl = self._pl
+        totals = markets.select(
+            pl.len().alias("markets"),
+            pl.col("avg_price_usd").mean().alias("avg_price"),
+            pl.col("production_m_hl").sum().alias("total_production"),
+        )
+        # The id of the first row holding the maximum, like idxmax; only two
+        # columns are scanned
+        top = markets.select(
+            pl.col("market_id").filter(pl.col("liters_per_capita") == pl.col("liters_per_capita").max()).first()
+        )
+        return [totals, top]
+
+    def _regional_plan(self, markets):
+        pl = self._pl
+        return markets.group_by("region").agg(
+            pl.col("production_m_hl").sum().alias("total_production_m_hl"),
+            pl.col("total_volume_consumed_ml").sum(),
+            pl.col("drinking_population_millions").sum().alias("total_drinking_population_millions"),
+            # Weighted per capita = Σ(rate × drinking_pop) / Σ(drinking_pop)
+            ((pl.col("liters_per_capita") * pl.col("drinking_population_millions")).sum()
+             / pl.col("drinking_population_millions").sum()).alias("weighted_per_capita"),
+        ).sort("region")
+
+    def _to_pandas(self, frame):
+        # The rendering boundary: Polars' large strings back to the store's types
+        return memory.to_frame(frame.to_arrow().cast(self._schema))
+
+    def _kpis(self, year, totals, top):
+        totals = totals.row(0, named=True)
+        top_id = top.item() if top.height else None
+        if top_id is not None:
+            # A literal id is pushed into the scan, so reading the full row is cheap
+            top = self._filtered(year, (None, (), None, None)).filter(self._pl.col("market_id") == top_id).collect()
+        return {
+            "markets": totals["markets"],
+            # pandas reports the mean of no rows as NaN
+            "avg_price": np.nan if totals["avg_price"] is None else totals["avg_price"],
+            "total_production": totals["total_production"],
+            "top_consumer": self._to_pandas(top).iloc[0] if top_id is not None else None,
+        }
+
+    def _regional(self, summary):
+        if summary.is_empty():
+            return None, None
+        summary = summary.to_pandas()
+        return summary, views.regional_leaders(summary)
+
+    def years(self):
+        return ingest.available_years(self.store_dir)
+
+    def bounds(self, year):
+        pl = self._pl
+        markets = self._markets.filter(pl.col("year") == year)
+        ranges, regions = pl.collect_all([
+            markets.select(
+                pl.col("avg_price_usd").min().alias("low_price"), pl.col("avg_price_usd").max().alias("high_price"),
+                pl.col("production_m_hl").min().alias("low_production"),
+                pl.col("production_m_hl").max().alias("high_production"),
+            ),
+            markets.select(pl.col("region").unique().sort()),
+        ])
+        ranges = ranges.row(0, named=True)
+        return {
+            "regions": regions["region"].to_list(),
+            "price": (float(ranges["low_price"]), float(ranges["high_price"])),
+            "production": (float(ranges["low_production"]), float(ranges["high_production"])),
+        }
+
+    def filtered(self, year, state):
+        return self._to_pandas(self._filtered(year, state).collect())
+
+    def kpis(self, year, state):
+        return self._kpis(year, *self._pl.collect_all(self._kpi_plans(self._filtered(year, state))))
+
+    def regional(self, year, state):
+        return self._regional(self._regional_plan(self._filtered(year, state)).collect())
+
+    def view(self, year, state, maintained=None):
+        # `maintained` is not used: each state is one plan.
+        # One optimized run for all four results: the shared scan and filter
+        # are evaluated once
+        markets = self._filtered(year, state)
+        frame, totals, top, summary = self._pl.collect_all(
+            [markets, *self._kpi_plans(markets), self._regional_plan(markets)])
+        summary, leaders = self._regional(summary)
+        return {
+            "frame": self._to_pandas(frame),
+            "kpis": self._kpis(year, totals, top),
+            "summary": summary,
+            "leaders": leaders,
+        }
+
+    def frame_of(self, year, view):
+        return view["frame"]
+
+
+ENGINES = {"pandas": PandasEngine, "duckdb": DuckDBEngine, "polars": PolarsEngine}
+
+
+def open_engine(name=None, store_dir=None, **options):
+    """Engine `name` (default: $BEER_ENGINE, else pandas) over the store."""
+    name = name or DEFAULT_ENGINE
+    if name not in ENGINES:
+        raise ValueError(f"Unknown query engine {name!r}; choose from {', '.join(ENGINES)}")
+    return ENGINES[name](store_dir=store_dir, **options)
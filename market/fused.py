@@ -0,0 +1,137 @@
+"""Fused KPI kernel: every headline number of a selection in one pass.
+
+The KPI cards and the regional summary of a filtered frame used to be a
+string of separate reductions: a count, a mean of price, a sum of
+production, an ``idxmax`` of per capita, then a grouped pass per summary
+column. Each one reads its column again, through a gathered copy of the
+selected rows.
+
+`FusedTotals` keeps the measures of `prefix.MEASURES` for one frame as a
+single float64 matrix, missing values zeroed, next to the region codes
+and the ranking column. `scan` walks the selected rows once and returns the
+per-region sums and top row, which `prefix.kpis` and
+`prefix.regional_summary` turn into the cards and the summary.
+
+With Numba installed (``pip install numba``, optional) the scan is a
+compiled loop reading each selected row's measures together (row-major),
+with the selection given as a mask or as positions. Without it the scan
+is one `np.bincount` per measure over the matrix columns (column-major)
+and two `ufunc.at` reductions for the top rows. Both agree with the pandas
+reductions, ties included: the top row is the first of equal values, as
+``idxmax`` picks it.
+"""
+import numpy as np
+import pandas as pd
+
+from market import prefix
+
+try:
+    import numba
+except ImportError:  # optional: the NumPy scan gives the same results
+    numba = None
+
+BACKEND = "numba" if numba is not None else "numpy"
+
+
+def _scan_rows(codes, measures, rate, positions, n_groups):
+    sums = np.zeros((n_groups, measures.shape[1]))
+    best = np.full(n_groups, -1, dtype=np.int64)
+    for i in range(len(positions)):
+        row = positions[i]
+        g = codes[row]
+        for j in range(measures.shape[1]):
+            sums[g, j] += measures[row, j]
+        value = rate[row]
+        if not np.isnan(value):
+            top = best[g]
+            if top < 0 or value > rate[top] or (value == rate[top] and row < top):
+                best[g] = row
+    return sums, best
+
+
+def _scan_mask(codes, measures, rate, mask, n_groups):
+    sums = np.zeros((n_groups, measures.shape[1]))
+    best = np.full(n_groups, -1, dtype=np.int64)
+    for row in range(len(mask)):
+        if not mask[row]:
+            continue
+        g = codes[row]
+        for j in range(measures.shape[1]):
+            sums[g, j] += measures[row, j]
+        value = rate[row]
+        # Rows arrive in order, so the first of equal values stays on top
+        if not np.isnan(value) and (best[g] < 0 or value > rate[best[g]]):
+            best[g] = row
+    return sums, best
+
+
+if numba is not None:
+    # Compiled on first use, cached next to this module for later processes
+    _scan_rows = numba.njit(cache=True, nogil=True)(_scan_rows)
+    _scan_mask = numba.njit(cache=True, nogil=True)(_scan_mask)
+
+
+def _scan_numpy(codes, measures, rate, rows, n_groups):
+    """`scan` with NumPy reductions, for `rows` None, positions or a mask."""
+    if rows is None:
+        positions = np.arange(len(codes))
+    else:
+        positions = np.flatnonzero(rows) if rows.dtype == bool else np.asarray(rows)
+        codes, rate = codes[positions], rate[positions]
+    sums = np.column_stack([
+        np.bincount(codes, weights=measures[:, j] if rows is None else measures[positions, j],
+                    minlength=n_groups)
+        for j in range(measures.shape[1])
+    ])
+
+    # Best value per region (fmax skips NaN), then its first row
+    top = np.full(n_groups, -np.inf)
+    np.fmax.at(top, codes, rate)
+    holders = rate == top[codes]
+    first = np.full(n_groups, np.iinfo(np.int64).max)
+    np.minimum.at(first, codes[holders], positions[holders])
+    best = np.where(first < np.iinfo(np.int64).max, first, -1)
+    return sums, best
+
+
+class FusedTotals:
+    """The KPI measures of one frame as contiguous arrays, summed in one pass."""
+
+    def __init__(self, df, rank_by='liters_per_capita', backend=None):
+        self.rank_by = rank_by
+        self.backend = backend or BACKEND
+        if self.backend == "numba" and numba is None:
+            raise ImportError("the numba backend needs numba (pip install numba)")
+        codes, regions = pd.factorize(df['region'], sort=True)
+        self.regions = list(regions)
+        self.codes = codes.astype(np.intp)
+        # Row-major for the compiled loop (a row's measures are adjacent),
+        # column-major for bincount (each measure is contiguous)
+        self._measures = np.array(
+            np.column_stack([np.nan_to_num(np.asarray(f(df), dtype=np.float64)) for f in prefix.MEASURES.values()]),
+            order="C" if self.backend == "numba" else "F",
+        )
+        self._rate = df[rank_by].to_numpy(dtype=np.float64)
+
+    def scan(self, rows=None):
+        """``(sums, best)`` of the rows selected by `rows` (None, positions or a mask).
+
+        `sums` is regions × `prefix.MEASURES`; `best` is each region's top
+        row by `rank_by`, -1 where no selected row is ranked.
+        """
+        n_groups = len(self.regions)
+        if self.backend != "numba":
+            return _scan_numpy(self.codes, self._measures, self._rate, rows, n_groups)
+        if rows is None:
+            return _scan_mask(self.codes, self._measures, self._rate, np.ones(len(self.codes), dtype=bool), n_groups)
+        if rows.dtype == bool:
+            return _scan_mask(self.codes, self._measures, self._rate, rows, n_groups)
+        return _scan_rows(self.codes, self._measures, self._rate, np.asarray(rows, dtype=np.intp), n_groups)
+
+    def totals(self, rows=None):
+        """``(region, measure sums, best row or -1)`` per region, as `PrefixSums.totals`."""
+        sums, best = self.scan(rows)
+        return [
+            (region, dict(zip(prefix.MEASURES, row_sums)), int(top))
+            for region, row_sums, top in zip(self.regions, sums, best)
+        ]
@@ -0,0 +1,100 @@
+"""Incremental maintenance of the KPI aggregates of a selection.
+
+Consecutive reruns of one session usually differ by a small step: one
+region toggled, a slider nudged, a brand added. `MaintainedView` keeps the
+last selection of a frame with its per-region totals (the additive measures
+of `prefix.MEASURES`) and its per-region top per capita row. Each new
+selection is compared with the previous one, and only the rows that entered
+or left it are aggregated: entering rows are added and leaving rows are
+subtracted. Aggregation work then follows the size of the change, not the
+size of the selection.
+
+A maximum cannot be subtracted. When the top row of a region leaves, that
+region's top is looked up again among its selected rows. The totals are
+rebuilt from the rows after `REBUILD_EVERY` updates, so float sums do not
+drift, and whenever the change is larger than the selection itself.
+
+The dashboard keeps one per session (`st.session_state`) and uses it for
+the states the prefix sums and cube cannot answer, such as brand filters.
+Rebuilds and deltas alike are passes of the fused kernel (market/fused.py).
+"""
+import numpy as np
+
+from market import fused, prefix
+
+# Delta updates between two rebuilds from the selected rows
+REBUILD_EVERY = 64
+
+
+class MaintainedView:
+    """Per-region totals of the last selection of one frame, updated by row deltas."""
+
+    def __init__(self, rank_by='liters_per_capita'):
+        self.rank_by = rank_by
+        self._df = None
+        # Rows aggregated by delta vs. by rebuild, for sizing REBUILD_EVERY
+        self.delta_rows = self.rebuilt_rows = 0
+
+    def _reset(self, df, kernel):
+        self._df = df
+        # The frame's kernel is shared when it ranks by the same column
+        if kernel is None or kernel.rank_by != self.rank_by:
+            kernel = fused.FusedTotals(df, self.rank_by)
+        self._kernel = kernel
+        self.regions = self._kernel.regions
+        self._rate = df[self.rank_by].to_numpy()
+        self._mask = np.zeros(len(df), dtype=bool)
+        self._sums = np.zeros((len(self.regions), len(prefix.MEASURES)))
+        self._best = np.full(len(self.regions), -1)
+        self._updates = REBUILD_EVERY
+
+    def _better(self, a, b):
+        """Per region, whichever of rows `a` and `b` ranks first (idxmax order)."""
+        rate_a = np.where(a >= 0, self._rate[np.maximum(a, 0)], np.nan)
+        rate_b = np.where(b >= 0, self._rate[np.maximum(b, 0)], np.nan)
+        take_a = (b < 0) | (a >= 0) & ((rate_a > rate_b) | (rate_a == rate_b) & (a < b))
+        return np.where(take_a, a, b)
+
+    def totals(self, df, rows, kernel=None):
+        """``(region, measure sums, best row or -1)`` per region of `df` for `rows`.
+
+        `rows` is a selection of `df` as returned by `FrameIndex.select`
+        (None, row positions or a mask). The result has the shape of
+        `PrefixSums.totals`, so `prefix.kpis` and `prefix.regional_summary`
+        turn it into the KPI cards and the summary. `kernel` is the frame's
+        `fused.FusedTotals`, if one is already built.
+        """
+        if df is not self._df:
+            self._reset(df, kernel)
+        if rows is None:
+            mask = np.ones(len(df), dtype=bool)
+        elif rows.dtype == bool:
+            mask = rows
+        else:
+            mask = np.zeros(len(df), dtype=bool)
+            mask[rows] = True
+
+        entered = np.flatnonzero(mask & ~self._mask)
+        left = np.flatnonzero(self._mask & ~mask)
+        selected = int(np.count_nonzero(mask))
+        if self._updates >= REBUILD_EVERY or len(entered) + len(left) >= selected:
+            self._sums, self._best = self._kernel.scan(mask)
+            self._updates = 0
+            self.rebuilt_rows += selected
+        else:
+            entered_sums, entered_best = self._kernel.scan(entered)
+            self._sums += entered_sums - self._kernel.scan(left)[0]
+            # Regions whose top row left look it up again among their selected rows
+            stale = np.flatnonzero(np.isin(self._best, left))
+            if len(stale):
+                kept = np.flatnonzero(mask & np.isin(self._kernel.codes, stale))
+                self._best[stale] = self._kernel.scan(kept)[1][stale]
+            self._best = self._better(self._best, entered_best)
+            self._updates += 1
+            self.delta_rows += len(entered) + len(left)
+        self._mask = mask
+
+        return [
+            (region, dict(zip(prefix.MEASURES, sums)), int(best))
+            for region, sums, best in zip(self.regions, self._sums, self._best)
+        ]
@@ -0,0 +1,295 @@
+"""Secondary indexes over the in-memory market frame.
+
+Sidebar filters are evaluated against these instead of scanning columns on
+every rerun. They are built once per loaded frame (the dashboard caches them
+next to the frame) and answer with row positions into it.
+
+`SortedIndex` keeps a column's row positions ordered by value, so a range
+such as "price ≤ $1.50" is two binary searches and a slice of the order.
+`RangeFilter` combines several of them: it starts from the most selective
+range and checks the other bounds on just those rows, so a narrow selection
+costs time proportional to its size. Wide selections fall back to a
+vectorized scan, which is as fast as anything that has to touch most rows.
+
+`BitmapIndex` keeps, for every value of a categorical column (region,
+country, year, or brand via the market × brand bridge), the set of rows
+holding it as a `Bitmap`. Frequent values are packed bitmaps (one bit per
+row); rare ones are sorted row positions, which is smaller whenever fewer
+than one row in 32 holds the value. Multiselect filters become a bitwise OR
+over the selected values and an AND across filters; `FrameIndex` combines
+them with the range filters.
+"""
+import numpy as np
+import pandas as pd
+
+
+def _bound(dtype, value, side):
+    """`value` in the column's `dtype`, rounded the way the column's values were.
+
+    A float32 column holds the nearest float32 of each stored decimal, so the
+    bound is rounded to nearest too: a $1.10 slider keeps the markets priced
+    1.10, which a float64 comparison against 1.1000000238 would drop.
+    """
+    if dtype.kind in "iu":
+        value = np.ceil(value) if side == "left" else np.floor(value)
+    return np.asarray(value).astype(dtype)
+
+
+class SortedIndex:
+    """Row positions of one numeric column, sorted by value."""
+
+    def __init__(self, values):
+        values = np.asarray(values)
+        # NaNs sort last and never fall inside a range
+        self.order = np.argsort(values, kind="stable")
+        self.sorted = values[self.order]
+        self._n_valid = len(values) - int(np.isnan(self.sorted).sum()) if values.dtype.kind == "f" else len(values)
+
+    def __len__(self):
+        return len(self.order)
+
+    def span(self, low=None, high=None):
+        """``(start, stop)`` slice of `order` holding low ≤ value ≤ high."""
+        start = 0 if low is None else np.searchsorted(
+            self.sorted[:self._n_valid], _bound(self.sorted.dtype, low, "left"), side="left")
+        stop = self._n_valid if high is None else np.searchsorted(
+            self.sorted[:self._n_valid], _bound(self.sorted.dtype, high, "right"), side="right")
+        return int(start), int(max(start, stop))
+
+    def range(self, low=None, high=None):
+        """Row positions with low ≤ value ≤ high (either bound optional), in value order."""
+        start, stop = self.span(low, high)
+        return self.order[start:stop]
+
+    def count(self, low=None, high=None):
+        start, stop = self.span(low, high)
+        return stop - start
+
+
+class RangeFilter:
+    """Sorted indexes for several columns of one frame.
+
+    `select` intersects range conditions: the condition matching the fewest
+    rows is answered from its index, and the remaining bounds are checked on
+    only those rows, so the cost follows the result size rather than the
+    frame size.
+    """
+
+    def __init__(self, frame, columns):
+        self._n_rows = len(frame)
+        self._values = {c: np.asarray(frame[c]) for c in columns}
+        self.indexes = {c: SortedIndex(v) for c, v in self._values.items()}
+
+    def __len__(self):
+        return self._n_rows
+
+    def select(self, ranges):
+        """Rows satisfying every ``{column: (low, high)}`` range.
+
+        Returns None when every row qualifies (e.g. sliders at their maximum),
+        sorted row positions for a narrow selection, or a boolean row mask
+        for a wide one, where scanning the columns beats gathering and
+        sorting most of the frame. `DataFrame.iloc` accepts either.
+        """
+        spans = {c: self.indexes[c].span(*bounds) for c, bounds in ranges.items() if bounds != (None, None)}
+        counts = {c: stop - start for c, (start, stop) in spans.items()}
+        if all(n == self._n_rows for n in counts.values()):
+            return None
+        driver = min(counts, key=counts.get)
+        # Gathering and sorting costs roughly 30x a sequential compare per row
+        if counts[driver] > self._n_rows // 32:
+            mask = np.ones(self._n_rows, dtype=bool)
+            for column in spans:
+                mask &= self._within(self._values[column], *ranges[column])
+            return mask
+
+        start, stop = spans.pop(driver)
+        positions = self.indexes[driver].order[start:stop]
+        for column in spans:
+            if len(positions) == 0:
+                break
+            positions = positions[self._within(self._values[column][positions], *ranges[column])]
+        return np.sort(positions)
+
+    @staticmethod
+    def _within(values, low, high):
+        keep = np.ones(len(values), dtype=bool)
+        if low is not None:
+            keep &= values >= _bound(values.dtype, low, "left")
+        if high is not None:
+            keep &= values <= _bound(values.dtype, high, "right")
+        return keep
+
+
+def _popcount(bits):
+    if hasattr(np, "bitwise_count"):  # numpy >= 2.0
+        return np.bitwise_count(bits).sum()
+    return np.unpackbits(bits).sum()
+
+
+class Bitmap:
+    """A set of rows out of `n_rows`, as packed bits or sorted positions."""
+
+    def __init__(self, n_rows, bits=None, positions=None):
+        self.n_rows = n_rows
+        self.bits = bits
+        self._positions = positions
+
+    @property
+    def sparse(self):
+        return self.bits is None
+
+    def packed(self):
+        """The set as packed bits (big-endian within each byte, as np.packbits)."""
+        if self.bits is None:
+            bits = np.zeros((self.n_rows + 7) // 8, dtype=np.uint8)
+            pos = self._positions
+            np.bitwise_or.at(bits, pos >> 3, (128 >> (pos & 7)).astype(np.uint8))
+            return bits
+        return self.bits
+
+    def mask(self):
+        """The set as a boolean row mask."""
+        if self.bits is None:
+            mask = np.zeros(self.n_rows, dtype=bool)
+            mask[self._positions] = True
+            return mask
+        return np.unpackbits(self.bits, count=self.n_rows).view(bool)
+
+    def positions(self):
+        """Sorted row positions in the set."""
+        return self._positions if self.bits is None else np.flatnonzero(self.mask())
+
+    def contains(self, positions):
+        """Boolean array: which of `positions` are in the set."""
+        if self.bits is None:
+            if len(self._positions) == 0:
+                return np.zeros(len(positions), dtype=bool)
+            found = np.minimum(np.searchsorted(self._positions, positions), len(self._positions) - 1)
+            return self._positions[found] == positions
+        return (self.bits[positions >> 3] >> (7 - (positions & 7)) & 1).astype(bool)
+
+    def __len__(self):
+        if self.bits is None:
+            return len(self._positions)
+        return int(_popcount(self.bits))
+
+    def __or__(self, other):
+        if self.sparse and other.sparse:
+            return Bitmap(self.n_rows, positions=np.union1d(self._positions, other._positions))
+        return Bitmap(self.n_rows, bits=self.packed() | other.packed())
+
+    def __and__(self, other):
+        # Intersecting with a sparse side only looks at its positions
+        if self.sparse:
+            return Bitmap(self.n_rows, positions=self._positions[other.contains(self._positions)])
+        if other.sparse:
+            return other & self
+        return Bitmap(self.n_rows, bits=self.bits & other.bits)
+
+
+class BitmapIndex:
+    """Row sets per distinct value of a categorical column.
+
+    `values[i]` is the value at row `positions[i]` (default: row i), so a
+    multi-valued attribute such as a market's brands is indexed from its
+    exploded listing. Rows of each value are kept as one slice of a sorted
+    order; values held by at least one row in `DENSE_RATIO` also get a packed
+    bitmap.
+    """
+
+    DENSE_RATIO = 1 / 32
+
+    def __init__(self, values, positions=None, n_rows=None):
+        codes, uniques = pd.factorize(values)
+        n_rows = len(codes) if n_rows is None else n_rows
+        if (codes < 0).any():
+            # Missing values are in no row set
+            positions = np.arange(len(codes)) if positions is None else np.asarray(positions)
+            positions, codes = positions[codes >= 0], codes[codes >= 0]
+        if positions is None:
+            # One value per row: a stable sort by value keeps rows ascending
+            order = np.argsort(codes.astype(np.min_scalar_type(len(uniques))), kind="stable")
+            codes, self._rows = codes[order], order
+        else:
+            # Rows grouped by value, ascending within a value, duplicates dropped
+            keys = np.sort(codes.astype(np.int64) * n_rows + np.asarray(positions))
+            keys = keys[np.concatenate([[True], keys[1:] != keys[:-1]])]
+            codes, self._rows = keys // n_rows, keys % n_rows
+        self._offsets = np.searchsorted(codes, np.arange(len(uniques) + 1))
+
+        self.n_rows = n_rows
+        self.values = pd.Index(uniques)
+        self._dense = {}
+        for i in np.flatnonzero(np.diff(self._offsets) >= self.DENSE_RATIO * n_rows).tolist():
+            self._dense[i] = Bitmap(n_rows, positions=self._slice(i)).packed()
+
+    def _ids(self, values):
+        ids = self.values.get_indexer(list(values))
+        return np.unique(ids[ids >= 0])
+
+    def _slice(self, i):
+        return self._rows[self._offsets[i]:self._offsets[i + 1]]
+
+    def _bitmap(self, i):
+        if i in self._dense:
+            return Bitmap(self.n_rows, bits=self._dense[i])
+        return Bitmap(self.n_rows, positions=self._slice(i))
+
+    def get(self, value):
+        """Bitmap of the rows holding `value` (empty if none do)."""
+        return self.any_of([value])
+
+    def any_of(self, values):
+        """Bitmap of the rows holding any of `values` (bitwise OR)."""
+        ids = self._ids(values).tolist()
+        dense = [self._dense[i] for i in ids if i in self._dense]
+        sparse = [self._slice(i) for i in ids if i not in self._dense]
+        if len(dense) + len(sparse) == 1:
+            return self._bitmap(ids[0])
+        result = Bitmap(self.n_rows, positions=np.unique(np.concatenate(sparse)) if sparse else self._rows[:0])
+        if dense:
+            bits = Bitmap(self.n_rows, bits=np.bitwise_or.reduce(dense))
+            result = bits if not sparse else bits | result
+        return result
+
+    def covers(self, values):
+        """True when `values` include every indexed value (the filter is a no-op)."""
+        return len(self._ids(values)) == len(self.values)
+
+
+class FrameIndex:
+    """Range and bitmap indexes of one frame, evaluated together."""
+
+    def __init__(self, frame, range_columns, bitmap_columns=()):
+        self.ranges = RangeFilter(frame, range_columns)
+        self.bitmaps = {c: BitmapIndex(frame[c]) for c in bitmap_columns}
+
+    def __len__(self):
+        return len(self.ranges)
+
+    def add_bitmap(self, column, values, positions):
+        """Index a multi-valued attribute from its (value, row position) pairs."""
+        self.bitmaps[column] = BitmapIndex(values, positions, len(self))
+
+    def select(self, ranges=None, any_of=None):
+        """Rows within every range and holding one of the listed values per column.
+
+        `ranges` is ``{column: (low, high)}``; `any_of` is ``{column: values}``
+        (a column mapped to None is not filtered). Returns None (every row),
+        sorted row positions or a boolean mask, like `RangeFilter.select`.
+        """
+        rows = self.ranges.select(ranges or {})
+        selected = None
+        for column, values in (any_of or {}).items():
+            if values is None or self.bitmaps[column].covers(values):
+                continue
+            bitmap = self.bitmaps[column].any_of(values)
+            selected = bitmap if selected is None else selected & bitmap
+        if selected is None:
+            return rows
+        if rows is None:
+            return selected.positions() if selected.sparse else selected.mask()
+        if rows.dtype == bool:
+            return rows & selected.mask()
+        return rows[selected.contains(rows)]
@@ -0,0 +1,615 @@
+"""Single ingest path for every market data source.
+
+The dashboard records (`country`, `liters_per_capita`, ...) and the notebook
+export (`Country`, `Liters_Per_Capita`, ...) describe the same markets under two
+column layouts. Each source is parsed once, renamed onto the canonical schema
+(an Arrow metadata-only rename, no column data is copied), validated and then
+reconciled into the `markets` table of the store. Fields on which the sources
+disagree are recorded in the `conflicts` table instead of silently drifting.
+
+    python -m market.ingest                    # full rebuild
+    python -m market.ingest --refresh          # rewrite changed markets only
+    python -m market.ingest --refresh --prune  # ... and drop markets no source lists
+    python -m market.ingest --upsert feed.csv  # append/update from a feed
+
+Every stored market carries a content hash of its canonical fields, so a
+refresh or upsert recomputes derived columns only for rows whose hash changed
+and rewrites only the year/region partitions those rows live in.
+"""
+import argparse
+import ast
+import csv
+import hashlib
+import re
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.csv as pacsv
+import pyarrow.dataset as ds
+
+from market import brands, channels, cube, memory, search, sketches, store
+from market.metrics import engine as metric_engine, stored_metrics
+
+SOURCE_DIR = store.ROOT / "data" / "sources"
+
+# Sources in precedence order: when two sources disagree the first one wins.
+# The dashboard figures are the published ones, the notebook fills the gaps.
+SOURCES = [
+    SOURCE_DIR / "dashboard_2025.csv",
+    SOURCE_DIR / "notebook_2025.csv",
+]
+
+KEY_COLUMNS = ["country", "year"]
+# The markets panel is stored one partition per year and region
+PARTITION_COLUMNS = ["year", "region"]
+
+CANONICAL_SCHEMA = pa.schema([
+    ("country", pa.string()),
+    ("region", pa.string()),
+    ("year", pa.int16()),
+    ("population_millions", pa.float64()),
+    ("pct_adults_15plus", pa.float64()),
+    ("pct_drinkers", pa.float64()),
+    ("liters_per_capita", pa.float64()),
+    ("production_m_hl", pa.float64()),
+    ("avg_price_usd", pa.float64()),
+    ("top_brands", pa.list_(pa.string())),
+    ("review_snapshot", pa.string()),
+    ("digital_channels", pa.list_(pa.string())),
+])
+
+# Bookkeeping columns of the stored panel that are not part of any layout
+INTERNAL_COLUMNS = ["row_hash"]
+LIST_COLUMNS = ["top_brands", "digital_channels"]
+# How list values are written as text (CSV exports, conflict values)
+LIST_SEPARATOR = ", "
+PERCENT_COLUMNS = ["pct_adults_15plus", "pct_drinkers"]
+NUMERIC_COLUMNS = [f.name for f in CANONICAL_SCHEMA if pa.types.is_floating(f.type)]
+
+CONFLICT_SCHEMA = pa.schema([
+    ("country", pa.string()),
+    ("year", pa.int16()),
+    ("column", pa.string()),
+    ("source_rank", pa.int8()),
+    ("value", pa.string()),
+])
+
+# Source column name -> canonical column name, per known layout
+SCHEMA_ALIASES = {
+    "dashboard": {name: name for name in CANONICAL_SCHEMA.names},
+    "notebook": {
+        "Country": "country",
+        "Region": "region",
+        "year": "year",
+        "population_millions": "population_millions",
+        "pct_adults_15plus": "pct_adults_15plus",
+        "pct_drinkers": "pct_drinkers",
+        "Liters_Per_Capita": "liters_per_capita",
+        "Production_Volume_M_hl": "production_m_hl",
+        "Avg_Price_USD_2025": "avg_price_usd",
+        "Top_5_Brands": "top_brands",
+        "Digital_Retail_Points": "digital_channels",
+        "Review_Snapshot": "review_snapshot",
+    },
+}
+
+
+def detect_schema(column_names):
+    """Name of the layout in SCHEMA_ALIASES that `column_names` follow."""
+    for name, aliases in SCHEMA_ALIASES.items():
+        required = set(aliases) - {"year"}
+        if required <= set(column_names):
+            return name
+    raise ValueError(f"Unrecognised source columns: {sorted(column_names)}")
+
+
+def parse_list_column(values):
+    """Parse listed text into a list<string> array.
+
+    Notebook exports hold Python reprs (``"['A', 'B']"``), dashboard sources
+    hold comma-separated text (``"A, B"``). This runs once at ingest; nothing
+    downstream re-splits or evaluates the text again.
+    """
+    values = pc.utf8_trim_whitespace(values.combine_chunks())
+    texts = values.drop_null()
+    if len(texts) and pc.all(pc.starts_with(texts, "[")).as_py():
+        # Python reprs need a real parser: items may contain commas or quotes
+        return pa.array(
+            [None if v is None else ast.literal_eval(v) for v in values.to_pylist()],
+            pa.list_(pa.string()),
+        )
+    lists = pc.split_pattern(values, ",")
+    items = pc.utf8_trim_whitespace(pc.list_flatten(lists))
+    parents = pc.list_parent_indices(lists)
+    keep = pc.not_equal(items, "")
+    counts = np.bincount(parents.filter(keep).to_numpy(), minlength=len(lists))
+    offsets = np.concatenate([[0], np.cumsum(counts)]).astype(np.int32)
+    return pa.ListArray.from_arrays(offsets, items.filter(keep), mask=lists.is_null())
+
+
+def read_source(path, year=None):
+    """Parse one CSV source into a canonical Arrow table.
+
+    `year` is only needed for layouts without a year column; it defaults to
+    the four-digit year in the file name (e.g. ``notebook_2025.csv``).
+    """
+    path = Path(path)
+    with open(path, newline="", encoding="utf-8") as f:
+        header = next(csv.reader(f))
+    layout = detect_schema(header)
+    aliases = SCHEMA_ALIASES[layout]
+
+    # List columns arrive as text and are parsed below
+    canonical_types = {
+        f.name: pa.string() if f.name in LIST_COLUMNS else f.type for f in CANONICAL_SCHEMA
+    }
+    convert = pacsv.ConvertOptions(
+        column_types={src: canonical_types[dst] for src, dst in aliases.items()},
+        include_columns=[src for src in aliases if src in header],
+    )
+    table = pacsv.read_csv(str(path), convert_options=convert)
+    table = table.rename_columns([aliases[name] for name in table.column_names])
+
+    if "year" not in table.column_names:
+        if year is None:
+            match = re.search(r"(19|20)\d{2}", path.stem)
+            if match is None:
+                raise ValueError(f"{path.name}: no year column and no year in the file name")
+            year = int(match.group(0))
+        table = table.append_column("year", pa.array([year] * table.num_rows, pa.int16()))
+
+    for name in LIST_COLUMNS:
+        parsed = parse_list_column(table[name])
+        table = table.set_column(table.schema.get_field_index(name), name, parsed)
+
+    table = table.select(CANONICAL_SCHEMA.names)
+    validate(table, path.name)
+    return table
+
+
+def validate(table, label="source"):
+    """Raise ValueError listing every rule the canonical `table` breaks."""
+    problems = []
+    for name in KEY_COLUMNS + ["region"]:
+        nulls = table[name].null_count
+        if nulls:
+            problems.append(f"{nulls} rows without {name}")
+
+    keys = table.group_by(KEY_COLUMNS).aggregate([([], "count_all")])
+    duplicates = keys.filter(pc.greater(keys["count_all"], 1))
+    for row in duplicates.select(KEY_COLUMNS).to_pylist():
+        problems.append(f"duplicate market {row['country']} ({row['year']})")
+
+    for name in NUMERIC_COLUMNS:
+        if pc.any(pc.less(table[name], 0)).as_py():
+            problems.append(f"negative values in {name}")
+    for name in PERCENT_COLUMNS:
+        if pc.any(pc.greater(table[name], 100)).as_py():
+            problems.append(f"{name} above 100%")
+
+    if problems:
+        raise ValueError(f"{label}: " + "; ".join(problems))
+
+
+def reconcile(tables, tolerance=1e-9):
+    """Merge canonical tables given in precedence order.
+
+    Returns ``(markets, conflicts)``. Each field of a market takes the first
+    non-null value in precedence order. `conflicts` lists every market/field
+    whose values differ between sources, one row per source value: numbers
+    beyond `tolerance`, text exactly, and brand and channel lists as their
+    "A, B" text (order included).
+    """
+    ranked = [
+        t.append_column("source_rank", pa.array([rank] * t.num_rows, pa.int8()))
+        for rank, t in enumerate(tables)
+    ]
+    combined = pa.concat_tables(ranked).sort_by("source_rank")
+
+    # Pick, per market and field, the row of the first non-null value, then
+    # gather the values by row (hash_first has no kernel for list columns)
+    value_columns = [n for n in CANONICAL_SCHEMA.names if n not in KEY_COLUMNS]
+    row_ids = pa.array(np.arange(combined.num_rows))
+    no_row = pa.scalar(None, row_ids.type)
+    pickers = pa.table(
+        {name: combined[name] for name in KEY_COLUMNS}
+        | {name: pc.if_else(pc.is_valid(combined[name]), row_ids, no_row) for name in value_columns}
+    )
+    first = pickers.group_by(KEY_COLUMNS, use_threads=False).aggregate(
+        [(name, "first") for name in value_columns]
+    )
+    markets = pa.table(
+        {name: first[name] for name in KEY_COLUMNS}
+        | {name: combined[name].take(first[f"{name}_first"]) for name in value_columns}
+    ).select(CANONICAL_SCHEMA.names)
+
+    # Lists are compared as their joined text (no distinct-count kernel for lists)
+    for name in LIST_COLUMNS:
+        combined = combined.set_column(combined.schema.get_field_index(name), name,
+                                       pc.binary_join(combined[name], LIST_SEPARATOR))
+    text_columns = ["region", "review_snapshot"] + LIST_COLUMNS
+    checks = [(n, "count_distinct") for n in text_columns] + [(n, "min_max") for n in NUMERIC_COLUMNS]
+    spread = combined.group_by(KEY_COLUMNS).aggregate(checks)
+    parts = []
+    for name, how in checks:
+        value = spread[f"{name}_{how}"]
+        if how == "count_distinct":
+            disagree = pc.greater(value, 1)
+        else:
+            low, high = pc.struct_field(value, "min"), pc.struct_field(value, "max")
+            allowed = pc.multiply(pc.max_element_wise(pc.abs(high), 1.0), tolerance)
+            disagree = pc.fill_null(pc.greater(pc.subtract(high, low), allowed), False)
+        flagged = spread.filter(disagree).select(KEY_COLUMNS)
+        if flagged.num_rows == 0:
+            continue
+        values = flagged.join(combined.select(KEY_COLUMNS + ["source_rank", name]), KEY_COLUMNS)
+        parts.append(pa.table({
+            "country": values["country"],
+            "year": values["year"],
+            "column": pa.array([name] * values.num_rows, pa.string()),
+            "source_rank": values["source_rank"],
+            "value": pc.cast(values[name], pa.string()),
+        }))
+    conflicts = (
+        pa.concat_tables(parts).sort_by([("country", "ascending"), ("column", "ascending"),
+                                         ("source_rank", "ascending")])
+        if parts else CONFLICT_SCHEMA.empty_table()
+    )
+    return markets, conflicts
+
+
+def add_derived_columns(table):
+    """Append the stored metrics (drinking population, total volume).
+
+    The formulas live in the metric registry (see market/metrics.py).
+    """
+    return metric_engine.with_metrics(table, stored_metrics())
+
+
+def explode_listing(markets, column, value_name):
+    """Child table with one row per listed value of `column`.
+
+    Columns are `market_id`, the 1-based `rank` within the market's list and
+    the dictionary-encoded value, so brand or channel lookups compare integer
+    codes rather than strings.
+    """
+    lists = markets[column].combine_chunks()
+    parents = pc.list_parent_indices(lists).to_numpy()
+    offsets = lists.offsets.to_numpy()
+    rank = np.arange(len(parents)) - offsets[parents] + 1
+    return pa.table({
+        "market_id": markets["market_id"].combine_chunks().take(parents),
+        "rank": pa.array(rank, pa.int16()),
+        value_name: pc.dictionary_encode(pc.list_flatten(lists)),
+    })
+
+
+def row_hashes(table):
+    """64-bit content hash of every canonical record in `table`.
+
+    Hashes are stable across processes and runs, so they can be stored and
+    compared against a later version of the same market.
+    """
+    combined = np.zeros(table.num_rows, dtype=np.uint64)
+    for name in CANONICAL_SCHEMA.names:
+        column = table[name]
+        if pa.types.is_list(column.type):
+            column = pc.binary_join(column, "\x1f")
+        values = column.to_numpy(zero_copy_only=False)
+        if values.dtype.kind in "OU":
+            values = values.astype(object)
+        hashed = pd.util.hash_array(values, categorize=False)
+        combined = (combined * np.uint64(1000003)) ^ hashed
+    return combined
+
+
+def content_version(markets):
+    """Short digest of every market's id and content hash."""
+    order = np.argsort(markets["market_id"].to_numpy())
+    digest = hashlib.blake2b(digest_size=8)
+    digest.update(markets["market_id"].to_numpy()[order].tobytes())
+    digest.update(markets["row_hash"].to_numpy()[order].tobytes())
+    return digest.hexdigest()
+
+
+def _prepare(markets):
+    # Canonical brand spellings first, so the hash sees what gets stored
+    markets = markets.set_column(
+        markets.schema.get_field_index("top_brands"), "top_brands",
+        brands.normalize_lists(markets["top_brands"]),
+    )
+    return markets
+
+
+def _finish(markets, ids):
+    # Stored column order: market_id, canonical columns, derived, row_hash
+    markets = add_derived_columns(markets)
+    markets = markets.add_column(0, "market_id", pa.array(ids, pa.int32()))
+    return markets.append_column("row_hash", pa.array(row_hashes(markets)))
+
+
+def write_indexes(markets, store_dir=None):
+    """Rebuild the brand, channel and review indexes for `markets`."""
+    brand_listing = explode_listing(markets, "top_brands", "brand")
+    dimension = brands.register(brand_listing["brand"].combine_chunks().dictionary.to_pylist(), store_dir)
+    store.write_table("brands", dimension, store_dir)
+    store.write_table("brand_listings", brands.build_bridge(brand_listing, dimension), store_dir)
+
+    channel_listing = explode_listing(markets, "digital_channels", "channel")
+    channel_dimension, postings = channels.build_index(channel_listing, markets)
+    store.write_table("channels", channel_dimension, store_dir)
+    store.write_table("channel_listings", postings, store_dir)
+
+    reviews, terms, review_postings = search.build_index(markets)
+    store.write_table("reviews", reviews, store_dir)
+    store.write_table("review_terms", terms, store_dir)
+    store.write_table("review_postings", review_postings, store_dir)
+
+
+def _write_manifest(markets, store_dir, origin=None):
+    origin = origin or store.read_manifest(store_dir).get("origin", "sources")
+    store.write_manifest({
+        "version": content_version(markets),
+        "rows": markets.num_rows,
+        "updated_at": time.time(),
+        # Only stores built from SOURCES are refreshed when a source changes
+        "origin": origin,
+    }, store_dir)
+
+
+def build(sources=None, store_dir=None):
+    """Parse, validate and reconcile `sources` into a fresh store.
+
+    Writes the `markets` panel and `conflicts` tables, the brand dimension and
+    bridge, the channel inverted index, the review search index, the
+    aggregate cube and the partition sketches. Returns ``(markets, conflicts)``.
+    """
+    tables = [read_source(p) for p in (sources or SOURCES)]
+    markets, conflicts = reconcile(tables)
+    return write_store(markets, conflicts, store_dir), conflicts
+
+
+def write_store(markets, conflicts=None, store_dir=None, origin="sources"):
+    """Write canonical `markets` (and their `conflicts`) as a complete store.
+
+    `origin` is recorded in the manifest; stores of any other origin (e.g.
+    ``"synthetic"``) are never refreshed from SOURCES. Returns the stored
+    markets table.
+    """
+    validate(markets, origin)
+    markets = _finish(_prepare(markets), np.arange(markets.num_rows))
+    with store.write_lock(store_dir):
+        store.write_dataset("markets", markets, PARTITION_COLUMNS, store_dir)
+        store.write_table("conflicts", CONFLICT_SCHEMA.empty_table() if conflicts is None else conflicts, store_dir)
+        write_indexes(markets, store_dir)
+        # Built from the partitions as written, whose row order the cube records
+        cube.write(store_dir)
+        sketches.write(store_dir)
+        _write_manifest(markets, store_dir, origin)
+    return markets
+
+
+def _apply(incoming, store_dir, delete_missing):
+    """Write the markets of `incoming` whose content hash changed.
+
+    Unchanged markets are skipped, changed and new ones get their derived
+    columns recomputed, and only the year/region partitions they touch are
+    rewritten. With `delete_missing`, stored markets absent from `incoming`
+    are removed. Returns counts of inserted, updated, deleted and unchanged
+    markets.
+    """
+    incoming = _prepare(incoming)
+    incoming_hash = row_hashes(incoming)
+    existing = store.read_dataset(
+        "markets", columns=["market_id", "row_hash"] + KEY_COLUMNS + ["region"], store_dir=store_dir
+    )
+
+    keys = incoming.select(KEY_COLUMNS).append_column("_pos", pa.array(np.arange(incoming.num_rows)))
+    matched = keys.join(existing, KEY_COLUMNS, join_type="left outer").sort_by("_pos")
+    is_new = matched["market_id"].is_null().to_numpy(zero_copy_only=False)
+    # fill_null keeps the uint64 hashes exact (a null would turn them into floats)
+    old_hash = pc.fill_null(matched["row_hash"], 0).to_numpy()
+    changed = is_new | (old_hash != incoming_hash)
+
+    # Existing markets keep their id, new ones continue the sequence
+    ids = pc.fill_null(matched["market_id"], -1).to_numpy().astype(np.int64)
+    next_id = ids.max(initial=-1) + 1
+    if existing.num_rows:
+        next_id = max(next_id, pc.max(existing["market_id"]).as_py() + 1)
+    ids[is_new] = np.arange(next_id, next_id + is_new.sum())
+
+    rows = _finish(incoming.filter(pa.array(changed)), ids[changed])
+    touched = set(zip(rows["year"].to_pylist(), rows["region"].to_pylist()))
+    # An update may move a market to another region partition
+    moved = matched.filter(pa.array(changed & ~is_new))
+    touched |= set(zip(moved["year"].to_pylist(), moved["region"].to_pylist()))
+    replaced = rows["market_id"]
+
+    deleted = 0
+    if delete_missing:
+        gone = existing.join(keys, KEY_COLUMNS, join_type="left anti")
+        deleted = gone.num_rows
+        touched |= set(zip(gone["year"].to_pylist(), gone["region"].to_pylist()))
+        replaced = pa.concat_arrays([replaced.combine_chunks(), gone["market_id"].combine_chunks()])
+
+    partitions = {}
+    for year, region in sorted(touched):
+        part = store.read_dataset("markets", partition_filter([year], [region]), store_dir=store_dir)
+        keep = part.filter(pc.invert(pc.is_in(part["market_id"], value_set=replaced)))
+        add = rows.filter(pc.and_(pc.equal(rows["year"], year), pc.equal(rows["region"], region)))
+        part = pa.concat_tables([keep, add.cast(keep.schema)])
+        store.write_partition("markets", part, {"year": year, "region": region}, store_dir)
+        partitions[(year, region)] = part
+
+    if touched:
+        markets = store.read_dataset("markets", store_dir=store_dir)
+        write_indexes(markets, store_dir)
+        # Only the rewritten partitions' cube cells and sketches are rebuilt
+        cube.write(store_dir, partitions)
+        sketches.write(store_dir, partitions)
+        _write_manifest(markets, store_dir)
+    else:
+        # Nothing to rewrite, but the store is now known to be current
+        store.write_manifest(store.read_manifest(store_dir) | {"updated_at": time.time()}, store_dir)
+    inserted = int(is_new.sum())
+    updated = int(changed.sum()) - inserted
+    return {
+        "inserted": inserted,
+        "updated": updated,
+        "deleted": deleted,
+        "unchanged": incoming.num_rows - inserted - updated,
+    }
+
+
+def refresh(sources=None, store_dir=None, prune=False):
+    """Bring an existing store in line with `sources`, touching only changed markets.
+
+    Markets added by `upsert` are kept unless `prune` is set, in which case
+    every stored market missing from `sources` is deleted.
+    """
+    markets, conflicts = reconcile([read_source(p) for p in (sources or SOURCES)])
+    with store.write_lock(store_dir):
+        store.write_table("conflicts", conflicts, store_dir)
+        return _apply(markets, store_dir, delete_missing=prune)
+
+
+def upsert(sources, store_dir=None):
+    """Append or update markets from `sources` (e.g. a nightly feed).
+
+    Incoming records replace stored markets with the same country and year;
+    markets the feed does not mention are kept.
+    """
+    markets, _ = reconcile([read_source(p) for p in sources])
+    with store.write_lock(store_dir):
+        return _apply(markets, store_dir, delete_missing=False)
+
+
+def is_stale(sources=None, store_dir=None):
+    """True when the store is older than any of `sources`."""
+    updated_at = store.read_manifest(store_dir).get("updated_at", 0)
+    return any(Path(p).stat().st_mtime > updated_at for p in (sources or SOURCES))
+
+
+def data_version(store_dir=None):
+    """Version of the stored data; it changes whenever any market does."""
+    _ensure_built(store_dir)
+    return store.read_manifest(store_dir).get("version")
+
+
+def _needs_build(manifest):
+    return not manifest or (manifest.get("origin", "sources") == "sources" and is_stale())
+
+
+def _ensure_built(store_dir):
+    if store_dir is not None or not _needs_build(store.read_manifest()):
+        return
+    # Every session's script thread can notice a stale store; the first to
+    # take the lock rebuilds it and the others find it current
+    with store.write_lock():
+        manifest = store.read_manifest()
+        if not manifest:
+            build()
+        elif _needs_build(manifest):
+            refresh()
+
+
+def partition_filter(years=None, regions=None):
+    """Dataset filter selecting `years` and `regions` (None means all)."""
+    conditions = []
+    if years is not None:
+        conditions.append(ds.field("year").isin(list(years)))
+    if regions is not None:
+        conditions.append(ds.field("region").isin(list(regions)))
+    if not conditions:
+        return None
+    expression = conditions[0]
+    for condition in conditions[1:]:
+        expression = expression & condition
+    return expression
+
+
+def load_markets(years=None, regions=None, columns=None, store_dir=None):
+    """Memory-map canonical markets, rebuilding the store if it is stale.
+
+    Only the partitions for `years` and `regions` are opened; pass a range
+    (e.g. ``range(2020, 2026)``) for a span of years.
+    """
+    _ensure_built(store_dir)
+    return store.read_dataset("markets", partition_filter(years, regions), columns, store_dir)
+
+
+def available_years(store_dir=None):
+    """Years present in the panel, read from the partition layout."""
+    _ensure_built(store_dir)
+    return store.partition_values("markets", "year", store_dir)
+
+
+def _as_key(values):
+    return None if values is None else tuple(sorted(values))
+
+
+def load_frame(schema="dashboard", years=None, regions=None, metrics=(), compact=True, store_dir=None):
+    """Canonical markets as a pandas frame in the column layout `schema`.
+
+    List columns stay Arrow-backed (``list<string>[pyarrow]``), so each cell
+    reads as a Python list without materialising one object per row up front.
+    With `compact`, labels are categorical, text is Arrow-backed and numbers
+    are downcast (see market/memory.py); pass False for full float64
+    precision. `metrics` names extra registry metrics to compute (e.g.
+    ``["self_sufficiency_ratio"]``); they are memoized per data version. The
+    notebook layout renames columns back to the notebook names.
+    """
+    markets = load_markets(years, regions, store_dir=store_dir)
+    markets = markets.drop_columns([c for c in INTERNAL_COLUMNS if c in markets.column_names])
+    if metrics:
+        key = (str(store_dir), data_version(store_dir), _as_key(years), _as_key(regions))
+        markets = metric_engine.with_metrics(markets, list(metrics), key)
+    frame = memory.to_frame(markets, compact)
+    if schema == "dashboard":
+        return frame
+    aliases = {dst: src for src, dst in SCHEMA_ALIASES[schema].items()}
+    return frame.rename(columns=aliases)
+
+
+def to_csv(frame, path=None, **kwargs):
+    """Write `frame` as CSV, joining list columns into ``"A, B"`` text.
+
+    The output uses the same delimited form as the dashboard sources, so an
+    export can be fed straight back through `read_source`.
+    """
+    joined = {}
+    for name, dtype in frame.dtypes.items():
+        if isinstance(dtype, pd.ArrowDtype) and pa.types.is_list(dtype.pyarrow_dtype):
+            text = pc.binary_join(pa.array(frame[name]), LIST_SEPARATOR)
+            joined[name] = pd.Series(text.to_pandas(), index=frame.index)
+    return frame.assign(**joined).to_csv(path, index=False, **kwargs)
+
+
+def read_conflicts(store_dir=None):
+    """Value conflicts recorded by the last build, as a pandas frame."""
+    _ensure_built(store_dir)
+    return store.read_table("conflicts", store_dir).to_pandas()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--upsert", nargs="+", metavar="CSV",
+                        help="append/update markets from these files instead of rebuilding")
+    parser.add_argument("--refresh", action="store_true",
+                        help="rewrite only the markets whose sources changed")
+    parser.add_argument("--prune", action="store_true",
+                        help="with --refresh, delete stored markets missing from the sources")
+    args = parser.parse_args()
+    if args.upsert or args.refresh:
+        counts = upsert(args.upsert) if args.upsert else refresh(prune=args.prune)
+        print(", ".join(f"{n} {what}" for what, n in counts.items()))
+        raise SystemExit
+    markets, conflicts = build()
+    print(f"Wrote {markets.num_rows} markets to {store.dataset_path('markets')}")
+    if conflicts.num_rows:
+        print(f"{conflicts.num_rows} conflicting source values:")
+        print(conflicts.to_pandas().to_string(index=False))
@@ -0,0 +1,151 @@
+"""Compact in-memory layout for the market frame, and a memory report.
+
+Converting the store with pandas defaults gives object strings for `country`
+and `region` (one Python string per row) and 8 bytes for every number. The
+compact layout instead uses
+
+* categoricals for repeated labels (`region`, and `country` once the frame
+  spans several years): one small integer code per row plus one copy of
+  each label,
+* Arrow-backed strings and lists for free text, kept in Arrow buffers,
+* float32 for measurements stated to at most six significant digits (the
+  source estimates carry two or three), which float32 gives back exactly
+  when printed and `as_float64` gives back exactly for sums; derived
+  columns such as `total_volume_consumed_ml` carry full float64
+  precision and stay float64,
+* the smallest integer type that holds each integer column.
+
+The report gives the bytes per column of both layouts, to size workers:
+
+    python -m market.memory
+"""
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+
+# Text columns whose values repeat across markets and years
+CATEGORY_COLUMNS = ["country", "region"]
+# ... made categorical when there are at most this many distinct values per row;
+# a column of unique labels is smaller as plain Arrow strings
+MAX_CATEGORY_RATIO = 0.5
+# Significant decimal digits float32 holds exactly
+FLOAT32_DIGITS = np.finfo(np.float32).precision
+
+
+def _float32_is_exact(values):
+    # float32 prints any decimal of up to six significant digits back as
+    # written (FLT_DIG), so look for the decimals the column is stated to
+    values = values.to_numpy(zero_copy_only=False)
+    finite = values[np.isfinite(values)]
+    if not len(finite):
+        return True
+    largest = np.abs(finite).max()
+    # A few hundred values rule out most precisions before the full column is rounded
+    sample = finite[:256]
+    for decimals in range(FLOAT32_DIGITS + 1):
+        if largest * 10 ** decimals >= 10 ** FLOAT32_DIGITS:
+            return False
+        if np.array_equal(np.round(sample, decimals), sample) and np.array_equal(np.round(finite, decimals), finite):
+            return True
+    return False
+
+
+def as_float64(values):
+    """float64 values of a numeric column, float32 ones read back at their stated decimals.
+
+    The compact layout keeps a measurement as float32 only when it is a
+    decimal of at most six significant digits, and no two such decimals
+    share a float32. Rounding the widened values to the fewest decimals
+    that give the same float32s back therefore recovers the stored float64
+    (1.6 rather than 1.600000023841858), so sums agree with engines that
+    read the store.
+    """
+    values = np.asarray(values)
+    if values.dtype != np.float32:
+        return values.astype(np.float64)
+    wide = values.astype(np.float64)
+    finite = np.isfinite(values)
+    narrow, wide_finite = values[finite], wide[finite]
+    sample, wide_sample = narrow[:256], wide_finite[:256]
+    for decimals in range(FLOAT32_DIGITS + 1):
+        if (np.array_equal(np.round(wide_sample, decimals).astype(np.float32), sample)
+                and np.array_equal(np.round(wide_finite, decimals).astype(np.float32), narrow)):
+            return np.round(wide, decimals)
+    return wide
+
+
+def _smallest_int(values):
+    low, high = pc.min_max(values).values()
+    if low.as_py() is None:
+        return values.type
+    for candidate in (pa.int8(), pa.int16(), pa.int32(), pa.int64()):
+        info = np.iinfo(candidate.to_pandas_dtype())
+        if info.min <= low.as_py() and high.as_py() <= info.max:
+            return candidate
+    return values.type
+
+
+def compact_table(table):
+    """`table` with dictionary-encoded labels and downcast numeric columns."""
+    for i, field in enumerate(table.schema):
+        column = table[field.name]
+        if field.name in CATEGORY_COLUMNS and pa.types.is_string(field.type):
+            if pc.count_distinct(column).as_py() <= MAX_CATEGORY_RATIO * len(column):
+                column = pc.dictionary_encode(column)
+        elif pa.types.is_float64(field.type) and _float32_is_exact(column):
+            column = column.cast(pa.float32())
+        elif pa.types.is_integer(field.type):
+            column = column.cast(_smallest_int(column))
+        table = table.set_column(i, field.name, column)
+    return table
+
+
+def _arrow_dtype(arrow_type):
+    # Text and lists stay in Arrow buffers instead of one Python object per row
+    if pa.types.is_string(arrow_type) or pa.types.is_list(arrow_type):
+        return pd.ArrowDtype(arrow_type)
+    return None
+
+
+def _list_dtype(arrow_type):
+    return pd.ArrowDtype(arrow_type) if pa.types.is_list(arrow_type) else None
+
+
+def to_frame(table, compact=True):
+    """pandas frame of `table`; the compact layout unless `compact` is False."""
+    if compact:
+        table = compact_table(table)
+        return table.to_pandas(split_blocks=True, types_mapper=_arrow_dtype)
+    return table.to_pandas(split_blocks=True, types_mapper=_list_dtype)
+
+
+def memory_report(before, after):
+    """Bytes per column of two layouts of the same frame, plus a total row.
+
+    Columns: dtype and bytes of each layout and the bytes saved.
+    """
+    report = pd.DataFrame({
+        "dtype_before": before.dtypes.astype(str),
+        "bytes_before": before.memory_usage(deep=True, index=False),
+        "dtype_after": after.dtypes.astype(str),
+        "bytes_after": after.memory_usage(deep=True, index=False),
+    })
+    report.loc["total"] = ["", report["bytes_before"].sum(), "", report["bytes_after"].sum()]
+    report["saved"] = report["bytes_before"] - report["bytes_after"]
+    report.index.name = "column"
+    return report
+
+
+if __name__ == "__main__":
+    from market import ingest
+
+    markets = ingest.load_markets()
+    markets = markets.drop_columns([c for c in ingest.INTERNAL_COLUMNS if c in markets.column_names])
+    # pandas defaults (object text and lists) against the compact layout
+    report = memory_report(markets.to_pandas(), to_frame(markets))
+    print(f"{markets.num_rows} markets")
+    print(report.to_string())
+    total = report.loc["total"]
+    print(f"{total['bytes_after'] / max(markets.num_rows, 1):.0f} bytes per market "
+          f"({total['bytes_after'] / total['bytes_before']:.0%} of the default layout)")
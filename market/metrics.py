@@ -0,0 +1,213 @@
+"""Registry of derived market metrics.
+
+Each metric declares the columns it is computed from and a vectorized formula
+over those columns (numpy float64 arrays, one value per market). Inputs can be
+stored columns or other metrics, so the registry forms a dependency DAG:
+
+    spend_musd ── total_volume_consumed_ml ── drinking_population_millions
+              └── price_per_liter_usd
+
+Asking for a metric evaluates only it and the metrics it depends on, in
+dependency order, and skips any that the data already holds as columns. The
+two population/volume metrics are stored at ingest; the rest are computed on
+demand. Results are memoized per data version, so repeated views of the same
+store version reuse them.
+
+Each metric also carries its formula as a SQL expression over the same
+inputs, which the SQL query engines (market/engine.py) compile into their
+queries instead of evaluating the Python formula.
+
+New metrics go in this module::
+
+    @metric("liters_per_adult", ["liters_per_capita", "pct_drinkers"],
+            label="Per Adult (L)", sql="liters_per_capita * pct_drinkers / 100")
+    def _liters_per_adult(liters_per_capita, pct_drinkers):
+        return liters_per_capita * pct_drinkers / 100
+"""
+from collections import OrderedDict
+
+import numpy as np
+import pyarrow as pa
+
+# Metric name -> Metric, in registration order
+REGISTRY = {}
+
+
+class Metric:
+    """A derived column: its inputs, formula and display metadata."""
+
+    def __init__(self, name, inputs, formula, label=None, unit="", stored=False, sql=None):
+        self.name = name
+        self.inputs = list(inputs)
+        self.formula = formula
+        self.label = label or name
+        self.unit = unit
+        # Stored metrics are materialised into the store by ingest
+        self.stored = stored
+        # The formula as a SQL expression; a missing result is NULL
+        self.sql = sql
+        self.description = (formula.__doc__ or "").strip()
+
+    def compute(self, columns):
+        return self.formula(**{name: columns[name] for name in self.inputs})
+
+
+def metric(name, inputs, label=None, unit="", stored=False, sql=None):
+    """Decorator registering `formula` as metric `name`."""
+    def register(formula):
+        REGISTRY[name] = Metric(name, inputs, formula, label, unit, stored, sql)
+        return formula
+    return register
+
+
+@metric("drinking_population_millions", ["population_millions", "pct_adults_15plus", "pct_drinkers"],
+        label="Drinking Population (M)", unit="M", stored=True,
+        sql="population_millions * (pct_adults_15plus / 100.0) * (pct_drinkers / 100.0)")
+def _drinking_population(population_millions, pct_adults_15plus, pct_drinkers):
+    """Total population × (% adults 15+/100) × (% drinkers/100)."""
+    return population_millions * (pct_adults_15plus / 100.0) * (pct_drinkers / 100.0)
+
+
+@metric("total_volume_consumed_ml", ["liters_per_capita", "drinking_population_millions"],
+        label="Total Volume (M L)", unit="M L", stored=True,
+        sql="liters_per_capita * drinking_population_millions")
+def _total_volume(liters_per_capita, drinking_population_millions):
+    """Per capita consumption × drinking population, in million liters."""
+    return liters_per_capita * drinking_population_millions
+
+
+@metric("self_sufficiency_ratio", ["production_m_hl", "total_volume_consumed_ml"],
+        label="Self-Sufficiency",
+        sql="CASE WHEN total_volume_consumed_ml > 0 THEN production_m_hl * 100.0 / total_volume_consumed_ml END")
+def _self_sufficiency(production_m_hl, total_volume_consumed_ml):
+    """Domestic production over consumption (1 hl = 100 L); below 1 means a net importer."""
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.where(total_volume_consumed_ml > 0, production_m_hl * 100.0 / total_volume_consumed_ml, np.nan)
+
+
+@metric("price_per_liter_usd", ["avg_price_usd"], label="Price per Liter ($)", unit="USD",
+        sql="avg_price_usd * 2.0")
+def _price_per_liter(avg_price_usd):
+    """Average price of a 0.5 L beer scaled to one liter."""
+    return avg_price_usd * 2.0
+
+
+@metric("affordability_liters_per_usd", ["price_per_liter_usd"], label="Liters per $", unit="L",
+        sql="CASE WHEN price_per_liter_usd > 0 THEN 1.0 / price_per_liter_usd END")
+def _affordability(price_per_liter_usd):
+    """Liters of beer one US dollar buys; higher is more affordable."""
+    with np.errstate(divide="ignore"):
+        return np.where(price_per_liter_usd > 0, 1.0 / price_per_liter_usd, np.nan)
+
+
+@metric("spend_per_drinker_usd", ["liters_per_capita", "price_per_liter_usd"],
+        label="Spend per Drinker ($)", unit="USD",
+        sql="liters_per_capita * price_per_liter_usd")
+def _spend_per_drinker(liters_per_capita, price_per_liter_usd):
+    """Yearly beer spend of an average drinker."""
+    return liters_per_capita * price_per_liter_usd
+
+
+@metric("spend_musd", ["total_volume_consumed_ml", "price_per_liter_usd"],
+        label="Market Spend ($M)", unit="M USD",
+        sql="total_volume_consumed_ml * price_per_liter_usd")
+def _spend(total_volume_consumed_ml, price_per_liter_usd):
+    """Yearly consumer spend on beer, in million USD."""
+    return total_volume_consumed_ml * price_per_liter_usd
+
+
+def stored_metrics():
+    """Names of the metrics ingest writes into the store."""
+    return [name for name, m in REGISTRY.items() if m.stored]
+
+
+def plan(names, available=()):
+    """Metrics to evaluate, dependencies first, to obtain `names`.
+
+    Names outside the registry are base columns. Metrics whose name is in
+    `available` (columns the data already has) are taken as given and not
+    recomputed. Raises ValueError for a dependency cycle.
+    """
+    available = set(available)
+    order, visiting, done = [], set(), set()
+
+    def visit(name):
+        if name in done or name in available or name not in REGISTRY:
+            return
+        if name in visiting:
+            raise ValueError(f"Metric dependency cycle through {name}")
+        visiting.add(name)
+        for dependency in REGISTRY[name].inputs:
+            visit(dependency)
+        visiting.discard(name)
+        done.add(name)
+        order.append(name)
+
+    for name in names:
+        visit(name)
+    return order
+
+
+def _column(data, name):
+    return np.asarray(data[name], dtype=np.float64)
+
+
+class MetricEngine:
+    """Evaluates metrics lazily and memoizes results per data version.
+
+    `key` identifies the data a call is made on, e.g. the store's data version
+    plus the selected years; results computed under one key are reused by any
+    later call with the same key. The memo keeps the `maxsize` most recently
+    used keys.
+    """
+
+    def __init__(self, maxsize=16):
+        self.maxsize = maxsize
+        self._memo = OrderedDict()
+
+    def compute(self, data, names, key=None):
+        """``{name: values}`` for the metrics `names` over `data`.
+
+        `data` is an Arrow table or pandas frame holding the base columns.
+        Requested names that are already columns of `data` are returned as is.
+        """
+        columns = set(getattr(data, "column_names", None) or data.columns)
+        memo = self._slot(key)
+        values = {}
+        for name in plan(names, columns | set(memo)):
+            inputs = {
+                i: values[i] if i in values else memo[i] if i in memo else _column(data, i)
+                for i in REGISTRY[name].inputs
+            }
+            values[name] = np.asarray(REGISTRY[name].compute(inputs), dtype=np.float64)
+            memo[name] = values[name]
+        return {
+            name: memo[name] if name in memo else _column(data, name)
+            for name in names
+        }
+
+    def with_metrics(self, table, names, key=None):
+        """Arrow `table` with the metrics `names` appended as columns."""
+        missing = [name for name in names if name not in table.column_names]
+        for name, values in self.compute(table, missing, key).items():
+            # from_pandas: NaN (a missing input) is stored as null
+            table = table.append_column(name, pa.array(values, pa.float64(), from_pandas=True))
+        return table
+
+    def clear(self):
+        """Forget every memoized result."""
+        self._memo.clear()
+
+    def _slot(self, key):
+        # Uncached calls get a scratch memo
+        if key is None:
+            return {}
+        if key not in self._memo:
+            self._memo[key] = {}
+            while len(self._memo) > self.maxsize:
+                self._memo.popitem(last=False)
+        self._memo.move_to_end(key)
+        return self._memo[key]
+
+
+engine = MetricEngine()
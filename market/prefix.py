@@ -0,0 +1,131 @@
+"""Prefix-sum aggregates answering price-threshold KPIs without touching rows.
+
+The KPI cards and the regional summary are sums over the markets priced at
+or below the slider: counts, prices, production, volume, drinking population
+and rate × population (the numerator of the weighted per capita). With each
+region's rows sorted by price and the measures summed cumulatively in that
+order, the totals for "price ≤ p" in a region are one binary search and a
+subtraction of two cumulative rows. A slider drag then costs O(regions ×
+log n) whatever the number of markets.
+
+The top per capita market is kept the same way: a running best over the
+price order gives, for every prefix, the row pandas' ``idxmax`` would pick.
+"""
+import numpy as np
+import pandas as pd
+
+from market.memory import as_float64
+
+# Summed measures: column name -> values per row (missing values add nothing).
+# Compact float32 columns are read back as the float64 the store holds, so
+# the sums match the DuckDB and Polars engines
+MEASURES = {
+    "markets": lambda df: np.ones(len(df)),
+    "priced": lambda df: df['avg_price_usd'].notna().to_numpy(dtype=np.float64),
+    "avg_price_usd": lambda df: as_float64(df['avg_price_usd']),
+    "production_m_hl": lambda df: as_float64(df['production_m_hl']),
+    "total_volume_consumed_ml": lambda df: as_float64(df['total_volume_consumed_ml']),
+    "drinking_population_millions": lambda df: as_float64(df['drinking_population_millions']),
+    "rate_x_population": lambda df: (
+        as_float64(df['liters_per_capita']) * as_float64(df['drinking_population_millions'])
+    ),
+}
+
+
+class PrefixSums:
+    """Per-region cumulative sums of the KPI measures, in price order."""
+
+    def __init__(self, df, column='avg_price_usd', group='region', rank_by='liters_per_capita'):
+        self.n_rows = len(df)
+        codes, groups = pd.factorize(df[group], sort=True)
+        self.groups = list(groups)
+        self._dtype = df[column].dtype
+        values = df[column].to_numpy(dtype=np.float64)
+        # Rows grouped by region, then by price with NaN last (a NaN price
+        # only counts when the slider is at its maximum)
+        order = np.lexsort((values, codes))
+        self._offsets = np.searchsorted(codes[order], np.arange(len(groups) + 1))
+        self._sorted = values[order]
+        self._valid = np.array([
+            start + int(np.searchsorted(np.isnan(self._sorted[start:stop]), True))
+            for start, stop in zip(self._offsets[:-1], self._offsets[1:])
+        ], dtype=np.int64)
+
+        measures = np.column_stack([
+            np.nan_to_num(np.asarray(f(df), dtype=np.float64)) for f in MEASURES.values()
+        ])
+        self._cumulative = np.vstack([np.zeros(len(MEASURES)), np.cumsum(measures[order], axis=0)])
+
+        # Best row per prefix: rank rows by (value desc, row asc) as idxmax
+        # does, NaN last, then a running maximum of a key that restarts at
+        # each region (every region's keys exceed the previous region's)
+        rank = np.empty(self.n_rows, dtype=np.int64)
+        rank_values = df[rank_by].to_numpy(dtype=np.float64)
+        by_rank = np.lexsort((np.arange(self.n_rows), np.isnan(rank_values), -np.nan_to_num(rank_values)))
+        rank[by_rank] = np.arange(self.n_rows)
+        span = self.n_rows + 1
+        best = np.maximum.accumulate(codes[order] * span + (self.n_rows - rank[order]))
+        self._best_row = by_rank[self.n_rows - best % span] if self.n_rows else by_rank
+        self._has_rank = ~np.isnan(rank_values)
+
+    def _stop(self, g, high):
+        start, valid = self._offsets[g], self._valid[g]
+        if high is None:
+            return self._offsets[g + 1]
+        # The bound in the column's precision, as the row filters compare it
+        high = np.float64(np.asarray(high).astype(self._dtype))
+        return start + int(np.searchsorted(self._sorted[start:valid], high, side="right"))
+
+    def totals(self, high=None, groups=None):
+        """``(region, measure sums, best row or -1)`` per region, rows priced ≤ `high`.
+
+        `high` None keeps every row (NaN prices included); `groups` (labels,
+        None for all) restricts the regions.
+        """
+        wanted = range(len(self.groups)) if groups is None else [
+            self.groups.index(g) for g in groups if g in self.groups
+        ]
+        result = []
+        for g in sorted(wanted):
+            start, stop = self._offsets[g], self._stop(g, high)
+            sums = self._cumulative[stop] - self._cumulative[start]
+            best = self._best_row[stop - 1] if stop > start else -1
+            if best >= 0 and not self._has_rank[best]:
+                best = -1
+            result.append((self.groups[g], dict(zip(MEASURES, sums)), best))
+        return result
+
+
+def kpis(df, totals):
+    """The KPI card values (see `views.kpis`) from per-region `totals` over `df`."""
+    sums = {m: sum(t[1][m] for t in totals) for m in MEASURES}
+    top_consumer = None
+    winners = [t[2] for t in totals if t[2] >= 0]
+    if winners:
+        # The region winners compete exactly as rows do in idxmax
+        values = df['liters_per_capita'].to_numpy()[winners]
+        top_consumer = df.iloc[min(zip(-values, winners))[1]]
+    return {
+        "markets": int(round(sums["markets"])),
+        "avg_price": sums["avg_price_usd"] / sums["priced"] if sums["priced"] else np.nan,
+        "total_production": sums["production_m_hl"],
+        "top_consumer": top_consumer,
+    }
+
+
+def regional_summary(totals, region_dtype=None):
+    """`views.regional_summary` from per-region `totals`; regions without markets are left out."""
+    rows = [(region, sums) for region, sums, _ in totals if sums["markets"]]
+    population = np.array([s["drinking_population_millions"] for _, s in rows])
+    with np.errstate(divide="ignore", invalid="ignore"):
+        weighted = np.array([s["rate_x_population"] for _, s in rows]) / population
+    regions = [r for r, _ in rows]
+    if isinstance(region_dtype, pd.CategoricalDtype):
+        regions = pd.Categorical(regions, dtype=region_dtype)
+    return pd.DataFrame({
+        'region': regions,
+        'total_production_m_hl': [s["production_m_hl"] for _, s in rows],
+        'total_volume_consumed_ml': [s["total_volume_consumed_ml"] for _, s in rows],
+        'total_drinking_population_millions': population,
+        'weighted_per_capita': weighted,
+    })
@@ -0,0 +1,114 @@
+"""Top-k rankings by partial selection.
+
+The dashboard's leaders only ever need the first few rows of a ranking,
+such as the top per capita market or the leading region. Sorting the whole
+column to read its head costs O(n log n). `top_k` instead finds the k-th
+best value with `np.partition` in linear time and sorts only the rows at or
+above it.
+
+Every ranking here orders ties by position and never ranks a missing value
+(unless asked to put them last), so ``top_k(values, 1)`` is pandas'
+``idxmax``. `top_k_by` ranks within the groups of an `aggregate.Groups`;
+`leaders` ranks several columns of a frame in one call.
+"""
+import numpy as np
+
+
+def _keys(values, largest):
+    values = np.asarray(values, dtype=np.float64)
+    return -values if largest else values
+
+
+def top_k(values, k, largest=True, skipna=True):
+    """Positions of the `k` largest values (smallest with `largest` False), best first.
+
+    Ties go to the earlier position. Missing values are never ranked, or,
+    with `skipna` False, ranked after every value in position order.
+    """
+    values = np.asarray(values)
+    if values.dtype.kind != "f":
+        values = values.astype(np.float64)
+    if k == 1 and skipna and len(values):
+        # The leader alone is one reduction (the first of equal values, like idxmax)
+        try:
+            return np.array([np.nanargmax(values) if largest else np.nanargmin(values)], dtype=np.intp)
+        except ValueError:  # every value missing
+            return np.zeros(0, dtype=np.intp)
+    missing = np.isnan(values)
+    valid = len(values) - int(missing.sum())
+    k = max(min(int(k), len(values) if not skipna else valid), 0)
+    if k == 0:
+        return np.zeros(0, dtype=np.intp)
+    if k > valid:
+        # Every value, then the first missing ones
+        return np.concatenate([top_k(values, valid, largest), np.flatnonzero(missing)[:k - valid]])
+
+    keys = _keys(values, largest)
+    if k < valid:
+        # The k-th best key in linear time; rows tied with it are all kept
+        # as candidates so that ties still resolve by position
+        filled = np.where(missing, np.inf, keys)
+        threshold = np.partition(filled, k - 1)[k - 1]
+        candidates = np.flatnonzero(filled <= threshold)
+    else:
+        candidates = np.flatnonzero(~missing)
+    order = np.lexsort((candidates, keys[candidates]))
+    return candidates[order[:k]]
+
+
+def top_k_by(values, groups, k=1, largest=True):
+    """The `k` best rows of each group of `groups` (an `aggregate.Groups`).
+
+    Returns an ``(n_groups, k)`` array of row positions, best first, padded
+    with -1 where a group has fewer than `k` ranked values. Ties and missing
+    values are handled as in `top_k`.
+    """
+    keys = _keys(np.asarray(values)[groups.rows], largest)
+    rows = np.arange(len(np.asarray(values)))[groups.rows]
+    result = np.full((groups.n_groups, max(int(k), 0)), -1, dtype=np.intp)
+    ranked = ~np.isnan(keys)
+    codes, keys, rows = groups.codes[ranked], keys[ranked], rows[ranked]
+    if k <= 0 or not len(codes):
+        return result
+    if np.any(rows[1:] < rows[:-1]):
+        # Entries in row order, so that ties resolve by row in every branch
+        by_row = np.argsort(rows, kind="stable")
+        codes, keys, rows = codes[by_row], keys[by_row], rows[by_row]
+
+    # A stable sort of small integer codes is a radix sort
+    by_group = np.argsort(codes.astype(np.min_scalar_type(groups.n_groups)), kind="stable")
+    starts = np.searchsorted(codes[by_group], np.arange(groups.n_groups + 1))
+    present = np.flatnonzero(starts[1:] > starts[:-1])
+    if k == 1:
+        # Each group's best key is a reduction; its first row among the
+        # rows holding it is a second one
+        sorted_keys = keys[by_group]
+        best = np.minimum.reduceat(sorted_keys, starts[present])
+        holders = sorted_keys == np.repeat(best, np.diff(starts)[present])
+        first = np.where(holders, rows[by_group], np.iinfo(np.intp).max)
+        result[present, 0] = np.minimum.reduceat(first, starts[present])
+    elif len(present) * k < len(codes) // 8:
+        # Few large groups: partial selection within each
+        for g in present.tolist():
+            members = by_group[starts[g]:starts[g + 1]]
+            best = members[top_k(keys[members], k, largest=False)]
+            result[g, :len(best)] = rows[best]
+    else:
+        # Many small groups: one sort by (group, key, row) ranks them all
+        order = np.lexsort((rows, keys, codes))
+        rank = np.arange(len(order)) - starts[codes[order]]
+        kept = order[rank < k]
+        result[codes[kept], rank[rank < k]] = rows[kept]
+    return result
+
+
+def leaders(frame, columns, k=1, label=None):
+    """The `k` best rows of `frame` for each of `columns`, as ``{column: rows}``.
+
+    Rows are positions, or the values of the `label` column.
+    """
+    ranked = {column: top_k(frame[column].to_numpy(), k) for column in columns}
+    if label is None:
+        return ranked
+    labels = frame[label].to_numpy()
+    return {column: labels[rows] for column, rows in ranked.items()}
@@ -0,0 +1,151 @@
+"""Full-text search over consumer review snippets with BM25 ranking.
+
+Ingest splits every review snippet into tokens once and writes:
+
+* `reviews`: one row per snippet (review_id, market_id, text, length)
+* `review_terms`: the vocabulary with document frequencies (term_id, term, df)
+* `review_postings`: (term_id, review_id, tf) sorted by term
+
+`ReviewSearch` memory-maps those tables; a query then touches only the
+postings of its own terms and ranks the matching snippets with Okapi BM25:
+
+    score(d) = Σ idf(t) · tf·(k1 + 1) / (tf + k1·(1 − b + b·|d| / avg|d|))
+    idf(t)   = ln(1 + (N − df + 0.5) / (df + 0.5))
+"""
+import re
+from collections import Counter
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+
+from market import store
+
+TOKEN = re.compile(r"\w+")
+
+
+def tokenize(text):
+    """Lower-cased word tokens of `text` ("65cl", "ice", "cold", ...)."""
+    return TOKEN.findall(text.casefold()) if text else []
+
+
+def build_index(markets):
+    """Review, vocabulary and postings tables for the markets' review snapshots.
+
+    Snippets repeat across markets and years, so only the distinct texts are
+    tokenized; each review then copies its text's postings.
+    """
+    texts = markets["review_snapshot"].combine_chunks()
+    market_ids = markets["market_id"].to_numpy()
+    encoded = pc.dictionary_encode(texts)
+    codes = pc.fill_null(encoded.indices, -1).to_numpy()
+
+    vocabulary = {}
+    text_terms, text_tf, text_lengths, text_sizes = [], [], [], []
+    for text in encoded.dictionary.to_pylist():
+        tokens = tokenize(text)
+        counts = Counter(tokens)
+        text_terms.extend(vocabulary.setdefault(term, len(vocabulary)) for term in counts)
+        text_tf.extend(counts.values())
+        text_lengths.append(len(tokens))
+        text_sizes.append(len(counts))
+    # A null snippet has no tokens: it maps to an extra empty text at the end
+    text_lengths.append(0)
+    text_sizes.append(0)
+    text_terms = np.asarray(text_terms, dtype=np.int32)
+    text_tf = np.asarray(text_tf, dtype=np.int32)
+    text_offsets = np.concatenate([[0], np.cumsum(text_sizes)])
+
+    # Gather every review's slice of the per-text postings
+    sizes = np.asarray(text_sizes)[codes]
+    starts = np.repeat(text_offsets[codes] - np.cumsum(sizes) + sizes, sizes)
+    gather = starts + np.arange(sizes.sum())
+    post_reviews = np.repeat(np.arange(len(codes), dtype=np.int32), sizes)
+
+    reviews = pa.table({
+        "review_id": pa.array(np.arange(len(codes), dtype=np.int32)),
+        "market_id": pa.array(market_ids),
+        "text": texts,
+        "length": pa.array(np.asarray(text_lengths, dtype=np.int32)[codes]),
+    })
+    postings = pa.table({
+        "term_id": pa.array(text_terms[gather]),
+        "review_id": pa.array(post_reviews),
+        "tf": pa.array(text_tf[gather]),
+    }).sort_by([("term_id", "ascending"), ("review_id", "ascending")])
+    doc_freq = np.bincount(postings["term_id"].to_numpy(), minlength=len(vocabulary))
+    terms = pa.table({
+        "term_id": pa.array(np.arange(len(vocabulary), dtype=np.int32)),
+        "term": pa.array(list(vocabulary), pa.string()),
+        "df": pa.array(doc_freq.astype(np.int32)),
+    })
+    return reviews, terms, postings
+
+
+class ReviewSearch:
+    """BM25 ranking over the prebuilt review postings."""
+
+    def __init__(self, reviews, terms, postings, markets, k1=1.2, b=0.75):
+        self.k1, self.b = k1, b
+        self._texts = reviews["text"]
+        self._review_market = reviews["market_id"].to_numpy()
+        lengths = reviews["length"].to_numpy().astype(np.float64)
+        # Per-document part of the BM25 denominator, computed once
+        avg_length = lengths.mean() if len(lengths) else 0.0
+        self._norm = k1 * (1 - b + b * lengths / avg_length) if avg_length else np.full(len(lengths), k1)
+
+        self._term_ids = {term: i for i, term in enumerate(terms["term"].to_pylist())}
+        n_docs = len(lengths)
+        doc_freq = terms["df"].to_numpy()
+        self._idf = np.log1p((n_docs - doc_freq + 0.5) / (doc_freq + 0.5))
+
+        self._post_reviews = postings["review_id"].to_numpy()
+        self._post_tf = postings["tf"].to_numpy().astype(np.float64)
+        self._offsets = np.searchsorted(postings["term_id"].to_numpy(), np.arange(len(self._idf) + 1))
+
+        market_ids = markets["market_id"].to_numpy()
+        self._country_of = np.empty(market_ids.max(initial=-1) + 1, dtype=object)
+        self._country_of[market_ids] = markets["country"].to_numpy(zero_copy_only=False)
+
+    @classmethod
+    def load(cls, store_dir=None):
+        from market import ingest  # ingest imports this module
+
+        ingest.data_version(store_dir)  # builds or refreshes the store if needed
+        return cls(
+            store.read_table("reviews", store_dir),
+            store.read_table("review_terms", store_dir),
+            store.read_table("review_postings", store_dir),
+            store.read_dataset("markets", columns=["market_id", "country"], store_dir=store_dir),
+        )
+
+    def search(self, query, market_ids=None, limit=10):
+        """Top `limit` snippets for `query`, best first.
+
+        `market_ids` restricts the results to those markets (e.g. the rows
+        left by the sidebar filters). Returns a list of dicts with country,
+        text and score.
+        """
+        scores = np.zeros(len(self._review_market))
+        for term in set(tokenize(query)):
+            term_id = self._term_ids.get(term)
+            if term_id is None:
+                continue
+            lo, hi = self._offsets[term_id], self._offsets[term_id + 1]
+            docs, tf = self._post_reviews[lo:hi], self._post_tf[lo:hi]
+            scores[docs] += self._idf[term_id] * tf * (self.k1 + 1) / (tf + self._norm[docs])
+
+        if market_ids is not None:
+            allowed = np.zeros(len(self._country_of), dtype=bool)
+            allowed[np.asarray(market_ids)] = True
+            scores[~allowed[self._review_market]] = 0.0
+
+        hits = np.flatnonzero(scores)
+        if len(hits) > limit:
+            hits = hits[np.argpartition(scores[hits], -limit)[-limit:]]
+        hits = hits[np.argsort(-scores[hits], kind="stable")]
+        texts = self._texts.take(pa.array(hits)).to_pylist()
+        return [
+            {"country": self._country_of[self._review_market[r]], "text": text, "score": float(scores[r])}
+            for r, text in zip(hits.tolist(), texts)
+        ]
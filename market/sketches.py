@@ -0,0 +1,205 @@
+"""Mergeable sketches of each year/region partition, written at ingest.
+
+Distinct brands and channels and price percentiles are not additive, so
+the prefix sums and the cube cannot carry them. Ingest writes one row per
+partition to the ``sketches`` table instead. A selection of regions merges
+its partitions' rows:
+
+* a HyperLogLog per partition of the brands and of the retail channels its
+  markets list. A sketch is `PRECISION` bits of registers (4096 one-byte
+  registers, about 1.6% standard error), and merging is an elementwise max.
+  Names are hashed rather than ids, so the sketches of untouched partitions
+  stay valid when a rebuild renumbers the channels.
+* a log-bucketed histogram of ``avg_price_usd`` (the DDSketch scheme). A
+  price falls in bucket ``ceil(log(price) / log(GAMMA))``, and every price
+  in a bucket is within `RELATIVE_ACCURACY` of the bucket's value, so each
+  quantile read from it is too. Merging adds the counts.
+
+Like the cube, the sketches of the partitions an upsert rewrites are
+rebuilt on their own (`update`).
+"""
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+from market import store
+from market.aggregate import Groups
+
+PRECISION = 12
+REGISTERS = 1 << PRECISION
+RELATIVE_ACCURACY = 0.01
+GAMMA = (1 + RELATIVE_ACCURACY) / (1 - RELATIVE_ACCURACY)
+# Prices at or below this share its bucket
+MIN_PRICE = 1e-6
+LISTINGS = {"brands": ("brands", "brand_listings", "brand_id", "brand"),
+            "channels": ("channels", "channel_listings", "channel_id", "key")}
+
+
+def hashes(values):
+    """Deterministic 64-bit hashes of `values` (names), stable across runs."""
+    return pd.util.hash_array(np.asarray(values, dtype=object))
+
+
+def registers(hashed, codes, n_sketches):
+    """HyperLogLog registers of `hashed` values, one sketch per code."""
+    result = np.zeros((n_sketches, REGISTERS), dtype=np.uint8)
+    index = (hashed >> np.uint64(64 - PRECISION)).astype(np.intp)
+    # Rank of the first set bit of the remaining 52 bits, which a float64
+    # holds exactly: frexp's exponent is their bit length
+    rest = (hashed & np.uint64((1 << (64 - PRECISION)) - 1)).astype(np.float64)
+    rank = (64 - PRECISION) - np.frexp(rest)[1] + 1
+    np.maximum.at(result, (codes, index), rank.astype(np.uint8))
+    return result
+
+
+def distinct(registers):
+    """Estimated distinct values of one merged sketch (registers)."""
+    m = REGISTERS
+    estimate = 0.7213 / (1 + 1.079 / m) * m * m / np.ldexp(1.0, -registers.astype(np.int64)).sum()
+    zeros = int(np.count_nonzero(registers == 0))
+    if estimate <= 2.5 * m and zeros:
+        # Small cardinalities: linear counting over the empty registers
+        estimate = m * np.log(m / zeros)
+    return estimate
+
+
+def price_bucket(prices):
+    """DDSketch bucket of each price."""
+    prices = np.maximum(np.asarray(prices, dtype=np.float64), MIN_PRICE)
+    return np.ceil(np.log(prices) / np.log(GAMMA)).astype(np.int32)
+
+
+def quantiles(buckets, counts, q):
+    """Quantiles `q` of a histogram of price buckets (NaN when empty).
+
+    The q-quantile is the value of rank ``floor(q × (n - 1))``, as
+    ``np.quantile(method="lower")``, within `RELATIVE_ACCURACY`.
+    """
+    q = np.atleast_1d(np.asarray(q, dtype=np.float64))
+    total = counts.sum()
+    if not total:
+        return np.full(len(q), np.nan)
+    order = np.argsort(buckets, kind="stable")
+    cumulative = np.cumsum(counts[order])
+    found = np.searchsorted(cumulative, np.floor(q * (total - 1)), side="right")
+    return 2 * GAMMA ** buckets[order][found] / (GAMMA + 1)
+
+
+def _listing_hashes(store_dir=None):
+    """``{kind: (market ids, name hashes)}`` of every brand and channel listing."""
+    listings = {}
+    for kind, (dimension, bridge, id_column, name_column) in LISTINGS.items():
+        names = store.read_table(dimension, store_dir)
+        bridge = store.read_table(bridge, store_dir)
+        ids = names[id_column].to_numpy()
+        hash_of = np.zeros(ids.max(initial=-1) + 1, dtype=np.uint64)
+        hash_of[ids] = hashes(names[name_column].to_pylist())
+        listings[kind] = (bridge["market_id"].to_numpy(), hash_of[bridge[id_column].to_numpy()])
+    return listings
+
+
+def build(markets, listings):
+    """One sketch row per year/region partition of the Arrow `markets` table.
+
+    `listings` is `_listing_hashes` of the store; only the listings of
+    `markets` are read.
+    """
+    frame = markets.select(["market_id", "year", "region", "avg_price_usd"]).to_pandas()
+    groups = Groups([frame["year"], frame["region"]])
+    market_ids = frame["market_id"].to_numpy()
+    partition_of = np.full(market_ids.max(initial=-1) + 1, -1, dtype=np.intp)
+    partition_of[market_ids] = groups.codes
+
+    columns = {}
+    for kind, (listed_ids, hashed) in listings.items():
+        # Listings of markets outside `markets` (the rest of the store) are skipped
+        inside = listed_ids < len(partition_of)
+        codes = partition_of[listed_ids[inside]]
+        present = codes >= 0
+        sketch = registers(hashed[inside][present], codes[present], len(groups))
+        columns[kind] = pa.array([row.tobytes() for row in sketch], pa.binary())
+
+    # Price histogram per partition: counts of each (partition, bucket)
+    prices = frame["avg_price_usd"].to_numpy(dtype=np.float64)
+    priced = ~np.isnan(prices)
+    cells = Groups([groups.codes[priced], price_bucket(prices[priced])])
+    partition, bucket = cells.labels()
+    counts = cells.count()
+    starts = np.searchsorted(partition, np.arange(len(groups) + 1))
+    columns["price_buckets"] = pa.array([bucket[a:b].tolist() for a, b in zip(starts[:-1], starts[1:])],
+                                        pa.list_(pa.int32()))
+    columns["price_counts"] = pa.array([counts[a:b].tolist() for a, b in zip(starts[:-1], starts[1:])],
+                                       pa.list_(pa.int64()))
+
+    years, regions = groups.labels()
+    return pa.table({
+        "year": pa.array(np.asarray(years), markets.schema.field("year").type),
+        "region": pa.array(np.asarray(regions, dtype=object), markets.schema.field("region").type),
+        "markets": pa.array(groups.count(), pa.int64()),
+        **columns,
+    })
+
+
+def update(sketches, partitions, listings):
+    """`sketches` with the rows of each rewritten partition rebuilt (see `cube.update`)."""
+    # One row per partition, so a Python pass finds the stale ones (Arrow
+    # joins do not carry the list columns)
+    keep = [key not in partitions for key in zip(sketches["year"].to_pylist(), sketches["region"].to_pylist())]
+    kept = sketches.filter(pa.array(keep, pa.bool_()))
+    parts = [part for part in partitions.values() if part.num_rows]
+    if parts:
+        rebuilt = build(pa.concat_tables([p.select(["market_id", "year", "region", "avg_price_usd"]) for p in parts]),
+                        listings)
+        kept = pa.concat_tables([kept, rebuilt.cast(sketches.schema)])
+    return kept.sort_by([("year", "ascending"), ("region", "ascending")])
+
+
+def write(store_dir=None, partitions=None):
+    """Sketch the store's partitions (only `partitions` if given) after its indexes are written."""
+    listings = _listing_hashes(store_dir)
+    if partitions is not None and store.table_path("sketches", store_dir).exists():
+        table = update(store.read_table("sketches", store_dir), partitions, listings)
+    else:
+        table = build(store.read_dataset("markets", store_dir=store_dir), listings)
+    store.write_table("sketches", table, store_dir)
+    return table
+
+
+class Sketches:
+    """Merged sketches of a selection of partitions."""
+
+    def __init__(self, table):
+        self._rows = {}
+        for row in table.to_pylist():
+            self._rows[(row["year"], row["region"])] = (
+                np.frombuffer(row["brands"], dtype=np.uint8),
+                np.frombuffer(row["channels"], dtype=np.uint8),
+                np.asarray(row["price_buckets"], dtype=np.int32),
+                np.asarray(row["price_counts"], dtype=np.int64),
+            )
+
+    @classmethod
+    def load(cls, store_dir=None):
+        from market import ingest  # ingest imports this module
+
+        ingest.data_version(store_dir)  # builds or refreshes the store if needed
+        path = store.table_path("sketches", store_dir)
+        # Stores written before the sketches existed get them on first use
+        return cls(store.read_table("sketches", store_dir) if path.exists() else write(store_dir))
+
+    def summary(self, year, regions=None, q=(0.1, 0.5, 0.9)):
+        """Distinct brands and channels and price quantiles `q` of `year`'s `regions` (None: all).
+
+        Returns ``{"brands", "channels", "price_quantiles"}``; the counts
+        are rounded HyperLogLog estimates.
+        """
+        rows = [sketch for (row_year, region), sketch in self._rows.items()
+                if row_year == year and (regions is None or region in regions)]
+        if not rows:
+            return {"brands": 0, "channels": 0, "price_quantiles": np.full(len(q), np.nan)}
+        brands, channels, buckets, counts = zip(*rows)
+        return {
+            "brands": int(round(distinct(np.maximum.reduce(brands)))),
+            "channels": int(round(distinct(np.maximum.reduce(channels)))),
+            "price_quantiles": quantiles(np.concatenate(buckets), np.concatenate(counts), q),
+        }
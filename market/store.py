@@ -0,0 +1,222 @@
+"""Columnar on-disk store for the market dataset.
+
+Every table lives in uncompressed Arrow IPC files under one store directory.
+Opening a table memory-maps the file, so columns are paged in by the OS on
+demand and shared between processes instead of being rebuilt from Python
+literals on every cold start. Tables are written by `market.ingest`.
+
+Large tables (the country × year panel) are stored as hive-partitioned
+datasets, e.g. ``markets/year=2025/region=East%20Africa/part-0.arrow``. A read
+filtered on partition columns only opens the matching files.
+"""
+import json
+import os
+import shutil
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from urllib.parse import quote
+
+import pyarrow as pa
+import pyarrow.dataset as ds
+from pyarrow import fs
+
+try:
+    import fcntl
+except ImportError:  # Windows: writers are serialised within the process only
+    fcntl = None
+
+ROOT = Path(__file__).resolve().parent.parent
+# Point BEER_STORE_DIR elsewhere to serve a different dataset from the same app
+STORE_DIR = Path(os.environ.get("BEER_STORE_DIR", ROOT / "data" / "store"))
+
+
+# Held by the thread writing a store; reentrant, so a build may call other writers
+_write_lock = threading.RLock()
+_write_depth = 0
+
+
+@contextmanager
+def write_lock(store_dir=None):
+    """Hold the write lock of a store: one writer at a time across threads and processes.
+
+    Temporary files have fixed names, so two sessions refreshing the same
+    store at once would write over each other's. The lock is a ``flock`` on
+    ``.lock`` in the store directory, taken once per thread however deeply
+    writers nest.
+    """
+    global _write_depth
+    with _write_lock:
+        if _write_depth:
+            _write_depth += 1
+            try:
+                yield
+            finally:
+                _write_depth -= 1
+            return
+        path = Path(store_dir or STORE_DIR)
+        path.mkdir(parents=True, exist_ok=True)
+        with open(path / ".lock", "a") as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            _write_depth = 1
+            try:
+                yield
+            finally:
+                _write_depth = 0
+                if fcntl is not None:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def table_path(name, store_dir=None):
+    """Path of the IPC file backing table `name`."""
+    return Path(store_dir or STORE_DIR) / f"{name}.arrow"
+
+
+def write_table(name, table, store_dir=None):
+    """Write `table` to the store, replacing any previous version atomically.
+
+    The file is written next to the target and then renamed over it, so a
+    process that still has the old file memory-mapped keeps reading a
+    consistent snapshot.
+    """
+    path = table_path(name, store_dir)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_suffix(".arrow.tmp")
+    with pa.OSFile(str(tmp_path), "wb") as sink:
+        with pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+    os.replace(tmp_path, path)
+    return path
+
+
+def read_table(name, store_dir=None):
+    """Memory-map table `name` from the store (zero-copy)."""
+    source = pa.memory_map(str(table_path(name, store_dir)), "r")
+    return pa.ipc.open_file(source).read_all()
+
+
+def dataset_path(name, store_dir=None):
+    """Directory backing the partitioned dataset `name`."""
+    return Path(store_dir or STORE_DIR) / name
+
+
+def _swap_in(staging, path):
+    # Move the freshly written directory into place; files of the retired
+    # copy stay readable for processes that still have them memory-mapped
+    retired = path.with_name(f"{path.name}.old")
+    shutil.rmtree(retired, ignore_errors=True)
+    if path.exists():
+        os.replace(path, retired)
+    os.replace(staging, path)
+    shutil.rmtree(retired, ignore_errors=True)
+
+
+def _write_schema(directory, schema):
+    # Zero-row IPC file holding the full schema, including partition column
+    # types; the leading underscore keeps it out of the dataset's data files
+    with pa.OSFile(str(directory / "_schema.arrow"), "wb") as sink:
+        with pa.ipc.new_file(sink, schema):
+            pass
+
+
+def write_dataset(name, table, partition_by, store_dir=None):
+    """Write `table` as a dataset partitioned by the `partition_by` columns.
+
+    The whole dataset is staged in a sibling directory and swapped in at the
+    end, so readers never see a half-written dataset.
+    """
+    path = dataset_path(name, store_dir)
+    staging = path.with_name(f"{name}.tmp")
+    shutil.rmtree(staging, ignore_errors=True)
+    partition_schema = pa.schema([table.schema.field(c) for c in partition_by])
+    ds.write_dataset(
+        table, str(staging), format="ipc",
+        partitioning=ds.partitioning(partition_schema, flavor="hive"),
+        basename_template="part-{i}.arrow",
+    )
+    metadata = {b"partition_by": ",".join(partition_by).encode()}
+    _write_schema(staging, table.schema.with_metadata(metadata))
+    _swap_in(staging, path)
+    return path
+
+
+def _dataset_schema(path):
+    schema = pa.ipc.open_file(pa.memory_map(str(path / "_schema.arrow"), "r")).schema
+    return schema, schema.metadata[b"partition_by"].decode().split(",")
+
+
+def write_partition(name, table, values, store_dir=None):
+    """Replace a single partition of dataset `name`, leaving the others untouched.
+
+    `values` maps each partition column to this partition's value; `table`
+    holds the partition's full new contents (an empty table drops it).
+    """
+    root = dataset_path(name, store_dir)
+    _, partition_by = _dataset_schema(root)
+    path = root
+    for column in partition_by:
+        # Same URI segment encoding write_dataset uses ("East%20Africa")
+        path = path / f"{column}={quote(str(values[column]), safe='')}"
+    table = table.drop_columns(partition_by)
+    if table.num_rows == 0:
+        shutil.rmtree(path, ignore_errors=True)
+        # Drop parent directories left empty (e.g. a year with no regions)
+        for parent in path.parents:
+            if parent == root or not parent.exists() or any(parent.iterdir()):
+                break
+            parent.rmdir()
+        return path
+    path.mkdir(parents=True, exist_ok=True)
+    target = path / "part-0.arrow"
+    tmp_path = path / ".part-0.arrow.tmp"
+    with pa.OSFile(str(tmp_path), "wb") as sink:
+        with pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+    os.replace(tmp_path, target)
+    for stale in path.glob("part-*.arrow"):
+        if stale != target:
+            stale.unlink()
+    return path
+
+
+def open_dataset(name, store_dir=None):
+    """Open the partitioned dataset `name` with memory-mapped files."""
+    path = dataset_path(name, store_dir)
+    schema, partition_by = _dataset_schema(path)
+    return ds.dataset(
+        str(path), schema=schema, format="ipc",
+        partitioning=ds.partitioning(pa.schema([schema.field(c) for c in partition_by]), flavor="hive"),
+        filesystem=fs.LocalFileSystem(use_mmap=True),
+    )
+
+
+def read_dataset(name, filter=None, columns=None, store_dir=None):
+    """Read dataset `name`, opening only the partitions `filter` can match."""
+    return open_dataset(name, store_dir).to_table(filter=filter, columns=columns)
+
+
+def partition_values(name, field, store_dir=None):
+    """Sorted distinct values of partition column `field`, read from paths only."""
+    values = set()
+    for fragment in open_dataset(name, store_dir).get_fragments():
+        keys = ds.get_partition_keys(fragment.partition_expression)
+        if field in keys:
+            values.add(keys[field])
+    return sorted(values)
+
+
+def read_manifest(store_dir=None):
+    """Store-level metadata (data version, row count, update time), or {}."""
+    path = Path(store_dir or STORE_DIR) / "manifest.json"
+    if not path.exists():
+        return {}
+    return json.loads(path.read_text(encoding="utf-8"))
+
+
+def write_manifest(manifest, store_dir=None):
+    """Atomically replace the store manifest."""
+    path = Path(store_dir or STORE_DIR) / "manifest.json"
+    tmp_path = path.with_suffix(".json.tmp")
+    tmp_path.write_text(json.dumps(manifest, indent=2), encoding="utf-8")
+    os.replace(tmp_path, path)
@@ -0,0 +1,158 @@
+"""Seeded synthetic markets for scale testing.
+
+Generates any number of country × year markets in the canonical schema and
+writes them through the regular ingest path, so the result is a complete
+store (partitions, brand bridge, channel and review indexes) that the
+dashboard can serve unchanged:
+
+    python -m market.synth --rows 1000000 --out data/synthetic/1m
+    BEER_STORE_DIR=data/synthetic/1m streamlit run beer.py
+
+The same rows and seed always give the same data. The distributions are
+loosely fitted to the real panel:
+
+* populations are log-normal (a few giants, many small markets),
+* a latent "wealth" factor per country raises both price and per capita
+  consumption, so the two are positively correlated (Seychelles, Botswana)
+  while populous markets drink less per head (Nigeria, Ethiopia),
+* production follows consumption with a log-normal self-sufficiency ratio,
+* every region favours its own brands (Zipf-weighted picks from the brand
+  registry), and channels and review snippets come from small vocabularies.
+
+Countries keep their region and traits across years; population and price
+drift upward year on year.
+"""
+import argparse
+
+import numpy as np
+import pyarrow as pa
+
+from market import brands, ingest, store
+
+REGIONS = ["Central Africa", "East Africa", "Southern Africa", "West Africa"]
+REGION_WEIGHTS = [0.2, 0.3, 0.3, 0.2]
+
+# Syllables for country names ("Kalowa", "Zambora 12", ...)
+NAME_HEADS = ["Ka", "Zam", "Lu", "Mo", "Ta", "Ba", "Nya", "Se", "Ga", "Ki", "Ma", "Ru",
+              "Bo", "Ndo", "Wa", "Ti", "Ke", "Su", "Da", "Mbu"]
+NAME_TAILS = ["lowa", "bora", "nda", "mira", "gana", "tere", "sola", "buru", "kani", "zuri",
+              "dia", "lesi", "mbe", "roko", "tavi", "nyeta"]
+
+CHANNELS = ["Glovo", "Jumia Food", "Uber Eats", "Bolt Food", "Takealot.com", "Checkers Sixty60",
+            "Dial A Drink", "Drinks.ng", "Drinks Vine", "Yourmart", "Distro", "Tupuca",
+            "Liquorama App", "TM Pick n Pay Online", "SPAR Online", "Yango Deli", "Chowdeck"]
+
+REVIEW_OPENERS = ["Loyal to local heritage brands", "Strong national identity brands",
+                  "Premium imports are gaining share", "Price-sensitive drinkers",
+                  "Fresh, tourism-driven taste", "Young urban consumers lead growth",
+                  "Craft beer is an upcoming favourite", "Sorghum beer still dominates rural areas"]
+REVIEW_DETAILS = ["large-format glass bottles (65cl)", "ice cold lagers", "crisp, dry lagers",
+                  "malty stouts", "cans for delivery orders", "returnable bottles",
+                  "light beers at weekend events", "bitter, hoppy pilsners"]
+
+
+def _country_names(n, rng):
+    pool = rng.permutation(np.char.add(np.repeat(NAME_HEADS, len(NAME_TAILS)),
+                                       np.tile(NAME_TAILS, len(NAME_HEADS))))
+    names = pool[np.arange(n) % len(pool)]
+    # Number the repeats once the syllable pool runs out
+    rounds = np.arange(n) // len(pool)
+    numbered = np.char.add(np.char.add(names, " "), rounds.astype(str))
+    return np.where(rounds > 0, numbered, names)
+
+
+def _lists(choices, weights, sizes, rng):
+    """list<string> array; row i holds sizes[i] distinct picks from `choices`.
+
+    Picks without replacement via the Gumbel top-k trick: the k largest of
+    log(weight) + Gumbel noise are a weighted sample of k items.
+    """
+    picks = []
+    # In batches, so the rows × choices key matrix stays small at 10M rows
+    for start in range(0, len(sizes), 100_000):
+        batch = slice(start, start + 100_000)
+        size = sizes[batch]
+        weight = weights[batch] if weights.ndim == 2 else weights
+        keys = np.log(weight) + rng.gumbel(size=(len(size), len(choices)))
+        order = np.argsort(-keys, axis=1)[:, :size.max()]
+        picks.append(order[np.arange(order.shape[1]) < size[:, None]])
+    offsets = np.concatenate([[0], np.cumsum(sizes)]).astype(np.int32)
+    values = pa.array(choices, pa.string()).take(pa.array(np.concatenate(picks)))
+    return pa.ListArray.from_arrays(offsets, values)
+
+
+def generate(rows, seed=0, years=range(2016, 2026)):
+    """Canonical markets table with `rows` synthetic country × year markets."""
+    rng = np.random.default_rng(seed)
+    years = np.asarray(list(years), dtype=np.int16)
+    n_countries = max(1, -(-rows // len(years)))
+
+    # Per-country traits
+    region = rng.choice(len(REGIONS), size=n_countries, p=REGION_WEIGHTS)
+    wealth = rng.normal(size=n_countries)
+    population = np.clip(25.0 * np.exp(1.1 * rng.normal(size=n_countries) - 0.4 * wealth), 0.05, 400.0)
+    adults = np.clip(rng.normal(57, 4, n_countries), 45, 75).round()
+    drinkers = np.clip(rng.normal(37, 8, n_countries) + 4 * wealth, 15, 70).round()
+    price = 1.35 * np.exp(0.3 * wealth + 0.15 * rng.normal(size=n_countries))
+    per_capita = np.clip(20.0 * np.exp(0.7 * wealth + 0.5 * rng.normal(size=n_countries)), 2.0, 200.0)
+    sufficiency = np.exp(rng.normal(np.log(5.0), 0.5, n_countries))
+
+    # Markets: the most recent years first, so small row counts still cover
+    # every country in the latest year
+    country = np.tile(np.arange(n_countries), len(years))[:rows]
+    year = np.repeat(years[::-1], n_countries)[:rows]
+    age = (year - years.min()).astype(np.float64)
+    noise = rng.normal(size=(3, rows))
+
+    population_m = (population[country] * 1.025 ** age).round(1).clip(0.1)
+    liters = (per_capita[country] * np.exp(0.05 * noise[0])).round(1)
+    avg_price = (price[country] * 1.04 ** age * np.exp(0.03 * noise[1])).round(2)
+    volume = liters * population_m * adults[country] / 100 * drinkers[country] / 100
+    production = (volume * sufficiency[country] * np.exp(0.05 * noise[2]) / 100).round(2).clip(0.01)
+
+    # Each region favours a different ordering of the registered brands
+    brand_names = list(brands.read_registry())
+    zipf = 1.0 / np.arange(1, len(brand_names) + 1)
+    region_weights = np.stack([rng.permutation(zipf) for _ in REGIONS])
+    top_brands = _lists(brand_names, region_weights[region[country]],
+                        rng.integers(3, 6, rows), rng)
+    channel_weights = np.ones(len(CHANNELS))
+    digital_channels = _lists(CHANNELS, channel_weights, rng.integers(1, 5, rows), rng)
+
+    # A pool of snippets shared between markets, as real reviews repeat
+    pool = np.char.add(np.char.add(rng.choice(REVIEW_OPENERS, 256), ", preferring "),
+                       rng.choice(REVIEW_DETAILS, 256))
+    reviews = pa.array(pool.astype(object), pa.string()).take(pa.array(rng.integers(0, 256, rows)))
+
+    names = _country_names(n_countries, rng)
+    return pa.table({
+        "country": pa.array(names[country].astype(object), pa.string()),
+        "region": pa.array(np.asarray(REGIONS, dtype=object)[region[country]], pa.string()),
+        "year": pa.array(year, pa.int16()),
+        "population_millions": population_m,
+        "pct_adults_15plus": adults[country],
+        "pct_drinkers": drinkers[country],
+        "liters_per_capita": liters,
+        "production_m_hl": production,
+        "avg_price_usd": avg_price,
+        "top_brands": top_brands,
+        "review_snapshot": reviews,
+        "digital_channels": digital_channels,
+    }, schema=ingest.CANONICAL_SCHEMA)
+
+
+def write(rows, store_dir, seed=0, years=range(2016, 2026)):
+    """Generate `rows` markets and write them as a complete store at `store_dir`."""
+    return ingest.write_store(generate(rows, seed, years), store_dir=store_dir, origin="synthetic")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Write a synthetic market store.")
+    parser.add_argument("--rows", type=int, default=10_000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--years", type=int, default=10, help="number of years, ending 2025")
+    parser.add_argument("--out", help="store directory (default data/synthetic/<rows>)")
+    args = parser.parse_args()
+    out = args.out or store.ROOT / "data" / "synthetic" / str(args.rows)
+    markets = write(args.rows, out, args.seed, range(2026 - args.years, 2026))
+    print(f"Wrote {markets.num_rows} synthetic markets to {out}")
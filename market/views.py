@@ -0,0 +1,406 @@
+"""Computations behind each dashboard view, kept apart from the Streamlit calls.
+
+`beer.py` runs these on every rerun; `benchmarks/bench.py` times the same
+functions stage by stage at growing data sizes.
+"""
+import math
+
+import altair as alt
+import numpy as np
+import pandas as pd
+
+from market import aggregate, fused, memory, prefix, ranking
+from market.indexes import FrameIndex
+
+# Registry metrics the dashboard shows on top of the stored columns
+# (see market/metrics.py); only these are evaluated when a year is loaded.
+VIEW_METRICS = ["self_sufficiency_ratio", "spend_musd"]
+
+
+# Sidebar filters answered from indexes (see market/indexes.py): sorted
+# indexes for the numeric sliders, bitmaps for the categorical selections
+RANGE_COLUMNS = ["avg_price_usd", "production_m_hl"]
+BITMAP_COLUMNS = ["region", "country", "year"]
+# The brand filter matches brands ranked within a market's top 5
+BRAND_MAX_RANK = 5
+
+
+def filter_index(df, brand_index=None):
+    """Range and bitmap indexes over the filter columns of `df`.
+
+    With `brand_index`, a "brand" bitmap (top-5 listings) is added as well.
+    """
+    index = FrameIndex(df, RANGE_COLUMNS, BITMAP_COLUMNS)
+    if brand_index is not None:
+        names, market_ids = brand_index.listings(max_rank=BRAND_MAX_RANK)
+        frame_ids = df['market_id'].to_numpy()
+        row_of = np.full(max(int(market_ids.max(initial=0)), int(frame_ids.max(initial=0))) + 1, -1)
+        row_of[frame_ids] = np.arange(len(frame_ids))
+        rows = row_of[market_ids]
+        index.add_bitmap("brand", names[rows >= 0], rows[rows >= 0])
+    return index
+
+
+def _decimal(value):
+    # The shortest decimal that round-trips, so a float32 1.1 gives the slider
+    # 1.1 rather than 1.100000023841858 (and the same bounds as a float64 store)
+    return float(str(value))
+
+
+def filter_bounds(df):
+    """Sidebar options of `df`: its regions and the price and production ranges."""
+    return {
+        "regions": sorted(df['region'].unique()),
+        "price": (_decimal(df['avg_price_usd'].min()), _decimal(df['avg_price_usd'].max())),
+        "production": (_decimal(df['production_m_hl'].min()), _decimal(df['production_m_hl'].max())),
+    }
+
+
+def select_rows(index, regions, max_price, brands=None, max_production=None):
+    """Rows of the indexed frame passing the filters: None (all), positions or a mask."""
+    return index.select(
+        ranges={"avg_price_usd": (None, max_price), "production_m_hl": (None, max_production)},
+        any_of={"region": regions, "brand": brands or None},
+    )
+
+
+def select_markets(df, index, regions, max_price, brands=None, max_production=None):
+    """Markets in `regions` priced at most `max_price`, producing at most
+    `max_production` and listing any of `brands`, answered from `index`
+    (see `filter_index`).
+
+    The sliders are binary searches, the region and brand selections an OR
+    of their bitmaps, and the conditions are intersected before any row of
+    `df` is touched. `brands` (names) needs an index built with a brand index.
+    """
+    rows = select_rows(index, regions, max_price, brands, max_production)
+    return df if rows is None else df.iloc[rows]
+
+
+def grid_floor(value, step):
+    """The largest multiple of `step` not above `value` (rounded like `snap`)."""
+    return round(math.floor(round(value / step, 9)) * step, 9)
+
+
+def snap(value, low, high, step):
+    """Slider `value` on its `step` grid from `low`, or None at `high` (no cap).
+
+    Float noise in the slider value would otherwise give the same position
+    several cache keys.
+    """
+    if value is None or value >= high:
+        return None
+    return round(low + round((value - low) / step) * step, 9)
+
+
+def filter_state(regions, all_regions, max_price, price_limits, brands=(), max_production=None,
+                 production_limits=None):
+    """Canonical, hashable form of the sidebar filters.
+
+    Regions and brands become sorted tuples (None when the region filter
+    keeps everything); each slider is snapped with `snap`, where
+    ``*_limits`` is its ``(min, max, step)``.
+    """
+    regions = tuple(sorted(set(regions)))
+    return (
+        None if set(regions) >= set(all_regions) else regions,
+        tuple(sorted(set(brands or ()))),
+        snap(max_price, *price_limits),
+        snap(max_production, *production_limits) if production_limits else max_production,
+    )
+
+
+def aggregates(df, year=None, cells=None):
+    """Row-free sources of the KPIs and regional summary of `df`.
+
+    Price prefix sums (market/prefix.py) for region and price filters and,
+    with the `cells` of a `cube.Cube`, the cube for `year` when a
+    production cap is set as well. The fused kernel (market/fused.py)
+    sums any other selection of rows in one pass.
+    """
+    ids = df['market_id'].to_numpy()
+    row_of = np.full(int(ids.max(initial=-1)) + 1, -1)
+    row_of[ids] = np.arange(len(ids))
+    return {"prefix": prefix.PrefixSums(df), "cube": cells, "year": year, "row_of": row_of,
+            "fused": fused.FusedTotals(df)}
+
+
+def summed_totals(aggregates, state):
+    """Per-region totals of `state` from `aggregates` (see `PrefixSums.totals`), or None.
+
+    Region, price and production filters are covered (the production cap
+    and any price bound must then fall on the cube's bucket edges, as slider
+    values do); a brand selection needs the rows.
+    """
+    regions, brands, max_price, max_production = state
+    if aggregates is None or brands:
+        return None
+    if max_production is None:
+        return aggregates["prefix"].totals(max_price, regions)
+    if aggregates["cube"] is not None and aggregates["cube"].answers(max_price, max_production):
+        return aggregates["cube"].totals(aggregates["year"], regions, max_price, max_production,
+                                         aggregates["row_of"])
+    return None
+
+
+def summed_view(df, aggregates, state):
+    """``(kpis, summary)`` of `state` from `aggregates`, or None if they cannot answer it."""
+    totals = summed_totals(aggregates, state)
+    if totals is None:
+        return None
+    summary = prefix.regional_summary(totals, df['region'].dtype)
+    return prefix.kpis(df, totals), summary if not summary.empty else None
+
+
+def fused_view(df, aggregates, rows):
+    """``(kpis, summary)`` of the selected `rows` from one pass of the fused kernel."""
+    totals = aggregates["fused"].totals(rows)
+    summary = prefix.regional_summary(totals, df['region'].dtype)
+    return prefix.kpis(df, totals), summary if not summary.empty else None
+
+
+def market_view(df, index, state, sums=None, maintained=None):
+    """Filtered rows of `df` and everything derived from them, for `state`.
+
+    `state` is a `filter_state` tuple. Returns a dict with the selected
+    ``rows`` (None, positions or a mask, see `FrameIndex.select`), the
+    ``kpis``, and the regional ``summary`` and ``leaders`` (None when no
+    market passes). Cacheable across sessions: it holds no frame slice.
+    With `sums` (see `aggregates`), states they cover take the KPIs and
+    summary from them instead of the filtered rows. Other states update a
+    session's `incremental.MaintainedView`, if given, by the rows that
+    changed since its last state, or else go through the fused kernel.
+    """
+    regions, brands, max_price, max_production = state
+    rows = select_rows(index, regions, max_price, brands, max_production)
+    if rows is not None and rows.dtype == bool and rows.sum() < len(rows) // 8:
+        # Positions of a narrow selection are smaller to keep than its mask
+        rows = np.flatnonzero(rows)
+    summed = summed_view(df, sums, state)
+    if summed is not None:
+        kpi, summary = summed
+    elif maintained is not None:
+        totals = maintained.totals(df, rows, sums["fused"] if sums is not None else None)
+        kpi = prefix.kpis(df, totals)
+        summary = prefix.regional_summary(totals, df['region'].dtype)
+        summary = summary if not summary.empty else None
+    elif sums is not None:
+        kpi, summary = fused_view(df, sums, rows)
+    else:
+        filtered_df = df if rows is None else df.iloc[rows]
+        kpi = kpis(filtered_df)
+        summary = regional_summary(filtered_df) if not filtered_df.empty else None
+    return {
+        "rows": rows,
+        "kpis": kpi,
+        "summary": summary,
+        "leaders": regional_leaders(summary) if summary is not None else None,
+    }
+
+
+def kpis(filtered_df):
+    """Values of the four KPI cards."""
+    prices = memory.as_float64(filtered_df['avg_price_usd'])
+    prices = prices[~np.isnan(prices)]
+    return {
+        "markets": len(filtered_df),
+        "avg_price": prices.mean() if len(prices) else np.nan,
+        "total_production": np.nansum(memory.as_float64(filtered_df['production_m_hl'])),
+        "top_consumer": top_consumer(filtered_df),
+    }
+
+
+def top_consumer(filtered_df):
+    """Row of the highest per capita market (the first on ties), or None."""
+    top = ranking.top_k(filtered_df['liters_per_capita'].to_numpy(), 1)
+    return filtered_df.iloc[top[0]] if len(top) else None
+
+
+PRICE_QUANTILES = (0.1, 0.5, 0.9)
+# Selections of fewer markets are counted exactly (about 10 ms at this size)
+SKETCH_MIN_ROWS = 100_000
+
+
+def distribution(year, state, filtered_df, sketch_set, brand_index, channel_index):
+    """Price p10/median/p90 and distinct brands and channels of the selection.
+
+    A state that only selects regions, at least `SKETCH_MIN_ROWS` markets
+    of them, merges those partitions' sketches (`sketches.Sketches`), with
+    ``approximate`` True. Smaller selections, and any other filter (which
+    splits partitions), are computed exactly from `filtered_df` and the
+    brand and channel indexes.
+    """
+    regions, brands, max_price, max_production = state
+    region_only = not brands and max_price is None and max_production is None
+    if region_only and len(filtered_df) >= SKETCH_MIN_ROWS:
+        return {**sketch_set.summary(year, regions, PRICE_QUANTILES), "approximate": True}
+    market_ids = filtered_df['market_id'].to_numpy()
+    prices = filtered_df['avg_price_usd'].dropna().to_numpy(dtype=np.float64)
+    return {
+        "brands": brand_index.distinct(market_ids),
+        "channels": channel_index.distinct(market_ids),
+        "price_quantiles": (np.quantile(prices, PRICE_QUANTILES, method="lower") if len(prices)
+                            else np.full(len(PRICE_QUANTILES), np.nan)),
+        "approximate": False,
+    }
+
+
+def regional_summary(filtered_df):
+    """Production, volume, drinking population and weighted per capita by region."""
+    # Regions the filters removed get no row (categorical region: observed only)
+    groups = aggregate.Groups(filtered_df['region'])
+    population = memory.as_float64(filtered_df['drinking_population_millions'])
+    production, volume, total_population, rate_x_population = groups.sum(
+        memory.as_float64(filtered_df['production_m_hl']),
+        memory.as_float64(filtered_df['total_volume_consumed_ml']),
+        population,
+        memory.as_float64(filtered_df['liters_per_capita']) * population,
+    )
+    # Weighted per capita = Σ(rate × drinking_pop) / Σ(drinking_pop)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        weighted = rate_x_population / total_population
+    return groups.frame(
+        total_production_m_hl=production,
+        total_volume_consumed_ml=volume,
+        total_drinking_population_millions=total_population,
+        weighted_per_capita=weighted,
+    )
+
+
+REGIONAL_COLUMNS = ('total_production_m_hl', 'total_volume_consumed_ml', 'weighted_per_capita')
+
+
+def regional_leaders(summary):
+    """Region leading each regional summary column (None if it has no value)."""
+    leaders = ranking.leaders(summary, REGIONAL_COLUMNS, label='region')
+    return {column: regions[0] if len(regions) else None for column, regions in leaders.items()}
+
+
+def regional_ranking(summary, column):
+    """``(region, value)`` pairs of the regional `summary`, best `column` first."""
+    order = ranking.top_k(summary[column].to_numpy(), len(summary), skipna=False)
+    return list(zip(summary['region'].to_numpy()[order], summary[column].to_numpy()[order]))
+
+
+# The scatter draws one circle and label per market up to SCATTER_MAX_POINTS.
+# Larger selections are binned on the server into a SCATTER_BINS ×
+# SCATTER_BINS density grid, and only the SCATTER_OUTLIERS most extreme
+# markets on each axis keep a circle, label and tooltip. The chart's data
+# then has at most SCATTER_BINS² bins and 2 × SCATTER_OUTLIERS markets,
+# whatever the number of rows.
+SCATTER_MAX_POINTS = 2000
+SCATTER_BINS = 60
+SCATTER_OUTLIERS = 15
+SCATTER_AXES = ('production_m_hl', 'liters_per_capita')
+# Columns the circles' encodings and tooltips read (the only ones sent)
+SCATTER_COLUMNS = ['country', 'region', 'liters_per_capita', 'drinking_population_millions',
+                   'total_volume_consumed_ml', 'production_m_hl', 'self_sufficiency_ratio', 'avg_price_usd']
+SCATTER_TITLE = "African Beer Market: Per Capita Rates vs. Production Volume"
+
+
+def _scatter_axes(x='production_m_hl', y='liters_per_capita'):
+    """The scatter's axes, reading the `x` and `y` fields."""
+    return (
+        alt.X(f'{x}:Q', title='Production (Million hl)', scale=alt.Scale(zero=False)),
+        alt.Y(f'{y}:Q', title='Per Capita Consumption (Liters)'),
+    )
+
+
+def _market_points(markets):
+    """Circles coloured by region with country labels and tooltips, one per market."""
+    x, y = _scatter_axes()
+    points = alt.Chart(markets).mark_circle(size=200).encode(
+        x=x,
+        y=y,
+        color=alt.Color('region:N', legend=alt.Legend(title="Region")),
+        tooltip=[
+            alt.Tooltip('country:N', title='Country'),
+            alt.Tooltip('region:N', title='Region'),
+            alt.Tooltip('liters_per_capita:Q', title='Per Capita', format='.1f'),
+            alt.Tooltip('drinking_population_millions:Q', title='Drinking Pop (M)', format='.2f'),
+            alt.Tooltip('total_volume_consumed_ml:Q', title='Total Volume (M L)', format='.1f'),
+            alt.Tooltip('production_m_hl:Q', title='Production (M hl)', format='.2f'),
+            alt.Tooltip('self_sufficiency_ratio:Q', title='Self-Sufficiency', format='.2f'),
+            alt.Tooltip('avg_price_usd:Q', title='Avg Price', format='$.2f')
+        ]
+    ).interactive()
+    labels = points.mark_text(
+        align='left',
+        baseline='middle',
+        dx=10
+    ).encode(
+        text='country:N'
+    )
+    return points + labels
+
+
+def density_bins(filtered_df, bins=SCATTER_BINS):
+    """Markets per cell of a `bins` × `bins` grid over the scatter's axes.
+
+    One row per occupied cell, with its edges on both axes and its
+    ``markets`` count. Markets missing either value are left out.
+    """
+    x_column, y_column = SCATTER_AXES
+    x = filtered_df[x_column].to_numpy(dtype=np.float64)
+    y = filtered_df[y_column].to_numpy(dtype=np.float64)
+    keep = np.isfinite(x) & np.isfinite(y)
+    x, y = x[keep], y[keep]
+    if not len(x):
+        return pd.DataFrame(columns=['x_start', 'x_end', 'y_start', 'y_end', 'markets'])
+
+    edges = []
+    cells = []
+    for values in (x, y):
+        low, high = values.min(), values.max()
+        width = (high - low) / bins or 1.0
+        # The maximum falls in the last cell rather than past it
+        cells.append(np.minimum(((values - low) / width).astype(np.intp), bins - 1))
+        edges.append(low + width * np.arange(bins + 1))
+    counts = np.bincount(cells[0] * bins + cells[1], minlength=bins * bins)
+    occupied = np.flatnonzero(counts)
+    ix, iy = np.divmod(occupied, bins)
+    return pd.DataFrame({
+        'x_start': edges[0][ix], 'x_end': edges[0][ix + 1],
+        'y_start': edges[1][iy], 'y_end': edges[1][iy + 1],
+        'markets': counts[occupied],
+    })
+
+
+def scatter_outliers(filtered_df, k=SCATTER_OUTLIERS):
+    """The markets with the `k` largest values on either scatter axis, in row order."""
+    leaders = ranking.leaders(filtered_df, SCATTER_AXES, k)
+    rows = np.unique(np.concatenate(list(leaders.values())))
+    return filtered_df.iloc[rows]
+
+
+def scatter_chart(filtered_df, max_points=SCATTER_MAX_POINTS):
+    """Consumption vs. production scatter with country labels.
+
+    Above `max_points` markets it becomes a density chart (`density_bins`)
+    with the `scatter_outliers` drawn, labelled and tooltipped on top.
+    """
+    if len(filtered_df) <= max_points:
+        return _market_points(filtered_df[SCATTER_COLUMNS]).properties(height=500, title=SCATTER_TITLE)
+
+    x, y = _scatter_axes('x_start', 'y_start')
+    density = alt.Chart(density_bins(filtered_df)).mark_rect().encode(
+        x=x,
+        x2='x_end:Q',
+        y=y,
+        y2='y_end:Q',
+        color=alt.Color('markets:Q', scale=alt.Scale(type='log', scheme='oranges'),
+                        legend=alt.Legend(title="Markets")),
+        tooltip=[
+            alt.Tooltip('markets:Q', title='Markets', format=','),
+            alt.Tooltip('x_start:Q', title='Production from (M hl)', format='.2f'),
+            alt.Tooltip('y_start:Q', title='Per Capita from', format='.1f'),
+        ]
+    )
+    outliers = _market_points(scatter_outliers(filtered_df)[SCATTER_COLUMNS])
+    return (density + outliers).resolve_scale(color='independent').properties(
+        height=500,
+        title=alt.TitleParams(
+            SCATTER_TITLE,
+            subtitle=f"{len(filtered_df):,} markets binned by density; the most extreme on each axis are labelled",
+        ),
+    )
@@ -0,0 +1,29 @@
+import sys
+from pathlib import Path
+
+import numpy as np
+import pyarrow as pa
+import pytest
+
+# The market package is imported from the checkout, as beer.py and bench.py do
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from market import ingest, synth  # noqa: E402
+
+
+def synthetic_markets(rows, seed=0, years=(2024, 2025)):
+    """Synthetic canonical markets whose per capita rates are whole litres capped at 40,
+    so most selections have several top consumers."""
+    markets = synth.generate(rows, seed, years)
+    liters = np.minimum(np.round(markets["liters_per_capita"].to_numpy()), 40.0)
+    return markets.set_column(markets.schema.get_field_index("liters_per_capita"), "liters_per_capita",
+                              pa.array(liters))
+
+
+@pytest.fixture(scope="session")
+def synthetic_store(tmp_path_factory):
+    """A complete two-year synthetic store, shared by the read-only tests."""
+    store_dir = tmp_path_factory.mktemp("store")
+    ingest.write_store(synthetic_markets(2000, seed=1), store_dir=store_dir, origin="synthetic")
+    return store_dir
@@ -0,0 +1,68 @@
+"""Cube totals at the sidebar's slider positions against a scan of the markets."""
+import numpy as np
+
+from market import cube, ingest, views
+from market.engine import open_engine
+from market.prefix import MEASURES
+
+
+def test_bucket_upper_edges_are_inclusive():
+    assert cube.bucket([0.0, 0.3, 0.30000001, 1.1, 1.15, np.nan]).tolist() == [0, 3, 4, 11, 12, cube.NAN_BUCKET]
+    assert cube.bucket_of_bound(1.3) == 13
+    assert cube.bucket_of_bound(1.25) is None
+
+
+def slider_edges(values, step=cube.STEP, n=40, seed=0):
+    """Slider positions over `values`: the slider minimum, the edges of a
+    sample of the values (values on an edge included) and the top edge."""
+    rng = np.random.default_rng(seed)
+    values = values[~np.isnan(values)]
+    sampled = rng.choice(values, min(n, len(values)), replace=False)
+    positions = {views.grid_floor(values.min(), step), *cube.edge(cube.bucket(sampled, step), step).tolist(),
+                 cube.edge(cube.bucket([values.max()], step)[0], step)}
+    return sorted(float(p) for p in positions)
+
+
+def scan_totals(frame, regions, max_price, max_production):
+    """``{region: (measure sums, first top per capita row)}`` by scanning the full precision `frame`."""
+    keep = np.ones(len(frame), dtype=bool)
+    if regions is not None:
+        keep &= frame['region'].isin(regions).to_numpy()
+    keep &= (frame['avg_price_usd'] <= max_price).to_numpy()
+    keep &= (frame['production_m_hl'] <= max_production).to_numpy()
+    measures = {name: np.asarray(f(frame), dtype=np.float64) for name, f in MEASURES.items()}
+    rates = frame['liters_per_capita'].to_numpy()
+    totals = {}
+    for region in frame['region'][keep].unique():
+        rows = np.flatnonzero(keep & (frame['region'] == region).to_numpy())
+        sums = {name: values[rows].sum() for name, values in measures.items()}
+        totals[region] = (sums, rows[np.argmax(rates[rows])])
+    return totals
+
+
+def test_cube_totals_exact_at_slider_edges(synthetic_store):
+    pandas_engine = open_engine("pandas", synthetic_store)
+    cells = cube.Cube.load(synthetic_store)
+    for year in pandas_engine.years():
+        # The engine's compact frame holds the rows the cube's best rows refer to
+        row_of = views.aggregates(pandas_engine.frame(year))["row_of"]
+        frame = ingest.load_frame(years=[year], compact=False, store_dir=synthetic_store)
+        prices = slider_edges(frame['avg_price_usd'].to_numpy(), seed=year)
+        productions = slider_edges(frame['production_m_hl'].to_numpy(), seed=year + 1)
+        # Markets priced exactly on an edge, which the cube must count below it
+        assert np.isin(frame['avg_price_usd'], prices).any()
+
+        for regions in (None, ("East Africa", "West Africa")):
+            for max_price in prices:
+                for max_production in productions[::4]:
+                    assert cells.answers(max_price, max_production)
+                    got = cells.totals(year, regions, max_price, max_production, row_of)
+                    got = {region: (sums, best) for region, sums, best in got if sums["markets"]}
+                    expected = scan_totals(frame, regions, max_price, max_production)
+                    state = (regions, max_price, max_production)
+                    assert got.keys() == expected.keys(), state
+                    for region, (sums, best) in expected.items():
+                        assert got[region][0]["markets"] == sums["markets"], state
+                        np.testing.assert_allclose([got[region][0][m] for m in MEASURES],
+                                                   [sums[m] for m in MEASURES], rtol=1e-12, err_msg=str(state))
+                        assert got[region][1] == best, state
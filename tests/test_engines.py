@@ -0,0 +1,171 @@
+"""The query engines against a plain pandas scan of the stored markets."""
+import numpy as np
+import pytest
+
+from market import incremental, ingest, views
+from market.engine import open_engine
+
+ENGINES = ["pandas", "duckdb", "polars"]
+OTHER_ENGINES = ["duckdb", "polars"]
+STEP = 0.1
+# Engines sum in float64 in their own order, so totals agree to rounding
+RTOL = 1e-9
+
+
+def other_engine(name, store_dir=None):
+    pytest.importorskip(name)
+    return open_engine(name, store_dir)
+
+
+def engine(name, store_dir=None):
+    return open_engine(name, store_dir) if name == "pandas" else other_engine(name, store_dir)
+
+
+def random_states(bounds, brand_names, rng, n):
+    """`n` canonical sidebar states of a year, as `beer.py` builds them.
+
+    Regions are all, some or none; brands none or a few; each slider sits
+    anywhere on its grid, from its minimum (often below every market) to
+    its maximum (no cap).
+    """
+    all_regions = bounds["regions"]
+    limits = {}
+    for name in ("price", "production"):
+        low, high = bounds[name]
+        limits[name] = (views.grid_floor(low, STEP), high, STEP)
+    states = []
+    for _ in range(n):
+        regions = [r for r in all_regions if rng.random() < 0.5] if rng.random() < 0.6 else all_regions
+        brands = rng.choice(brand_names, rng.integers(1, 3), replace=False).tolist() if rng.random() < 0.3 else ()
+        sliders = {}
+        for name, (low, high, step) in limits.items():
+            # The low end of the grid half the time, so narrow selections come up
+            top = high if rng.random() < 0.5 else low + (high - low) / 8
+            sliders[name] = high if rng.random() < 0.3 else low + step * rng.integers(0, int((top - low) / step) + 1)
+        states.append(views.filter_state(regions, all_regions, sliders["price"], limits["price"], brands=brands,
+                                         max_production=sliders["production"],
+                                         production_limits=limits["production"]))
+    return states
+
+
+def reference(frame, state):
+    """``(kpis, summary)`` of `state` over the full precision `frame`, by scanning it."""
+    regions, brands, max_price, max_production = state
+    keep = np.ones(len(frame), dtype=bool)
+    if regions is not None:
+        keep &= frame['region'].isin(regions).to_numpy()
+    if brands:
+        keep &= np.array([bool(set(listed[:views.BRAND_MAX_RANK]) & set(brands)) for listed in frame['top_brands']])
+    for column, bound in (('avg_price_usd', max_price), ('production_m_hl', max_production)):
+        if bound is not None:
+            keep &= (frame[column] <= bound).to_numpy()
+    selected = frame[keep]
+
+    rates = selected['liters_per_capita']
+    kpis = {
+        "markets": len(selected),
+        "avg_price": selected['avg_price_usd'].mean(),
+        "total_production": selected['production_m_hl'].sum(),
+        "top_consumer": None if rates.isna().all() else selected.loc[rates.idxmax()],
+    }
+    summary = selected.assign(
+        rate_x_population=rates * selected['drinking_population_millions'],
+    ).groupby('region', sort=True).agg(
+        total_production_m_hl=('production_m_hl', 'sum'),
+        total_volume_consumed_ml=('total_volume_consumed_ml', 'sum'),
+        total_drinking_population_millions=('drinking_population_millions', 'sum'),
+        rate_x_population=('rate_x_population', 'sum'),
+    ).reset_index()
+    summary['weighted_per_capita'] = summary.pop('rate_x_population') / summary['total_drinking_population_millions']
+    return kpis, summary
+
+
+def assert_matches(kpis, summary, expected, state):
+    expected_kpis, expected_summary = expected
+    assert kpis["markets"] == expected_kpis["markets"], state
+    np.testing.assert_allclose(kpis["avg_price"], expected_kpis["avg_price"], rtol=RTOL, err_msg=str(state))
+    np.testing.assert_allclose(kpis["total_production"], expected_kpis["total_production"], rtol=RTOL,
+                               err_msg=str(state))
+    top, expected_top = kpis["top_consumer"], expected_kpis["top_consumer"]
+    if expected_top is None:
+        assert top is None, state
+    else:
+        # Ties go to the first stored row, whichever engine answers
+        assert (top["country"], top["year"]) == (expected_top["country"], expected_top["year"]), state
+
+    if expected_summary.empty:
+        assert summary is None, state
+        return
+    summary = summary.assign(region=summary['region'].astype(str)).sort_values('region', ignore_index=True)
+    assert summary['region'].tolist() == expected_summary['region'].tolist(), state
+    for column in expected_summary.columns.drop('region'):
+        np.testing.assert_allclose(summary[column].to_numpy(dtype=np.float64),
+                                   expected_summary[column].to_numpy(dtype=np.float64),
+                                   rtol=RTOL, err_msg=f"{column} {state}")
+
+
+def year_cases(store_dir, seed, n=40):
+    """``(year, full precision frame, random states)`` of every stored year."""
+    rng = np.random.default_rng(seed)
+    pandas_engine = open_engine("pandas", store_dir)
+    for year in pandas_engine.years():
+        frame = ingest.load_frame(years=[year], compact=False, store_dir=store_dir)
+        brand_names = sorted({b for listed in frame['top_brands'] for b in listed})
+        yield year, frame, random_states(pandas_engine.bounds(year), brand_names, rng, n)
+
+
+@pytest.mark.parametrize("name", ENGINES)
+def test_engine_matches_scan(name, synthetic_store):
+    query_engine = engine(name, synthetic_store)
+    for year, frame, states in year_cases(synthetic_store, seed=7):
+        for state in states:
+            summary, _ = query_engine.regional(year, state)
+            assert_matches(query_engine.kpis(year, state), summary, reference(frame, state), state)
+
+
+@pytest.mark.parametrize("maintained", [False, True], ids=["fused", "maintained"])
+def test_pandas_view_matches_scan(maintained, synthetic_store):
+    # The cached view beer.py renders, with and without a session's
+    # maintained totals (updated by delta from one state to the next)
+    query_engine = open_engine("pandas", synthetic_store)
+    for year, frame, states in year_cases(synthetic_store, seed=11):
+        session = incremental.MaintainedView() if maintained else None
+        for state in states:
+            view = query_engine.view(year, state, session)
+            assert_matches(view["kpis"], view["summary"], reference(frame, state), state)
+            rows = query_engine.frame_of(year, view)
+            assert len(rows) == view["kpis"]["markets"], state
+
+
+@pytest.mark.parametrize("name", OTHER_ENGINES)
+def test_bounds_match_pandas(name, synthetic_store):
+    query_engine = other_engine(name, synthetic_store)
+    pandas_engine = open_engine("pandas", synthetic_store)
+    assert query_engine.years() == pandas_engine.years()
+    for year in pandas_engine.years():
+        assert query_engine.bounds(year) == pandas_engine.bounds(year)
+
+
+@pytest.mark.parametrize("name", ENGINES)
+def test_empty_selection_has_no_top_consumer(name, synthetic_store):
+    query_engine = engine(name, synthetic_store)
+    year = query_engine.years()[-1]
+    below = round(views.grid_floor(query_engine.bounds(year)["price"][0], STEP) - STEP, 9)
+    # No region selected, and a price cap below every market
+    for state in [((), (), None, None), (None, (), below, None)]:
+        kpis = query_engine.kpis(year, state)
+        assert kpis["markets"] == 0 and kpis["top_consumer"] is None, state
+        assert np.isnan(kpis["avg_price"]) and kpis["total_production"] == 0, state
+        assert query_engine.regional(year, state) == (None, None), state
+
+
+@pytest.mark.parametrize("name", OTHER_ENGINES)
+def test_top_consumer_tie_goes_to_first_row(name):
+    # Kenya and Tanzania both drink 8.0 L/capita; Tanzania comes first in the
+    # store, so idxmax (and every engine) reports it
+    state = (("East Africa",), ("Serengeti", "White Cap"), None, None)
+    expected = open_engine("pandas").kpis(2025, state)
+    assert expected["top_consumer"]["country"] == "Tanzania"
+    got = other_engine(name).kpis(2025, state)
+    assert got["top_consumer"]["country"] == expected["top_consumer"]["country"]
+    assert got["markets"] == expected["markets"]
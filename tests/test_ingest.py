@@ -0,0 +1,169 @@
+"""Incremental upserts and refreshes against a full rebuild of the same markets."""
+import csv
+import shutil
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+import pytest
+
+from conftest import synthetic_markets
+from market import ingest, store
+from market.cube import MEASURES
+
+
+def market_keys(store_dir):
+    """``{market_id: (country, year)}`` of the store."""
+    markets = store.read_dataset("markets", columns=["market_id", "country", "year"], store_dir=store_dir)
+    return dict(zip(markets["market_id"].to_pylist(), zip(markets["country"].to_pylist(),
+                                                          markets["year"].to_pylist())))
+
+
+def contents(store_dir):
+    """Everything a store holds, keyed by (country, year) instead of its market ids."""
+    key = market_keys(store_dir)
+    markets = store.read_dataset("markets", store_dir=store_dir)
+    by_key = sorted(markets.drop_columns(["market_id"]).to_pylist(), key=lambda row: (row["country"], row["year"]))
+
+    cells = store.read_table("cube", store_dir).to_pylist()
+    for cell in cells:
+        cell["top_market_id"] = key.get(cell["top_market_id"])
+    cells.sort(key=lambda cell: (cell["year"], cell["region"], cell["price_bucket"], cell["production_bucket"]))
+
+    brand_names = dict(zip(*store.read_table("brands", store_dir).to_pydict().values()))
+    brand_listings = {(brand_names[row["brand_id"]], key[row["market_id"]], row["rank"])
+                      for row in store.read_table("brand_listings", store_dir).to_pylist()}
+    channels = store.read_table("channels", store_dir).to_pydict()
+    channel_of = dict(zip(channels["channel_id"], zip(channels["channel"], channels["key"])))
+    channel_listings = {(channel_of[row["channel_id"]], key[row["market_id"]])
+                        for row in store.read_table("channel_listings", store_dir).to_pylist()}
+
+    reviews = store.read_table("reviews", store_dir).to_pydict()
+    review_of = dict(zip(reviews["review_id"], (key[m] for m in reviews["market_id"])))
+    terms = store.read_table("review_terms", store_dir).to_pydict()
+    term_of = dict(zip(terms["term_id"], terms["term"]))
+    return {
+        "markets": by_key,
+        "cube": cells,
+        "sketches": store.read_table("sketches", store_dir).sort_by([("year", "ascending"),
+                                                                     ("region", "ascending")]).to_pylist(),
+        "brand_listings": brand_listings,
+        "channel_listings": channel_listings,
+        "reviews": sorted(zip(review_of.values(), reviews["text"], reviews["length"])),
+        "review_terms": dict(zip(terms["term"], terms["df"])),
+        "review_postings": sorted((term_of[t], review_of[r], tf) for t, r, tf in zip(
+            *store.read_table("review_postings", store_dir).to_pydict().values())),
+        "rows": store.read_manifest(store_dir)["rows"],
+    }
+
+
+def assert_same_store(got, expected):
+    got, expected = contents(got), contents(expected)
+    assert got.keys() == expected.keys()
+    for name in expected:
+        if name == "cube":
+            # Cube cells are summed partition by partition, possibly in another order
+            assert [{m: c[m] for m in c if m not in MEASURES} for c in got[name]] == \
+                   [{m: c[m] for m in c if m not in MEASURES} for c in expected[name]]
+            for measure in MEASURES:
+                np.testing.assert_allclose([c[measure] for c in got[name]], [c[measure] for c in expected[name]],
+                                           rtol=1e-12, err_msg=measure)
+        else:
+            assert got[name] == expected[name], name
+
+
+def rebuild(store_dir, out):
+    """A full rebuild of the markets of `store_dir` at `out`, in the same partition row order.
+
+    The order decides which of tied markets is a cube cell's top one, so the
+    rebuild must see the rows as the incremental path left them.
+    """
+    markets = store.read_dataset("markets", store_dir=store_dir).select(ingest.CANONICAL_SCHEMA.names)
+    ingest.write_store(markets, store.read_table("conflicts", store_dir), out,
+                       origin=store.read_manifest(store_dir)["origin"])
+    return out
+
+
+def edited(markets, rng):
+    """`markets` with some prices, rates, brand lists, channels and regions changed."""
+    frame = markets.to_pandas()
+    n = len(frame)
+    changed = rng.choice(n, n // 10, replace=False)
+    frame.loc[changed, "avg_price_usd"] = (frame.loc[changed, "avg_price_usd"] * 1.1).round(2)
+    frame.loc[changed[::2], "liters_per_capita"] = 40.0
+    frame.loc[changed[::3], "top_brands"] = frame.loc[changed[::3], "top_brands"].map(lambda b: list(b[::-1]))
+    frame.loc[changed[::4], "digital_channels"] = frame.loc[changed[::4], "digital_channels"].map(
+        lambda c: list(c[1:]) or ["Glovo"])
+    # A few markets move to another region partition
+    moved = changed[::5]
+    frame.loc[moved, "region"] = frame.loc[moved, "region"].map(
+        {"Central Africa": "East Africa", "East Africa": "West Africa", "Southern Africa": "Central Africa",
+         "West Africa": "Southern Africa"})
+    return pa.Table.from_pandas(frame, schema=ingest.CANONICAL_SCHEMA, preserve_index=False), len(changed)
+
+
+@pytest.mark.parametrize("prune", [False, True], ids=["upsert", "prune"])
+def test_incremental_apply_matches_rebuild(prune, tmp_path):
+    rng = np.random.default_rng(5)
+    base = synthetic_markets(600, seed=2)
+    ingest.write_store(base, store_dir=tmp_path / "incremental", origin="synthetic")
+
+    incoming, n_changed = edited(base, rng)
+    # New countries, and (when pruning) some stored markets left out
+    new = synthetic_markets(60, seed=3)
+    new = new.set_column(0, "country", pc.binary_join_element_wise("New", new["country"], " "))
+    kept = np.ones(incoming.num_rows, dtype=bool)
+    kept[rng.choice(incoming.num_rows, 30, replace=False)] = False
+    incoming = pa.concat_tables([incoming.filter(pa.array(kept)), new])
+
+    counts = ingest._apply(incoming, tmp_path / "incremental", delete_missing=prune)
+    assert counts["inserted"] == new.num_rows
+    assert counts["deleted"] == (30 if prune else 0)
+    assert 0 < counts["updated"] <= n_changed
+
+    # The stored markets are the expected ones...
+    expected = incoming if prune else pa.concat_tables([incoming, base.filter(pa.array(~kept))])
+    stored = store.read_dataset("markets", store_dir=tmp_path / "incremental")
+    canonical = ingest.CANONICAL_SCHEMA.names
+    order = [("country", "ascending"), ("year", "ascending")]
+    assert stored.select(canonical).sort_by(order).to_pylist() == expected.select(canonical).sort_by(order).to_pylist()
+    # ...and every derived table matches a full rebuild of them
+    assert_same_store(tmp_path / "incremental", rebuild(tmp_path / "incremental", tmp_path / "rebuilt"))
+
+
+def edit_source(path, country, changes=None, drop=False, append=None):
+    """Rewrite the CSV source at `path`, changing or dropping `country`'s row."""
+    with open(path, newline="", encoding="utf-8") as f:
+        rows = list(csv.DictReader(f))
+    fields = list(rows[0])
+    key = "country" if "country" in fields else "Country"
+    rows = [row | (changes or {}) if row[key] == country else row for row in rows if not (drop and row[key] == country)]
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.DictWriter(f, fields)
+        writer.writeheader()
+        writer.writerows(rows + ([append] if append else []))
+
+
+@pytest.mark.parametrize("prune", [False, True], ids=["refresh", "prune"])
+def test_refresh_matches_build(prune, tmp_path):
+    sources = [shutil.copy(path, tmp_path) for path in ingest.SOURCES]
+    ingest.build(sources, tmp_path / "refreshed")
+
+    dashboard = sources[0]
+    edit_source(dashboard, "Botswana", {"avg_price_usd": "2.1", "top_brands": "Heineken, St Louis Lager"})
+    edit_source(dashboard, "Kenya", {"liters_per_capita": "9.5", "digital_channels": "Glovo, Jumia Food"})
+    with open(dashboard, newline="", encoding="utf-8") as f:
+        template = next(csv.DictReader(f))
+    edit_source(dashboard, "Botswana", append=template | {"country": "Atlantis", "region": "West Africa"})
+    for path in sources:
+        edit_source(path, "Namibia", drop=True)
+    ingest.refresh(sources, tmp_path / "refreshed", prune=prune)
+
+    built, conflicts = ingest.build(sources, tmp_path / "built")
+    stored = market_keys(tmp_path / "refreshed").values()
+    assert ("Atlantis", 2025) in stored
+    assert (("Namibia", 2025) in stored) != prune
+    if prune:
+        assert contents(tmp_path / "refreshed")["markets"] == contents(tmp_path / "built")["markets"]
+        assert store.read_table("conflicts", tmp_path / "refreshed").equals(conflicts)
+    assert_same_store(tmp_path / "refreshed", rebuild(tmp_path / "refreshed", tmp_path / "rebuilt"))